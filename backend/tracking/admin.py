@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Truck, Location, DeliveryRoute, RouteRequest, RouteBid
+from .models import Truck, Location, DeliveryRoute, RouteRequest, RouteBid, Geofence
 
 @admin.register(Truck)
 class TruckAdmin(admin.ModelAdmin):
@@ -39,3 +39,11 @@ class DeliveryRouteAdmin(admin.ModelAdmin):
     search_fields = ('truck__truck_number', 'driver__username', 'start_location', 'end_location')
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(Geofence)
+class GeofenceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'shape', 'radius_m', 'is_active', 'created_at')
+    list_filter = ('kind', 'shape', 'is_active')
+    search_fields = ('name',)
+    ordering = ('name',)
+    readonly_fields = ('created_at', 'updated_at')
@@ -0,0 +1,263 @@
+import struct
+import zlib
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+
+try:
+    import zstandard
+except ImportError:  # blocks are written with zlib instead
+    zstandard = None
+
+MAGIC = b'LAB1'
+# (column, fixed-point scale); coordinates keep all 7 stored decimals, the
+# float columns are kept to 0.01 (km/h, degrees, metres)
+COLUMNS = (
+    ('id', 1),
+    ('driver_id', 1),
+    ('timestamp_us', 1),
+    ('latitude', 10 ** 7),
+    ('longitude', 10 ** 7),
+    ('speed', 100),
+    ('heading', 100),
+    ('accuracy', 100),
+)
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ZSTD_LEVEL = 9
+
+
+def _int_dtype(values):
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if not len(values) or (values.min() >= info.min and values.max() <= info.max):
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def encode_columns(columns):
+    """Dict of equal-length int64 arrays -> packed bytes.
+
+    Each column is stored as its first value plus successive deltas in the
+    narrowest integer type that fits, with the delta bytes transposed (all
+    low bytes, then the next byte, ...) so the compressor sees long runs.
+    """
+    n = len(columns['id'])
+    header = [MAGIC, struct.pack('<IB', n, len(COLUMNS))]
+    payload = []
+    for name, _ in COLUMNS:
+        values = np.asarray(columns[name], dtype=np.int64)
+        deltas = np.diff(values)
+        dtype = _int_dtype(deltas)
+        header.append(struct.pack('<qB', int(values[0]) if n else 0, dtype.itemsize))
+        payload.append(deltas.astype(dtype).view(np.uint8).reshape(-1, dtype.itemsize).T.tobytes())
+    return b''.join(header + payload)
+
+
+def decode_columns(raw):
+    """Inverse of encode_columns"""
+    if raw[:4] != MAGIC:
+        raise ValueError('Not a location archive block')
+    n, count = struct.unpack_from('<IB', raw, 4)
+    offset = 9
+    heads = []
+    for _ in range(count):
+        heads.append(struct.unpack_from('<qB', raw, offset))
+        offset += 9
+    columns = {}
+    for (name, _), (first, itemsize) in zip(COLUMNS, heads):
+        size = max(n - 1, 0) * itemsize
+        transposed = np.frombuffer(raw, dtype=np.uint8, count=size, offset=offset).reshape(itemsize, -1)
+        offset += size
+        deltas = np.ascontiguousarray(transposed.T).view(np.dtype(f'<i{itemsize}')).ravel().astype(np.int64)
+        columns[name] = np.cumsum(np.concatenate(([first], deltas)))[:n] if n else np.zeros(0, np.int64)
+    return columns
+
+
+def compress(raw, codec=None):
+    codec = codec or ('zstd' if zstandard is not None else 'zlib')
+    if codec == 'zstd':
+        return codec, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return codec, zlib.compress(raw, 9)
+
+
+def decompress(codec, data):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('The zstandard package is needed to read zstd archive blocks')
+        return zstandard.ZstdDecompressor().decompress(bytes(data))
+    return zlib.decompress(bytes(data))
+
+
+def decode_block(block):
+    return decode_columns(decompress(block.codec, block.data))
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def _rows_to_columns(rows):
+    """values_list rows (id, driver_id, timestamp, lat, lng, speed, heading, accuracy) -> int64 columns"""
+    micro = timedelta(microseconds=1)
+    return {
+        'id': np.array([row[0] for row in rows], dtype=np.int64),
+        'driver_id': np.array([row[1] for row in rows], dtype=np.int64),
+        'timestamp_us': np.array([(row[2] - EPOCH) // micro for row in rows], dtype=np.int64),
+        'latitude': np.array([int(row[3].scaleb(7)) for row in rows], dtype=np.int64),
+        'longitude': np.array([int(row[4].scaleb(7)) for row in rows], dtype=np.int64),
+        'speed': np.round(np.array([row[5] for row in rows], dtype=np.float64) * 100).astype(np.int64),
+        'heading': np.round(np.array([row[6] for row in rows], dtype=np.float64) * 100).astype(np.int64),
+        'accuracy': np.round(np.array([row[7] for row in rows], dtype=np.float64) * 100).astype(np.int64),
+    }
+
+
+def archive_truck_day(truck_id, day, max_location_id):
+    """Move one truck-day of fixes (all with id <= max_location_id) into its archive block.
+
+    Late fixes for a day that is already archived are merged into the existing
+    block. Returns (fixes archived, block) or (0, None) when there was nothing
+    to move or the day still has fixes above ``max_location_id``.
+    """
+    from .models import Location, LocationArchiveBlock
+
+    start, end = _day_bounds(day)
+    with transaction.atomic():
+        live = Location.objects.filter(truck_id=truck_id, timestamp__gte=start, timestamp__lt=end)
+        if live.filter(id__gt=max_location_id).exists():
+            return 0, None
+        rows = list(live.order_by('timestamp', 'id').values_list(
+            'id', 'driver_id', 'timestamp', 'latitude', 'longitude', 'speed', 'heading', 'accuracy'
+        ))
+        if not rows:
+            return 0, None
+        columns = _rows_to_columns(rows)
+
+        block = LocationArchiveBlock.objects.select_for_update().filter(truck_id=truck_id, day=day).first()
+        if block is not None:
+            existing = decode_block(block)
+            merged = {name: np.concatenate((existing[name], columns[name])) for name, _ in COLUMNS}
+            order = np.lexsort((merged['id'], merged['timestamp_us']))
+            columns = {name: values[order] for name, values in merged.items()}
+        else:
+            block = LocationArchiveBlock(truck_id=truck_id, day=day)
+
+        raw = encode_columns(columns)
+        block.codec, block.data = compress(raw)
+        block.raw_bytes = len(raw)
+        block.point_count = len(columns['id'])
+        block.first_fix_at = EPOCH + timedelta(microseconds=int(columns['timestamp_us'][0]))
+        block.last_fix_at = EPOCH + timedelta(microseconds=int(columns['timestamp_us'][-1]))
+        block.save()
+
+        live.filter(id__lte=max(row[0] for row in rows)).delete()
+        return len(rows), block
+
+
+def _blocks(truck_id, start=None, end=None, newest_first=False):
+    from .models import LocationArchiveBlock
+
+    blocks = LocationArchiveBlock.objects.filter(truck_id=truck_id)
+    if start is not None:
+        blocks = blocks.filter(last_fix_at__gte=start)
+    if end is not None:
+        blocks = blocks.filter(first_fix_at__lt=end)
+    return blocks.order_by('-day' if newest_first else 'day')
+
+
+def _window(columns, start, end):
+    mask = np.ones(len(columns['id']), dtype=bool)
+    if start is not None:
+        mask &= columns['timestamp_us'] >= (start - EPOCH) // timedelta(microseconds=1)
+    if end is not None:
+        mask &= columns['timestamp_us'] < (end - EPOCH) // timedelta(microseconds=1)
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def iter_archived_columns(truck_id, start=None, end=None, newest_first=False):
+    """Decoded columns of each archive block overlapping [start, end), one block at a time"""
+    for block in _blocks(truck_id, start, end, newest_first).iterator():
+        columns = _window(decode_block(block), start, end)
+        if len(columns['id']):
+            yield columns
+
+
+def archived_track(truck_id, start=None, end=None):
+    """(epoch seconds, lat, lng) arrays of the archived fixes, oldest first"""
+    parts = [(c['timestamp_us'] / 1e6, c['latitude'] / 1e7, c['longitude'] / 1e7)
+             for c in iter_archived_columns(truck_id, start, end)]
+    if not parts:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def archived_locations(truck, start=None, end=None, limit=None):
+    """Archived fixes as unsaved Location instances, newest first.
+
+    They carry their original ids and serialize exactly like live rows.
+    """
+    from authentication.models import CustomUser
+    from .models import Location
+
+    locations = []
+    for columns in iter_archived_columns(truck.id, start, end, newest_first=True):
+        for i in range(len(columns['id']) - 1, -1, -1):
+            if limit is not None and len(locations) >= limit:
+                break
+            locations.append(Location(
+                id=int(columns['id'][i]),
+                truck=truck,
+                driver_id=int(columns['driver_id'][i]),
+                latitude=Decimal(int(columns['latitude'][i])).scaleb(-7),
+                longitude=Decimal(int(columns['longitude'][i])).scaleb(-7),
+                speed=int(columns['speed'][i]) / 100,
+                heading=int(columns['heading'][i]) / 100,
+                accuracy=int(columns['accuracy'][i]) / 100,
+                timestamp=EPOCH + timedelta(microseconds=int(columns['timestamp_us'][i])),
+            ))
+        if limit is not None and len(locations) >= limit:
+            break
+
+    drivers = CustomUser.objects.in_bulk({location.driver_id for location in locations})
+    for location in locations:
+        if location.driver_id in drivers:
+            location.driver = drivers[location.driver_id]
+    return locations
+
+
+def _coordinate(value):
+    sign = '-' if value < 0 else ''
+    value = abs(value)
+    return f'{sign}{value // 10 ** 7}.{value % 10 ** 7:07d}'
+
+
+def export_rows(truck_id, start=None, end=None):
+    """CSV rows (header first) of a truck's archived and live fixes, oldest first"""
+    from .models import Location
+
+    yield ['id', 'timestamp', 'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'driver_id']
+    for columns in iter_archived_columns(truck_id, start, end):
+        for i in range(len(columns['id'])):
+            yield [
+                int(columns['id'][i]),
+                (EPOCH + timedelta(microseconds=int(columns['timestamp_us'][i]))).isoformat(),
+                _coordinate(int(columns['latitude'][i])),
+                _coordinate(int(columns['longitude'][i])),
+                int(columns['speed'][i]) / 100,
+                int(columns['heading'][i]) / 100,
+                int(columns['accuracy'][i]) / 100,
+                int(columns['driver_id'][i]),
+            ]
+
+    live = Location.objects.filter(truck_id=truck_id)
+    if start is not None:
+        live = live.filter(timestamp__gte=start)
+    if end is not None:
+        live = live.filter(timestamp__lt=end)
+    rows = live.order_by('timestamp', 'id').values_list(
+        'id', 'timestamp', 'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'driver_id'
+    )
+    for row in rows.iterator(chunk_size=2000):
+        yield [row[0], row[1].isoformat(), *row[2:]]
@@ -0,0 +1,105 @@
+"""Async versions of the busiest read-only REST endpoints.
+
+Under daphne a DRF view runs in a worker thread for its whole duration.
+These views run on the event loop instead: the request is authenticated
+by DRF's ``JWTAuthentication`` in a worker thread, the database is reached
+through Django's async ORM (``afirst``, ``async for``) and the
+response is built with the same serializers, from rows fetched with
+everything they need so that no lazy relation is touched outside a worker
+thread. Response bodies match what the DRF views returned.
+
+Only views that mostly wait on the database belong here. Creating a location
+(the insert and its post_save pipeline) and listing available routes (route
+serialization) spend their time in a worker thread or on the CPU either way,
+and measured slower on the event loop than as DRF views; the concurrency
+benchmark compares each view here with its DRF baseline.
+"""
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .models import Location, Truck
+from .serializers import LocationSerializer
+from .views import POSITION_FIELDS, position_data
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=DjangoJSONEncoder)
+
+
+class AsyncAPIView(View):
+    """Base for the async views: JWT only and authenticated users only, like the DRF views.
+
+    The handlers (``get``, ``post``, ...) are coroutines, so Django's ``View``
+    answers other methods with a 405 without leaving the event loop.
+    """
+
+    authentication_class = JWTAuthentication
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # No session authentication, so no CSRF check (as DRF's APIView.as_view does)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        authentication = self.authentication_class()
+        try:
+            user_auth = await sync_to_async(authentication.authenticate)(request)
+            if user_auth is None:
+                raise NotAuthenticated()
+        except (AuthenticationFailed, NotAuthenticated) as exc:
+            data = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+            response = _json(data, status=exc.status_code)
+            response['WWW-Authenticate'] = authentication.authenticate_header(request)
+            return response
+        # Also seen by the middleware that runs after the view
+        request.user, request.auth = user_auth
+        return await super().dispatch(request, *args, **kwargs)
+
+
+def latest_location(truck_id):
+    """Queryset for a truck's latest fix; it brings the truck along for the permission check"""
+    return Location.objects.filter(truck_id=truck_id).select_related('truck__driver', 'driver')
+
+
+def live_location_data(user, location, driver_id):
+    """(body, status) of the live-location response, shared with the DRF baseline in the benchmark"""
+    # Check permissions
+    if user.role == 'driver' and driver_id != user.id:
+        return {'error': 'Permission denied'}, 403
+    if location is not None:
+        return LocationSerializer(location).data, 200
+    return {'message': 'No location data available'}, 404
+
+
+class TruckLiveLocationView(AsyncAPIView):
+    async def get(self, request, truck_id):
+        # One query in the usual case: the latest fix brings its truck along
+        location = await latest_location(truck_id).afirst()
+        if location is not None:
+            driver_id = location.truck.driver_id
+        else:
+            truck = await Truck.objects.filter(id=truck_id).values('driver_id').afirst()
+            if truck is None:
+                return _json({'detail': 'Not found.'}, status=404)
+            driver_id = truck['driver_id']
+        return _json(*live_location_data(request.user, location, driver_id))
+
+
+def fleet_positions(user):
+    """Values queryset of the positions a user may see (a driver gets only their own truck)"""
+    trucks = Truck.objects.filter(last_latitude__isnull=False)
+    if user.role != 'admin':
+        trucks = trucks.filter(driver=user)
+    return trucks.order_by('id').values(*POSITION_FIELDS)
+
+
+class FleetPositionsView(AsyncAPIView):
+    async def get(self, request):
+        """Last known position of every truck (a driver gets only their own), for polling map views"""
+        return _json([position_data(truck) async for truck in fleet_positions(request.user)])
@@ -0,0 +1,45 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from . import lifecycle, metrics
+
+ADMIN_GROUP = 'admin_dashboard'
+
+
+def send_to_group(group, message):
+    """Send a channel layer message from synchronous code (views, signals, the ingest worker)"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    loop = lifecycle.event_loop()
+    if loop is not None:
+        # Hand the send to the server's loop, where the layer's queues live, without waiting on it
+        asyncio.run_coroutine_threadsafe(channel_layer.group_send(group, message), loop)
+    else:
+        async_to_sync(channel_layer.group_send)(group, message)
+    _observe_fanout(group)
+
+
+async def asend_to_group(group, message):
+    """send_to_group for code running on the event loop"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    await channel_layer.group_send(group, message)
+    _observe_fanout(group)
+
+
+def _observe_fanout(group):
+    size = metrics.group_size(group)
+    if size is not None:
+        metrics.group_fanout.observe(size, metrics.group_label(group))
+
+
+def broadcast_admin(message_type, data):
+    send_to_group(ADMIN_GROUP, {'type': message_type, 'data': data})
+
+
+async def abroadcast_admin(message_type, data):
+    await asend_to_group(ADMIN_GROUP, {'type': message_type, 'data': data})
@@ -0,0 +1,40 @@
+import numpy as np
+from django.db import connections
+from django.db.models import FloatField, Func
+
+
+class Epoch(Func):
+    """Seconds since the Unix epoch of a datetime column, computed in the database"""
+    output_field = FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='EXTRACT(EPOCH FROM %(expressions)s)', **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection,
+                              template='EXTRACT(EPOCH FROM %(expressions)s)::double precision', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection,
+                              template='((julianday(%(expressions)s) - 2440587.5) * 86400.0)', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def fetch_array(values_queryset):
+    """Run a values_list() queryset of numeric columns straight into a 2-D float array.
+
+    The columns must not need Django converters (use Epoch/Cast for datetimes
+    and decimals); rows skip the ORM's per-row machinery entirely. Columns come
+    back in the order the fields were passed to values_list().
+    """
+    query = values_queryset.query
+    # The SQL selects plain fields before annotations whatever the values_list() order
+    selected = list(query.extra_select) + list(query.values_select) + list(query.annotation_select)
+    order = [selected.index(name) for name in values_queryset._fields] if values_queryset._fields else None
+    sql, params = query.sql_with_params()
+    with connections[values_queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        array = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, len(cursor.description))
+    return array[:, order] if order is not None and order != list(range(len(order))) else array
@@ -0,0 +1,90 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:  # responses are gzipped only
+    brotli = None
+
+# Fast settings suited to compressing every response on the fly; higher
+# levels cost several times the CPU for a few percent on JSON
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Already compressed, or not worth the CPU
+SKIP_CONTENT_TYPES = ('image/', 'audio/', 'video/', 'application/zip', 'application/gzip')
+
+
+def supported_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding):
+    """The best encoding we support that the Accept-Encoding header allows, or None"""
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+
+    best, best_weight = None, 0.0
+    for coding in supported_encodings():
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+class Compressor:
+    """One incremental gzip or brotli stream"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data, flush=False):
+        """Compressed bytes ready so far; ``flush`` pushes out everything given up to now"""
+        if self.encoding == 'br':
+            out = self._brotli.process(data)
+            return out + self._brotli.flush() if flush else out
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def compress(data, encoding):
+    compressor = Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding, flush=False):
+    compressor = Compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk, flush)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_stream(chunks, encoding, flush=False):
+    compressor = Compressor(encoding)
+    async for chunk in chunks:
+        data = compressor.compress(chunk, flush)
+        if data:
+            yield data
+    yield compressor.finish()
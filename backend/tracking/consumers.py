@@ -1,43 +1,86 @@
+import asyncio
 import json
+import time
+from urllib.parse import parse_qsl
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import UntypedToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from django.conf import settings
-import jwt
-from .models import Truck, Location
+from django.db.models import Q
+from .models import Truck, Location, DeliveryRoute
 from .serializers import LocationSerializer
+from . import metrics
 
 User = get_user_model()
 
-class LocationTrackingConsumer(AsyncWebsocketConsumer):
+@database_sync_to_async
+def get_user_from_token(token):
+    """User for a JWT access token, checked as JWTAuthentication checks a Bearer header, or None"""
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(token))
+    except (InvalidToken, AuthenticationFailed):
+        # AuthenticationFailed: the token is fine but its user is gone or inactive
+        return None
+
+async def authenticate_scope(scope):
+    """(user, None) for the ``?token=`` access token of a websocket scope, or
+    (None, close code): 4001 without a token, 4002 for an invalid one, 4003 if checking it failed
+    """
+    token = query_params(scope).get('token')
+    if not token:
+        return None, 4001
+    try:
+        user = await get_user_from_token(token)
+    except Exception:
+        return None, 4003
+    if user is None:
+        return None, 4002
+    return user, None
+
+def query_params(scope):
+    """Query string parameters of a websocket scope (the last value of each)"""
+    return dict(parse_qsl(scope.get('query_string', b'').decode()))
+
+class InstrumentedConsumer(AsyncWebsocketConsumer):
+    """Counts open connections and frames in and out for /metrics"""
+    metrics_open = False
+
+    async def accept(self, subprotocol=None):
+        await super().accept(subprotocol)
+        self.metrics_open = True
+        metrics.websocket_connections.inc(type(self).__name__)
+
+    async def websocket_receive(self, message):
+        metrics.websocket_messages.inc(type(self).__name__, 'in')
+        await super().websocket_receive(message)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if text_data is not None or bytes_data is not None:
+            metrics.websocket_messages.inc(type(self).__name__, 'out')
+        await super().send(text_data, bytes_data, close)
+
+    async def websocket_disconnect(self, message):
+        try:
+            await super().websocket_disconnect(message)
+        finally:
+            if self.metrics_open:
+                self.metrics_open = False
+                metrics.websocket_connections.dec(type(self).__name__)
+
+class LocationTrackingConsumer(InstrumentedConsumer):
     async def connect(self):
         self.truck_id = self.scope['url_route']['kwargs']['truck_id']
         self.truck_group_name = f'truck_{self.truck_id}'
         
-        # Get token from query string
-        query_string = self.scope.get('query_string', b'').decode()
-        token = None
-        for param in query_string.split('&'):
-            if param.startswith('token='):
-                token = param.split('=', 1)[1]
-                break
-        
-        if not token:
-            await self.close(code=4001)
-            return
-        
-        # Authenticate user with token
-        try:
-            user = await self.get_user_from_token(token)
-            if not user:
-                await self.close(code=4002)
-                return
-            self.user = user
-        except Exception:
-            await self.close(code=4003)
+        # Authenticate user with the token from the query string
+        self.user, close_code = await authenticate_scope(self.scope)
+        if close_code is not None:
+            await self.close(code=close_code)
             return
         
         # Check permissions
@@ -71,17 +114,11 @@ class LocationTrackingConsumer(AsyncWebsocketConsumer):
 
     async def handle_location_update(self, data):
         try:
-            # Save location to database
-            location = await self.save_location(data)
-            
-            # Broadcast to truck group
-            await self.channel_layer.group_send(
-                self.truck_group_name,
-                {
-                    'type': 'location_broadcast',
-                    'location': location
-                }
-            )
+            # Save location to database; the post_save signal broadcasts it to
+            # the truck group (and the admin dashboard) once committed
+            started = time.perf_counter()
+            await self.save_location(data)
+            metrics.location_save_latency.observe(time.perf_counter() - started)
         except Exception as e:
             await self.send(text_data=json.dumps({
                 'type': 'error',
@@ -97,18 +134,6 @@ class LocationTrackingConsumer(AsyncWebsocketConsumer):
             'location': location
         }))
 
-    @database_sync_to_async
-    def get_user_from_token(self, token):
-        try:
-            # Decode JWT token
-            decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            user_id = decoded.get('user_id')
-            if user_id:
-                return User.objects.get(id=user_id)
-            return None
-        except (jwt.DecodeError, jwt.ExpiredSignatureError, User.DoesNotExist):
-            return None
-
     @database_sync_to_async
     def has_permission(self):
         try:
@@ -134,33 +159,18 @@ class LocationTrackingConsumer(AsyncWebsocketConsumer):
                 heading=data.get('heading', 0.0),
                 accuracy=data.get('accuracy', 0.0)
             )
-            return LocationSerializer(location).data
+            return location.id
         except Exception as e:
             raise Exception(f"Error saving location: {str(e)}")
 
-class AdminDashboardConsumer(AsyncWebsocketConsumer):
+class AdminDashboardConsumer(InstrumentedConsumer):
     async def connect(self):
-        # Get token from query string
-        query_string = self.scope.get('query_string', b'').decode()
-        token = None
-        for param in query_string.split('&'):
-            if param.startswith('token='):
-                token = param.split('=', 1)[1]
-                break
-        
-        if not token:
-            await self.close(code=4001)
-            return
-        
-        # Authenticate user with token
-        try:
-            user = await self.get_user_from_token(token)
-            if not user or user.role != 'admin':
-                await self.close(code=4002)
-                return
-            self.user = user
-        except Exception:
-            await self.close(code=4003)
+        # Authenticate user with the token from the query string
+        self.user, close_code = await authenticate_scope(self.scope)
+        if close_code is None and self.user.role != 'admin':
+            close_code = 4002
+        if close_code is not None:
+            await self.close(code=close_code)
             return
 
         # Join admin group
@@ -189,6 +199,27 @@ class AdminDashboardConsumer(AsyncWebsocketConsumer):
             'data': event['data']
         }))
 
+    async def route_progress_update(self, event):
+        # Send live ETA / progress of in-progress routes to admin
+        await self.send(text_data=json.dumps({
+            'type': 'route_progress_update',
+            'data': event['data']
+        }))
+
+    async def geofence_event(self, event):
+        # Send geofence enter/exit events to admin
+        await self.send(text_data=json.dumps({
+            'type': 'geofence_event',
+            'data': event['data']
+        }))
+
+    async def heartbeat_event(self, event):
+        # Send truck offline / back online events to admin
+        await self.send(text_data=json.dumps({
+            'type': 'heartbeat_event',
+            'data': event['data']
+        }))
+
     async def location_update_admin(self, event):
         # Send location updates to admin dashboard
         await self.send(text_data=json.dumps({
@@ -196,14 +227,284 @@ class AdminDashboardConsumer(AsyncWebsocketConsumer):
             'data': event['data']
         }))
 
+class TripReplayConsumer(InstrumentedConsumer):
+    """Replays a delivery route's stored track as if it were live.
+
+    Rows are read in (timestamp, id) keyset chunks, with the next chunk fetched
+    while the current one plays, so a replay never holds more than two chunks
+    however long the route. Frames are paced against the event loop clock at
+    ``speed`` times real time and use the same format as location_broadcast.
+    """
+    CHUNK_SIZE = 500
+    MIN_SPEED, MAX_SPEED = 1.0, 100.0
+    # Longer gaps in the track (truck parked, no signal) are shortened to this
+    MAX_GAP_SECONDS = 300
+
+    async def connect(self):
+        self.route_id = self.scope['url_route']['kwargs']['route_id']
+        self.replay_task = None
+        self.anchor = None          # (loop time, track time) pair the pacing is measured from
+        self.speed_changed = asyncio.Event()
+        
+        # Authenticate user with the token from the query string
+        self.user, close_code = await authenticate_scope(self.scope)
+        if close_code is not None:
+            await self.close(code=close_code)
+            return
+        
+        self.route = await self.get_route()
+        if self.route is None:
+            await self.close(code=4004)
+            return
+        
+        try:
+            self.speed = self.clamp_speed(float(query_params(self.scope).get('speed', 10)))
+        except ValueError:
+            self.speed = 10.0
+        
+        await self.accept()
+        self.replay_task = asyncio.ensure_future(self.replay())
+
+    async def disconnect(self, close_code):
+        if self.replay_task is not None:
+            self.replay_task.cancel()
+
+    async def receive(self, text_data):
+        try:
+            text_data_json = json.loads(text_data)
+        except ValueError:
+            return
+        if text_data_json.get('type') == 'set_speed':
+            try:
+                speed = self.clamp_speed(float(text_data_json.get('speed')))
+            except (TypeError, ValueError):
+                return
+            # Re-anchor the clock so the change applies from the current position
+            loop = asyncio.get_running_loop()
+            if self.anchor is not None:
+                wall, track = self.anchor
+                self.anchor = (loop.time(), track + (loop.time() - wall) * self.speed)
+            self.speed = speed
+            # Cut the current wait short so the next frame is timed at the new speed
+            self.speed_changed.set()
+
+    def clamp_speed(self, speed):
+        return min(self.MAX_SPEED, max(self.MIN_SPEED, speed))
+
+    async def replay(self):
+        loop = asyncio.get_running_loop()
+        previous = None
+        count = 0
+        after = None
+        next_chunk = asyncio.ensure_future(self.get_chunk(after))
+        try:
+            while True:
+                chunk = await next_chunk
+                if not chunk:
+                    break
+                last = chunk[-1]
+                after = (last[0], last[1])
+                next_chunk = asyncio.ensure_future(self.get_chunk(after)) if len(chunk) == self.CHUNK_SIZE else None
+                
+                for timestamp, _, location in chunk:
+                    track = timestamp.timestamp()
+                    if self.anchor is None:
+                        self.anchor = (loop.time(), track)
+                    elif track - previous > self.MAX_GAP_SECONDS:
+                        # Skip most of a long gap: shift the anchor forward
+                        wall, anchored = self.anchor
+                        self.anchor = (wall, anchored + (track - previous) - self.MAX_GAP_SECONDS)
+                    previous = track
+                    
+                    await self.wait_until(track)
+                    await self.send(text_data=json.dumps({
+                        'type': 'location_update',
+                        'location': location
+                    }))
+                    count += 1
+                
+                if next_chunk is None:
+                    break
+            
+            await self.send(text_data=json.dumps({
+                'type': 'replay_complete',
+                'route_id': self.route.id,
+                'count': count
+            }))
+            await self.close()
+        except asyncio.CancelledError:
+            if next_chunk is not None:
+                next_chunk.cancel()
+            raise
+
+    async def wait_until(self, track):
+        """Sleep until the frame at ``track`` time is due, recomputed whenever the speed changes"""
+        loop = asyncio.get_running_loop()
+        while True:
+            wall, anchored = self.anchor
+            delay = wall + (track - anchored) / self.speed - loop.time()
+            if delay <= 0:
+                return
+            self.speed_changed.clear()
+            try:
+                await asyncio.wait_for(self.speed_changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
     @database_sync_to_async
-    def get_user_from_token(self, token):
+    def get_chunk(self, after):
+        """Next CHUNK_SIZE fixes of the route after the (timestamp, id) keyset position"""
+        locations = Location.objects.filter(
+            truck_id=self.route.truck_id,
+            timestamp__gte=self.route.started_at,
+        ).select_related('truck__driver', 'driver')
+        if self.route.completed_at:
+            locations = locations.filter(timestamp__lte=self.route.completed_at)
+        if after is not None:
+            timestamp, location_id = after
+            locations = locations.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=location_id))
+        locations = locations.order_by('timestamp', 'id')[:self.CHUNK_SIZE]
+        return [(location.timestamp, location.id, LocationSerializer(location).data) for location in locations]
+
+    @database_sync_to_async
+    def get_route(self):
+        """The route if it has been started and the user may see it"""
         try:
-            # Decode JWT token
-            decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            user_id = decoded.get('user_id')
-            if user_id:
-                return User.objects.get(id=user_id)
+            route = DeliveryRoute.objects.get(id=self.route_id)
+        except DeliveryRoute.DoesNotExist:
             return None
-        except (jwt.DecodeError, jwt.ExpiredSignatureError, User.DoesNotExist):
+        if route.started_at is None:
             return None
+        if self.user.role == 'admin' or route.driver_id == self.user.id:
+            return route
+        return None
+
+class MultiTruckConsumer(InstrumentedConsumer):
+    """Follow any number of trucks over one socket.
+
+    The client sends ``{"type": "subscribe", "trucks": [ids]}`` and
+    ``{"type": "unsubscribe", "trucks": [ids]}`` (or ``"trucks": "all"``);
+    each request is checked with a single query, its group memberships are
+    changed concurrently, and the reply is a ``subscriptions`` frame with the
+    trucks now followed and the ids that were refused. Location updates are collected for up to
+    BATCH_SECONDS and sent as one ``location_batch`` frame, oldest first.
+    """
+    MAX_TRUCKS = 500
+    BATCH_SECONDS = 0.1
+    MAX_BATCH = 200
+
+    async def connect(self):
+        self.trucks = set()
+        self.pending = []
+        self.flush_task = None
+        
+        # Authenticate user with the token from the query string
+        self.user, close_code = await authenticate_scope(self.scope)
+        if close_code is not None:
+            await self.close(code=close_code)
+            return
+
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        await self.leave(self.trucks)
+
+    async def receive(self, text_data):
+        try:
+            text_data_json = json.loads(text_data)
+        except ValueError:
+            return
+        message_type = text_data_json.get('type')
+        trucks = text_data_json.get('trucks')
+
+        if message_type == 'subscribe':
+            requested = self.truck_ids(trucks)
+            if requested is None:
+                await self.send_error('trucks must be a list of truck ids')
+                return
+            room = self.MAX_TRUCKS - len(self.trucks)
+            new = sorted(requested - self.trucks)
+            if len(new) > room:
+                await self.send_error(f'At most {self.MAX_TRUCKS} trucks per connection')
+                return
+            allowed = await self.allowed_trucks(new) if new else set()
+            await self.join(allowed)
+            await self.send(text_data=json.dumps({
+                'type': 'subscriptions',
+                'trucks': sorted(self.trucks),
+                'rejected': sorted(set(new) - allowed),
+            }))
+        elif message_type == 'unsubscribe':
+            removed = set(self.trucks) if trucks == 'all' else self.truck_ids(trucks)
+            if removed is None:
+                await self.send_error('trucks must be a list of truck ids or "all"')
+                return
+            await self.leave(removed & self.trucks)
+            await self.send(text_data=json.dumps({
+                'type': 'subscriptions',
+                'trucks': sorted(self.trucks),
+                'rejected': [],
+            }))
+
+    def truck_ids(self, trucks):
+        if not isinstance(trucks, list):
+            return None
+        try:
+            return {int(truck_id) for truck_id in trucks}
+        except (TypeError, ValueError):
+            return None
+
+    async def join(self, truck_ids):
+        self.trucks |= truck_ids
+        await asyncio.gather(*(
+            self.channel_layer.group_add(f'truck_{truck_id}', self.channel_name) for truck_id in truck_ids
+        ))
+
+    async def leave(self, truck_ids):
+        self.trucks -= truck_ids
+        await asyncio.gather(*(
+            self.channel_layer.group_discard(f'truck_{truck_id}', self.channel_name) for truck_id in truck_ids
+        ))
+
+    async def location_broadcast(self, event):
+        location = event['location']
+        # A message can still arrive just after its truck was unsubscribed
+        if location['truck'] not in self.trucks:
+            return
+        self.pending.append(location)
+        if len(self.pending) >= self.MAX_BATCH:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.BATCH_SECONDS)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if not self.pending:
+            return
+        locations, self.pending = self.pending, []
+        await self.send(text_data=json.dumps({
+            'type': 'location_batch',
+            'locations': locations
+        }))
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': message
+        }))
+
+    @database_sync_to_async
+    def allowed_trucks(self, truck_ids):
+        trucks = Truck.objects.filter(id__in=truck_ids)
+        if self.user.role != 'admin':
+            trucks = trucks.filter(driver=self.user)
+        return set(trucks.values_list('id', flat=True))
@@ -0,0 +1,97 @@
+import threading
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+
+from .geo import haversine_km
+from .trip_stats import MOVING_SPEED_KMH
+
+# Number of recent fixes that make up the speed profile
+SPEED_WINDOW = 30
+
+
+class RouteProgressTracker:
+    """Live ETA and percent-complete for in-progress delivery routes.
+
+    Progress is recomputed only when a new fix arrives for the route's truck
+    and cached per route, so reads (serializers, dashboards) are free. The
+    remaining distance is the straight line to the drop-off scaled by the
+    route's road/straight-line ratio when ``RouteRequest.distance_km`` is known,
+    and the speed is the mean of recent moving fixes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}      # route id -> static route data
+        self._speeds = {}      # route id -> deque of recent moving speeds
+        self._progress = {}    # route id -> latest progress dict
+
+    def _route(self, route_id):
+        route = self._routes.get(route_id)
+        if route is None:
+            from .models import DeliveryRoute
+
+            values = DeliveryRoute.objects.filter(id=route_id).values(
+                'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude',
+                'route_request__distance_km', 'route_request__delivery_deadline',
+            ).first()
+            if values is None:
+                return None
+            straight_km = haversine_km(values['start_latitude'], values['start_longitude'],
+                                       values['end_latitude'], values['end_longitude'])
+            road_km = float(values['route_request__distance_km'] or 0) or straight_km
+            route = self._routes[route_id] = {
+                'end_lat': float(values['end_latitude']),
+                'end_lng': float(values['end_longitude']),
+                'total_km': road_km,
+                'road_factor': road_km / straight_km if straight_km else 1.0,
+                'deadline': values['route_request__delivery_deadline'],
+            }
+        return route
+
+    def update(self, route_id, location):
+        with self._lock:
+            route = self._route(route_id)
+            if route is None:
+                return None
+            speeds = self._speeds.setdefault(route_id, deque(maxlen=SPEED_WINDOW))
+            speed = float(location.speed or 0)
+            if speed >= MOVING_SPEED_KMH:
+                speeds.append(speed)
+
+            lat, lng = float(location.latitude), float(location.longitude)
+            remaining_km = haversine_km(lat, lng, route['end_lat'], route['end_lng']) * route['road_factor']
+            total_km = route['total_km']
+            percent = 100.0 * (1 - remaining_km / total_km) if total_km else 100.0
+            expected_speed = (sum(speeds) / len(speeds)) if speeds else getattr(settings, 'ETA_DEFAULT_SPEED_KMH', 40.0)
+            eta = location.timestamp + timedelta(hours=remaining_km / expected_speed)
+            deadline = route['deadline']
+
+            progress = {
+                'route_id': route_id,
+                'truck_id': location.truck_id,
+                'latitude': lat,
+                'longitude': lng,
+                'remaining_km': round(remaining_km, 3),
+                'percent_complete': round(min(100.0, max(0.0, percent)), 1),
+                'expected_speed_kmh': round(expected_speed, 1),
+                'eta': eta.isoformat(),
+                'delivery_deadline': deadline.isoformat() if deadline else None,
+                'at_risk': bool(deadline and eta > deadline),
+                'updated_at': location.timestamp.isoformat(),
+            }
+            self._progress[route_id] = progress
+            return progress
+
+    def get(self, route_id):
+        return self._progress.get(route_id)
+
+    def discard(self, route_id):
+        with self._lock:
+            self._routes.pop(route_id, None)
+            self._speeds.pop(route_id, None)
+            self._progress.pop(route_id, None)
+
+
+route_progress = RouteProgressTracker()
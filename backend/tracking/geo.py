@@ -0,0 +1,86 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_km_many(lat, lng, lats, lngs):
+    """Vectorized haversine from one point to arrays of points, in kilometres"""
+    lat, lng = np.radians(float(lat)), np.radians(float(lng))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs = np.radians(np.asarray(lngs, dtype=np.float64))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bounding_box(lat, lng, radius_km):
+    """(min_lat, min_lng, max_lat, max_lng) enclosing a circle"""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(180.0, dlat / cos_lat)
+    return max(-90.0, lat - dlat), lng - dlng, min(90.0, lat + dlat), lng + dlng
+
+
+# Geohash
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lng, precision=9):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bit = ch = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch <<= 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_BASE32[ch])
+            bit = ch = 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """(lat height, lng width) of a geohash cell in degrees"""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def geohash_cover(lat, lng, radius_km, max_cells=16):
+    """Geohash prefixes whose cells together cover a circle.
+
+    Picks the finest precision that needs at most ``max_cells`` cells.
+    """
+    min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_km)
+    for precision in range(9, 0, -1):
+        height, width = geohash_cell_size(precision)
+        rows = int((max_lat - min_lat) / height) + 2
+        cols = int((max_lng - min_lng) / width) + 2
+        if rows * cols <= max_cells or precision == 1:
+            break
+    cells = set()
+    for row in range(rows):
+        cell_lat = min(max_lat, min_lat + row * height)
+        for col in range(cols):
+            cell_lng = min(max_lng, min_lng + col * width)
+            cells.add(geohash_encode(cell_lat, (cell_lng + 180.0) % 360.0 - 180.0, precision))
+    return sorted(cells)
@@ -0,0 +1,275 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .broadcast import broadcast_admin
+
+METERS_PER_DEGREE = 111320.0
+
+
+class CircleFence:
+    def __init__(self, key, name, kind, lat, lng, radius_m, truck_id=None, route_id=None):
+        self.key = key
+        self.name = name
+        self.kind = kind
+        self.truck_id = truck_id
+        self.route_id = route_id
+        self.lat = lat
+        self.lng = lng
+        self.radius_m = radius_m
+        # Equirectangular projection around the centre is exact enough at fence scale
+        self._lng_scale = math.cos(math.radians(lat))
+        self._radius_deg_sq = (radius_m / METERS_PER_DEGREE) ** 2
+        dlat = radius_m / METERS_PER_DEGREE
+        dlng = dlat / max(self._lng_scale, 1e-6)
+        self.bbox = (lat - dlat, lng - dlng, lat + dlat, lng + dlng)
+
+    def contains(self, lat, lng):
+        dlat = lat - self.lat
+        dlng = (lng - self.lng) * self._lng_scale
+        return dlat * dlat + dlng * dlng <= self._radius_deg_sq
+
+
+class PolygonFence:
+    def __init__(self, key, name, kind, vertices, truck_id=None, route_id=None):
+        self.key = key
+        self.name = name
+        self.kind = kind
+        self.truck_id = truck_id
+        self.route_id = route_id
+        self.vertices = [(float(lat), float(lng)) for lat, lng in vertices]
+        lats = [lat for lat, _ in self.vertices]
+        lngs = [lng for _, lng in self.vertices]
+        self.bbox = (min(lats), min(lngs), max(lats), max(lngs))
+
+    def contains(self, lat, lng):
+        # Ray casting
+        inside = False
+        vertices = self.vertices
+        j = len(vertices) - 1
+        for i in range(len(vertices)):
+            lat_i, lng_i = vertices[i]
+            lat_j, lng_j = vertices[j]
+            if (lat_i > lat) != (lat_j > lat):
+                cross = lng_i + (lat - lat_i) * (lng_j - lng_i) / (lat_j - lat_i)
+                if lng < cross:
+                    inside = not inside
+            j = i
+        return inside
+
+
+class GeofenceIndex:
+    """Uniform grid over fence bounding boxes.
+
+    Each fence is registered in every cell its bounding box touches, so a point
+    lookup is one dict access plus exact tests on the handful of fences that
+    share the cell.
+    """
+
+    def __init__(self, fences, cell_deg=0.05):
+        self.cell_deg = cell_deg
+        self.cells = {}
+        self.size = 0
+        for fence in fences:
+            self.add(fence)
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def add(self, fence):
+        min_lat, min_lng, max_lat, max_lng = fence.bbox
+        row_min, col_min = self._cell(min_lat, min_lng)
+        row_max, col_max = self._cell(max_lat, max_lng)
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                self.cells.setdefault((row, col), []).append(fence)
+        self.size += 1
+
+    def remove(self, fence):
+        min_lat, min_lng, max_lat, max_lng = fence.bbox
+        row_min, col_min = self._cell(min_lat, min_lng)
+        row_max, col_max = self._cell(max_lat, max_lng)
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                cell = self.cells.get((row, col))
+                if cell is None:
+                    continue
+                cell[:] = [other for other in cell if other is not fence]
+                if not cell:
+                    del self.cells[(row, col)]
+        self.size -= 1
+
+    def containing(self, lat, lng, truck_id=None):
+        """Keys of the fences containing a point"""
+        inside = set()
+        for fence in self.cells.get(self._cell(lat, lng), ()):
+            if fence.truck_id is not None and fence.truck_id != truck_id:
+                continue
+            min_lat, min_lng, max_lat, max_lng = fence.bbox
+            if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng and fence.contains(lat, lng):
+                inside.add(fence.key)
+        return inside
+
+
+class GeofenceEngine:
+    """Tracks which fences each truck is in and reports enter/exit transitions.
+
+    The index is built lazily and rebuilt at least every
+    ``GEOFENCE_INDEX_TTL`` seconds; in between, a saved or deleted fence or
+    delivery route only swaps its own entries (see ``tracking.signals``).
+    Pending and in-progress delivery routes contribute circular fences around
+    their start and end points that only apply to the route's own truck.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._fences = {}
+        self._built_at = None
+        self._membership = {}  # truck id -> set of fence keys
+
+    def invalidate(self):
+        self._built_at = None
+
+    def load(self, fences):
+        index = GeofenceIndex(fences)
+        with self._lock:
+            self._index = index
+            self._fences = {fence.key: fence for fence in fences}
+            self._built_at = time.monotonic()
+
+    def ensure_built(self):
+        ttl = getattr(settings, 'GEOFENCE_INDEX_TTL', 300)
+        if self._built_at is None or time.monotonic() - self._built_at > ttl:
+            self.load(load_fences())
+
+    def replace(self, keys, fences):
+        """Drop the fences under ``keys`` and add ``fences`` in place of a full rebuild"""
+        with self._lock:
+            if self._index is None:
+                return
+            for key in keys:
+                fence = self._fences.pop(key, None)
+                if fence is not None:
+                    self._index.remove(fence)
+            for fence in fences:
+                self._fences[fence.key] = fence
+                self._index.add(fence)
+
+    def update_geofence(self, geofence):
+        self.replace([f'fence:{geofence.id}'], geofence_fences(geofence))
+
+    def remove_geofence(self, geofence_id):
+        self.replace([f'fence:{geofence_id}'], [])
+
+    def update_route(self, route):
+        self.replace(route_fence_keys(route.id), route_fences(route))
+
+    def remove_route(self, route_id):
+        self.replace(route_fence_keys(route_id), [])
+
+    def process_fix(self, truck_id, lat, lng):
+        """Returns (entered, exited) lists of fences for this fix"""
+        if self._index is None:
+            return [], []
+        with self._lock:
+            inside = self._index.containing(lat, lng, truck_id)
+            previous = self._membership.get(truck_id, set())
+            if inside == previous:
+                return [], []
+            self._membership[truck_id] = inside
+            entered = [self._fences[key] for key in inside - previous if key in self._fences]
+            exited = [self._fences[key] for key in previous - inside if key in self._fences]
+        return entered, exited
+
+
+def geofence_fences(geofence):
+    """Index entries for a Geofence row (none if it is inactive or incomplete)"""
+    if not geofence.is_active:
+        return []
+    if geofence.shape == 'circle' and geofence.radius_m and geofence.center_latitude is not None:
+        return [CircleFence(f'fence:{geofence.id}', geofence.name, geofence.kind,
+                            geofence.center_latitude, geofence.center_longitude, geofence.radius_m)]
+    if geofence.shape == 'polygon' and len(geofence.polygon) >= 3:
+        return [PolygonFence(f'fence:{geofence.id}', geofence.name, geofence.kind, geofence.polygon)]
+    return []
+
+
+def route_fence_keys(route_id):
+    return [f'route:{route_id}:start', f'route:{route_id}:end']
+
+
+def route_fences(route):
+    """Start and end fences of a pending or in-progress delivery route"""
+    if route.status not in ('pending', 'in_progress'):
+        return []
+    radius_m = getattr(settings, 'ROUTE_GEOFENCE_RADIUS_M', 300)
+    start_key, end_key = route_fence_keys(route.id)
+    return [
+        CircleFence(start_key, route.start_location, 'route_start',
+                    float(route.start_latitude), float(route.start_longitude), radius_m, route.truck_id, route.id),
+        CircleFence(end_key, route.end_location, 'route_end',
+                    float(route.end_latitude), float(route.end_longitude), radius_m, route.truck_id, route.id),
+    ]
+
+
+def load_fences():
+    from .models import Geofence, DeliveryRoute
+
+    fences = []
+    for geofence in Geofence.objects.filter(is_active=True):
+        fences.extend(geofence_fences(geofence))
+    routes = DeliveryRoute.objects.filter(status__in=['pending', 'in_progress']).only(
+        'id', 'status', 'truck_id', 'start_location', 'start_latitude', 'start_longitude',
+        'end_location', 'end_latitude', 'end_longitude',
+    )
+    for route in routes:
+        fences.extend(route_fences(route))
+    return fences
+
+
+geofence_engine = GeofenceEngine()
+
+
+def check_location(location):
+    """Evaluate a new fix against all geofences and act on transitions"""
+    geofence_engine.ensure_built()
+    entered, exited = geofence_engine.process_fix(
+        location.truck_id, float(location.latitude), float(location.longitude)
+    )
+    if not entered and not exited:
+        return
+
+    for event, fences in (('enter', entered), ('exit', exited)):
+        for fence in fences:
+            data = {
+                'event': event,
+                'fence': fence.key,
+                'name': fence.name,
+                'kind': fence.kind,
+                'truck_id': location.truck_id,
+                'latitude': float(location.latitude),
+                'longitude': float(location.longitude),
+                'timestamp': location.timestamp.isoformat(),
+            }
+            transaction.on_commit(lambda data=data: broadcast_admin('geofence_event', data))
+
+    for fence in entered:
+        if fence.route_id is not None:
+            _arrived(fence)
+
+
+def _arrived(fence):
+    from .models import DeliveryRoute
+
+    try:
+        route = DeliveryRoute.objects.get(id=fence.route_id)
+    except DeliveryRoute.DoesNotExist:
+        return
+    if fence.kind == 'route_start':
+        route.start()
+    elif fence.kind == 'route_end':
+        route.complete()
@@ -0,0 +1,290 @@
+import asyncio
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .broadcast import abroadcast_admin, broadcast_admin
+
+# Slots per wheel level (a power of two) and number of levels: at one-second
+# ticks, 64 ** 4 ticks cover about 194 days before a timer has to wrap around
+WHEEL_BITS = 6
+WHEEL_LEVELS = 4
+
+
+class TimerWheel:
+    """Hierarchical timing wheel keyed by an arbitrary id.
+
+    Level 0 has one slot per tick; each level above has slots 64 times as
+    wide. A timer goes into the lowest level whose span reaches its deadline
+    and moves down a level each time the wheel passes into its slot, so
+    scheduling and cancelling are O(1) and every timer is moved at most
+    ``levels - 1`` times before it fires. Not thread-safe.
+    """
+
+    def __init__(self, bits=WHEEL_BITS, levels=WHEEL_LEVELS):
+        self.bits = bits
+        self.levels = levels
+        self.mask = (1 << bits) - 1
+        self.now = 0
+        self._slots = [[{} for _ in range(1 << bits)] for _ in range(levels)]
+        self._where = {}    # key -> slot dict holding its timer
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def __len__(self):
+        return len(self._where)
+
+    def get(self, key):
+        """Value the timer for ``key`` was scheduled with (None if it has none)"""
+        slot = self._where.get(key)
+        return slot[key][1] if slot is not None else None
+
+    def schedule(self, key, deadline, value=None):
+        """(Re)arm ``key`` to fire at tick ``deadline`` (the next tick at the earliest)"""
+        self.cancel(key)
+        self._place(key, max(deadline, self.now + 1), value)
+
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    def _place(self, key, deadline, value):
+        delta = deadline - self.now
+        level = 0 if delta <= self.mask else min((delta.bit_length() - 1) // self.bits, self.levels - 1)
+        slot = self._slots[level][(deadline >> (self.bits * level)) & self.mask]
+        slot[key] = (deadline, value)
+        self._where[key] = slot
+
+    def advance(self, tick):
+        """Turn the wheel up to ``tick``; returns (key, value) for every timer that fired"""
+        fired = []
+        while self.now < tick:
+            if not self._where:
+                # Nothing to fire or move down: skip ahead
+                self.now = tick
+                break
+            self.now += 1
+            # Entering a new slot on an upper level: spread its timers over the levels below
+            for level in range(1, self.levels):
+                if self.now & ((1 << (self.bits * level)) - 1):
+                    break
+                slots = self._slots[level]
+                index = (self.now >> (self.bits * level)) & self.mask
+                timers, slots[index] = slots[index], {}
+                for key, (deadline, value) in timers.items():
+                    self._place(key, deadline, value)
+            index = self.now & self.mask
+            timers = self._slots[0][index]
+            if timers:
+                self._slots[0][index] = {}
+                for key, (_, value) in timers.items():
+                    del self._where[key]
+                    fired.append((key, value))
+        return fired
+
+
+class HeartbeatMonitor:
+    """Notices trucks on an in-progress route that stop sending fixes.
+
+    Each fix re-arms the truck's timer in a ``TimerWheel``; a truck whose
+    timer runs out after ``HEARTBEAT_OFFLINE_SECONDS`` is reported to the
+    admin group as offline, and its next fix reports it back online. Fixes
+    come in through the ingest pipeline (``tracking.ingest``), starting or
+    finishing a route through the DeliveryRoute signals. The wheel turns in
+    a task on the process's event loop, started and stopped with the ASGI
+    application (``tracking.lifecycle``). Timers are per process, so before
+    a truck is reported offline or back online its ``last_location_at`` is
+    checked, which also counts the fixes other processes took in: one
+    query per tick, and only on ticks where a timer fired. An offline truck
+    stays on the wheel with a retry timer, first after a tick and then
+    doubling up to ``HEARTBEAT_OFFLINE_SECONDS``, so a fleet of silent
+    trucks is not looked up every second.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wheel = TimerWheel()
+        self._origin = time.monotonic()
+        self._offline = {}      # truck id -> (route id, silent since, offline since)
+        # Wheel values: (route id, silent since, retry seconds), the last None unless the truck is offline
+        self._task = None
+
+    def _tick_seconds(self):
+        return getattr(settings, 'HEARTBEAT_TICK_SECONDS', 1)
+
+    def _now(self):
+        return int((time.monotonic() - self._origin) / self._tick_seconds())
+
+    def _offline_seconds(self):
+        return getattr(settings, 'HEARTBEAT_OFFLINE_SECONDS', 120)
+
+    def _arm(self, truck_id, route_id, since, silent_seconds=0):
+        ticks = math.ceil((self._offline_seconds() - silent_seconds) / self._tick_seconds())
+        # One tick more, as the current one is already partly over: never early, at most a tick late
+        self._wheel.schedule(truck_id, self._now() + ticks + 1, (route_id, since, None))
+
+    def _retry(self, truck_id, route_id, since, seconds):
+        """Check an offline truck's last fix again in ``seconds``"""
+        ticks = math.ceil(seconds / self._tick_seconds())
+        self._wheel.schedule(truck_id, self._now() + ticks, (route_id, since, seconds))
+
+    def record_fix(self, truck_id, route_id, timestamp):
+        """A fix from a truck on an in-progress route (``route_id``)"""
+        with self._lock:
+            self._arm(truck_id, route_id, timestamp)
+            was_offline = self._offline.pop(truck_id, None)
+        if was_offline is not None:
+            data = {
+                'event': 'online',
+                'truck_id': truck_id,
+                'route_id': route_id,
+                'offline_since': was_offline[2],
+                'timestamp': timestamp.isoformat(),
+            }
+            transaction.on_commit(lambda: broadcast_admin('heartbeat_event', data))
+
+    def watch(self, truck_id, route_id, since=None):
+        """Start timing a truck whose route just started.
+
+        Any later save of the route calls this again: a truck that is timed
+        already, or already reported offline on this route, is left alone
+        until its next fix.
+        """
+        with self._lock:
+            offline = self._offline.get(truck_id)
+            if offline is not None:
+                # Offline trucks are on the wheel too, with a retry timer
+                if offline[0] == route_id:
+                    return
+                del self._offline[truck_id]
+            elif truck_id in self._wheel:
+                return
+            self._arm(truck_id, route_id, since)
+
+    def forget(self, truck_id, route_id):
+        """The truck's route ended: stop timing it"""
+        with self._lock:
+            timer = self._wheel.get(truck_id)
+            if timer is not None and timer[0] == route_id:
+                self._wheel.cancel(truck_id)
+            offline = self._offline.get(truck_id)
+            if offline is not None and offline[0] == route_id:
+                del self._offline[truck_id]
+
+    def is_offline(self, truck_id):
+        return truck_id in self._offline
+
+    def expire(self):
+        """Turn the wheel to the current tick; returns the heartbeat events that are due"""
+        with self._lock:
+            fired = self._wheel.advance(self._now())
+        if not fired:
+            return []
+        last_fixes = self._last_fixes({truck_id for truck_id, _ in fired})
+
+        now = timezone.now()
+        events = []
+        with self._lock:
+            for truck_id, (route_id, since, retry) in fired:
+                if truck_id in self._wheel:
+                    # A fix re-armed it while the lock was released
+                    continue
+                last_fix = last_fixes.get(truck_id)
+                fresh = last_fix is not None and (since is None or last_fix > since)
+                if retry is not None:
+                    state = self._offline.get(truck_id)
+                    if state is None or state[0] != route_id:
+                        # Back online or forgotten while the lock was released
+                        continue
+                    if not fresh:
+                        self._retry(truck_id, route_id, since, min(retry * 2, self._offline_seconds()))
+                        continue
+                    # Back online through a fix another process took in
+                    del self._offline[truck_id]
+                    self._arm(truck_id, route_id, last_fix, (now - last_fix).total_seconds())
+                    events.append({
+                        'event': 'online',
+                        'truck_id': truck_id,
+                        'route_id': route_id,
+                        'offline_since': state[2],
+                        'timestamp': last_fix.isoformat(),
+                    })
+                    continue
+                if fresh:
+                    # A fix this process did not see: time the truck from it instead
+                    since = last_fix
+                    silent_seconds = (now - last_fix).total_seconds()
+                    if silent_seconds < self._offline_seconds():
+                        self._arm(truck_id, route_id, since, silent_seconds)
+                        continue
+                self._offline[truck_id] = (route_id, since, now.isoformat())
+                self._retry(truck_id, route_id, since, self._tick_seconds())
+                events.append({
+                    'event': 'offline',
+                    'truck_id': truck_id,
+                    'route_id': route_id,
+                    # The last fix, or the route start if none came since
+                    'silent_since': since.isoformat() if since else None,
+                    'silent_seconds': round((now - since).total_seconds()) if since else None,
+                    'timestamp': now.isoformat(),
+                })
+        return events
+
+    def _expire(self):
+        try:
+            return self.expire()
+        finally:
+            close_old_connections()
+
+    def _last_fixes(self, truck_ids):
+        from .models import Truck
+
+        return dict(Truck.objects.filter(id__in=truck_ids, last_location_at__isnull=False).values_list(
+            'id', 'last_location_at',
+        ))
+
+    def _watch_active_routes(self):
+        # Routes already in progress when the process started
+        from .models import DeliveryRoute
+
+        routes = DeliveryRoute.objects.filter(status='in_progress').values_list('truck_id', 'id', 'started_at')
+        for truck_id, route_id, started_at in routes:
+            self.watch(truck_id, route_id, started_at)
+
+    async def run(self):
+        tick = self._tick_seconds()
+        loop = asyncio.get_running_loop()
+        watching = False
+        while True:
+            try:
+                if not watching:
+                    await sync_to_async(self._watch_active_routes)()
+                    watching = True
+                for data in await sync_to_async(self._expire)():
+                    await abroadcast_admin('heartbeat_event', data)
+            except Exception as exc:
+                loop.call_exception_handler({'message': 'Checking heartbeats failed', 'exception': exc})
+            # Sleep to the next tick boundary
+            await asyncio.sleep(tick - (time.monotonic() - self._origin) % tick)
+
+    def start(self, loop):
+        """Turn the wheel on ``loop`` (see ``tracking.lifecycle``)"""
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self.stop()
+        self._task = loop.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._task = None
+
+
+heartbeat_monitor = HeartbeatMonitor()
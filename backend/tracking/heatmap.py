@@ -0,0 +1,155 @@
+import io
+import json
+
+import numpy as np
+from django.conf import settings
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from PIL import Image
+
+from .columns import fetch_array
+from .tiles import TILE_SIZE, TileCache, is_closed_range, project, tile_bounds
+
+# Cells per tile side in the JSON density grid
+JSON_GRID = 64
+# Rendering works on a half-resolution grid that is blurred and then upscaled
+RENDER_GRID = TILE_SIZE // 2
+BLUR_CELLS = 3
+# Colour ramp from sparse to dense (R, G, B, A) at the given intensity stops
+RAMP_STOPS = np.array([0.0, 0.25, 0.5, 0.75, 1.0])
+RAMP_COLORS = np.array([
+    [0, 0, 255, 0],
+    [0, 160, 255, 140],
+    [0, 220, 0, 180],
+    [255, 220, 0, 210],
+    [255, 0, 0, 230],
+])
+
+heatmap_cache = TileCache(
+    'heatmap',
+    max_entries=getattr(settings, 'HEATMAP_CACHE_ENTRIES', 2048),
+    ttl=getattr(settings, 'HEATMAP_CACHE_TTL', 60),
+    directory=getattr(settings, 'TILE_CACHE_DIR', None),
+    # Rollup-backed zooms don't change with each fix; the TTL refreshes them
+    min_touch_zoom=getattr(settings, 'HEATMAP_ROLLUP_MAX_ZOOM', 10) + 1,
+)
+
+
+def _points(z, x, y, start, end, pad):
+    """(lats, lngs, weights) of the fixes around a tile.
+
+    Up to ``HEATMAP_ROLLUP_MAX_ZOOM`` the hourly rollups are used, one point per
+    truck-hour at its centroid weighted by the number of fixes, so low zoom
+    tiles covering the whole fleet stay cheap. Closer in, raw fixes are read
+    through the (latitude, longitude) index.
+    """
+    from .models import Location, LocationRollup
+
+    south, west, north, east = tile_bounds(z, x, y)
+    lat_pad, lng_pad = (north - south) * pad, (east - west) * pad
+    south, north, west, east = south - lat_pad, north + lat_pad, west - lng_pad, east + lng_pad
+
+    if z <= getattr(settings, 'HEATMAP_ROLLUP_MAX_ZOOM', 10):
+        queryset = LocationRollup.objects.filter(
+            granularity='hour',
+            max_latitude__gte=south, min_latitude__lte=north,
+            max_longitude__gte=west, min_longitude__lte=east,
+        )
+        if start is not None:
+            queryset = queryset.filter(bucket_start__gte=start)
+        if end is not None:
+            queryset = queryset.filter(bucket_start__lt=end)
+        rows = fetch_array(queryset.values_list('sum_latitude', 'sum_longitude', 'point_count'))
+        counts = np.maximum(rows[:, 2], 1)
+        return rows[:, 0] / counts, rows[:, 1] / counts, rows[:, 2]
+
+    queryset = Location.objects.filter(
+        latitude__gte=south, latitude__lte=north,
+        longitude__gte=west, longitude__lte=east,
+    )
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    # No ordering: the model's default would sort every fix in the tile by time
+    rows = fetch_array(queryset.order_by().annotate(
+        lat=Cast('latitude', FloatField()),
+        lng=Cast('longitude', FloatField()),
+    ).values_list('lat', 'lng'))
+    return rows[:, 0], rows[:, 1], np.ones(len(rows))
+
+
+def density(z, x, y, start=None, end=None, grid=JSON_GRID, margin=0):
+    """Weighted point counts binned on a grid x grid raster over the tile.
+
+    ``margin`` extra cells are binned on every side so a blur doesn't show
+    seams at tile edges. Row 0 is the tile's northern edge.
+    """
+    pad = margin / grid
+    lats, lngs, weights = _points(z, x, y, start, end, pad)
+    px, py = project(lats, lngs, z, x, y, extent=grid)
+    counts, _, _ = np.histogram2d(
+        py, px, bins=grid + 2 * margin,
+        range=[[-margin, grid + margin], [-margin, grid + margin]],
+        weights=weights,
+    )
+    return counts
+
+
+def _box_blur(values, radius):
+    """Separable box blur via cumulative sums, keeping the array shape"""
+    size = 2 * radius + 1
+    for axis in (0, 1):
+        padded = np.pad(values, [(radius + 1, radius) if a == axis else (0, 0) for a in (0, 1)])
+        summed = np.cumsum(padded, axis=axis)
+        values = (np.take(summed, range(size, summed.shape[axis]), axis=axis)
+                  - np.take(summed, range(0, summed.shape[axis] - size), axis=axis)) / size
+    return values
+
+
+def render_png(counts, scale):
+    """Blurred, log-scaled, colour-ramped RGBA tile as PNG bytes"""
+    values = _box_blur(_box_blur(counts, BLUR_CELLS), BLUR_CELLS)
+    values = values[2 * BLUR_CELLS:-2 * BLUR_CELLS, 2 * BLUR_CELLS:-2 * BLUR_CELLS]
+    intensity = np.clip(np.log1p(values) / np.log1p(scale), 0.0, 1.0)
+    rgba = np.stack([np.interp(intensity, RAMP_STOPS, RAMP_COLORS[:, c]) for c in range(4)], axis=-1)
+    rgba[values <= 1e-9] = 0
+    factor = TILE_SIZE // len(values)
+    rgba = rgba.astype(np.uint8).repeat(factor, axis=0).repeat(factor, axis=1)
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, 'RGBA').save(buffer, format='PNG', optimize=False)
+    return buffer.getvalue()
+
+
+def render_json(counts, z, x, y):
+    rows, cols = np.nonzero(counts)
+    return json.dumps({
+        'z': z, 'x': x, 'y': y,
+        'grid': len(counts),
+        'max': float(counts.max()) if counts.size else 0.0,
+        'cells': [[int(r), int(c), round(float(v), 3)] for r, c, v in zip(rows, cols, counts[rows, cols])],
+    }).encode()
+
+
+def heatmap_tile(z, x, y, fmt, start=None, end=None, scale=None):
+    """Rendered tile bytes, served from the tile cache when still valid.
+
+    The cache key includes the time range; a closed range can no longer
+    change, so its tiles are cached permanently (and on disk when
+    ``TILE_CACHE_DIR`` is set).
+    """
+    scale = scale or getattr(settings, 'HEATMAP_SATURATION', 50.0)
+    closed = is_closed_range(end)
+    key = ('heatmap', fmt, z, x, y,
+           start.timestamp() if start else None, end.timestamp() if end else None, scale)
+    tile = (z, x, y)
+
+    data = heatmap_cache.get(key, tile, closed=closed)
+    if data is None:
+        generation = heatmap_cache.generation(tile)
+        if fmt == 'png':
+            data = render_png(density(z, x, y, start, end, grid=RENDER_GRID, margin=2 * BLUR_CELLS), scale)
+        else:
+            data = render_json(density(z, x, y, start, end), z, x, y)
+        heatmap_cache.put(key, generation, data, closed=closed)
+    return data
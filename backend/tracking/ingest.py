@@ -0,0 +1,133 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .broadcast import broadcast_admin, send_to_group
+from .eta import route_progress
+from .geofence import check_location
+from .heartbeat import heartbeat_monitor
+from .heatmap import heatmap_cache
+from .mvt import mvt_cache
+from .serializers import LocationSerializer
+from .spatial import record_truck_position
+from .trip_stats import trip_stats
+
+
+class IngestPipeline:
+    """Everything a new fix sets off beyond its own insert.
+
+    ``location_saved`` hands each committed fix to ``submit``. Once the
+    process's event loop is up (``tracking.lifecycle``), fixes are queued
+    and a single worker thread takes them in batches of up to
+    ``INGEST_BATCH_SIZE``, so the request or socket that sent a fix only
+    pays for the insert, and a burst of fixes shares one position UPDATE per
+    truck and one query for the broadcast payloads. Fixes are handled in
+    arrival order. Without a running loop (management commands, tests, WSGI)
+    ``submit`` processes the fix on the spot.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._queue = None
+        self._executor = None
+        self._task = None
+
+    def start(self, loop):
+        if self._loop is loop:
+            return
+        self.stop()
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest')
+        self._task = loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._executor.shutdown(wait=False)
+        self._loop = self._queue = self._executor = self._task = None
+
+    def submit(self, location):
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            process_fixes([location])
+            return
+        loop.call_soon_threadsafe(self._queue.put_nowait, location)
+
+    async def _run(self):
+        batch_size = getattr(settings, 'INGEST_BATCH_SIZE', 200)
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._loop.run_in_executor(self._executor, self._process, batch)
+            except Exception as exc:
+                self._loop.call_exception_handler({'message': 'Processing location fixes failed', 'exception': exc})
+
+    def _process(self, batch):
+        try:
+            process_fixes(batch)
+        finally:
+            close_old_connections()
+
+
+ingest_pipeline = IngestPipeline()
+
+
+def process_fixes(locations):
+    # Only the newest fix of each truck moves its denormalized position
+    latest = {}
+    for location in locations:
+        current = latest.get(location.truck_id)
+        if current is None or location.timestamp >= current.timestamp:
+            latest[location.truck_id] = location
+    for location in latest.values():
+        record_truck_position(location)
+
+    for location in locations:
+        trip_stats.record_fix(location)
+        update_route_progress(location)
+        record_heartbeat(location)
+        check_location(location)
+        touch_tiles(float(location.latitude), float(location.longitude))
+    broadcast_locations(locations)
+
+
+def broadcast_locations(locations):
+    # Truck subscribers get location_broadcast frames, the admin dashboard gets every fix
+    from .models import Location
+
+    rows = Location.objects.filter(id__in=[location.id for location in locations]).select_related(
+        'truck__driver', 'driver',
+    )
+    by_id = {row.id: row for row in rows}
+    for location in locations:
+        row = by_id.get(location.id)
+        if row is None:
+            continue
+        data = LocationSerializer(row).data
+        send_to_group(f'truck_{row.truck_id}', {'type': 'location_broadcast', 'location': data})
+        broadcast_admin('location_update_admin', data)
+
+
+def touch_tiles(lat, lng):
+    heatmap_cache.touch(lat, lng)
+    mvt_cache.touch(lat, lng)
+
+
+def update_route_progress(location):
+    route_id = trip_stats.active_route_id(location.truck_id)
+    if route_id is None:
+        return
+    progress = route_progress.update(route_id, location)
+    if progress is not None:
+        broadcast_admin('route_progress_update', progress)
+
+
+def record_heartbeat(location):
+    route_id = trip_stats.active_route_id(location.truck_id)
+    if route_id is not None:
+        heartbeat_monitor.record_fix(location.truck_id, route_id, location.timestamp)
@@ -0,0 +1,62 @@
+"""Background work that runs for as long as the ASGI process does: the
+ingest pipeline (``tracking.ingest``) and the heartbeat wheel
+(``tracking.heartbeat``).
+
+``LifecycleMiddleware`` wraps the ASGI application and starts it on the
+server's event loop: at ``lifespan.startup`` on servers that send it, and
+otherwise with the first connection of any kind. Synchronous code that has
+to reach the loop (the channel layer, see ``tracking.broadcast``) finds it
+through ``event_loop``.
+"""
+import asyncio
+
+_loop = None
+
+
+def event_loop():
+    """The process's running event loop, or None outside an ASGI server"""
+    loop = _loop
+    return loop if loop is not None and loop.is_running() else None
+
+
+def start():
+    global _loop
+    loop = asyncio.get_running_loop()
+    if _loop is loop:
+        return
+    _loop = loop
+
+    from .heartbeat import heartbeat_monitor
+    from .ingest import ingest_pipeline
+
+    ingest_pipeline.start(loop)
+    heartbeat_monitor.start(loop)
+
+
+def stop():
+    global _loop
+    _loop = None
+
+    from .heartbeat import heartbeat_monitor
+    from .ingest import ingest_pipeline
+
+    ingest_pipeline.stop()
+    heartbeat_monitor.stop()
+
+
+class LifecycleMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        start()
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,63 @@
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from tracking.archive import archive_truck_day
+from tracking.models import Location, RollupWatermark
+from tracking.rollups import WATERMARK_NAME
+
+
+class Command(BaseCommand):
+    help = 'Move location fixes older than N days into compressed per-truck-per-day archive blocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=90, help='Archive whole UTC days before this age')
+        parser.add_argument('--truck', type=int, help='Only archive this truck id')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+
+    def handle(self, *args, **options):
+        # Only whole days that the rollup job has already folded in, so analytics keep their data
+        watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).values_list('last_location_id', flat=True).first()
+        if not watermark:
+            self.stdout.write(self.style.WARNING('No fixes have been rolled up yet; run rollup_locations first'))
+            return
+
+        today = timezone.now().astimezone(dt_timezone.utc).date()
+        cutoff = datetime.combine(today - timedelta(days=options['older_than_days']), dt_time.min, tzinfo=dt_timezone.utc)
+        days = Location.objects.filter(timestamp__lt=cutoff)
+        if options['truck']:
+            days = days.filter(truck_id=options['truck'])
+        days = days.annotate(day=TruncDate('timestamp', tzinfo=dt_timezone.utc)).values('truck_id', 'day').annotate(
+            fixes=Count('id')
+        ).order_by('day', 'truck_id')
+
+        started = time.perf_counter()
+        archived = blocks = skipped = 0
+        compressed_bytes = 0
+        for row in days:
+            if options['dry_run']:
+                self.stdout.write(f"truck {row['truck_id']} {row['day']}: {row['fixes']} fixes")
+                archived += row['fixes']
+                blocks += 1
+                continue
+            count, block = archive_truck_day(row['truck_id'], row['day'], watermark)
+            if block is None:
+                skipped += 1
+                continue
+            archived += count
+            blocks += 1
+            compressed_bytes += len(block.data)
+
+        elapsed = time.perf_counter() - started
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Would archive {archived} fixes into {blocks} truck-day blocks'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} fixes into {blocks} blocks ({compressed_bytes / 1024:.1f} KiB, '
+            f'{compressed_bytes / max(archived, 1):.1f} bytes/fix) in {elapsed:.1f}s; '
+            f'{skipped} days skipped (not yet rolled up)'
+        ))
@@ -0,0 +1,550 @@
+import asyncio
+import io
+import json
+import platform
+import statistics
+import tempfile
+import time
+import zlib
+from itertools import cycle, islice
+from pathlib import Path
+
+import django
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection
+from django.shortcuts import get_object_or_404
+from django.test import AsyncRequestFactory
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tracking import async_views, compression
+from tracking import urls as tracking_urls
+from tracking.broadcast import ADMIN_GROUP
+from tracking.heartbeat import TimerWheel
+from tracking.models import DeliveryRoute, Geofence, Location, RouteBid, RouteRequest, Truck
+from tracking.routing import websocket_urlpatterns
+from tracking.serializers import (
+    DeliveryRouteSerializer, LocationSerializer, RouteRequestSerializer,
+)
+from tracking.tiles import tile_for
+from tracking.views import position_data
+
+SIZES = (10, 1000, 10000)
+# State-changing one-shot actions, endless event streams and debugging views are not timed
+SKIPPED_VIEWS = {
+    'assign_driver', 'start_route', 'complete_route', 'accept_bid', 'reject_bid', 'withdraw_bid',
+    'truck_events', 'fleet_events', 'request_profiles', 'request_profile_detail',
+}
+# Timing differences below this are noise, whatever the ratio
+NOISE_FLOOR_MS = 2.0
+
+
+# Stop repeating a case once it has used this much time
+CASE_BUDGET_SECONDS = 5
+# In-flight requests, and requests per level, for the DRF/async comparison
+CONCURRENCY_LEVELS = (1, 8, 32)
+CONCURRENT_REQUESTS = 200
+# Trucks under watch for the heartbeat timer wheel
+HEARTBEAT_TRUCKS = (1000, 100000)
+
+
+# DRF baselines for the async views, from the same helpers
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def live_location_baseline(request, truck_id):
+    location = async_views.latest_location(truck_id).first()
+    driver_id = location.truck.driver_id if location else get_object_or_404(Truck, id=truck_id).driver_id
+    body, status = async_views.live_location_data(request.user, location, driver_id)
+    return Response(body, status=status)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def fleet_positions_baseline(request):
+    return Response([position_data(truck) for truck in async_views.fleet_positions(request.user)])
+
+
+class QueryCounter:
+    """execute_wrapper that counts statements (the debug query log stops at 9000)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _measure(run, repeat):
+    """(median ms, queries) of ``run``; the first run also counts the queries"""
+    queries = QueryCounter()
+    started = time.perf_counter()
+    with connection.execute_wrapper(queries):
+        run()
+    timings = [(time.perf_counter() - started) * 1000]
+    budget_end = time.perf_counter() + CASE_BUDGET_SECONDS
+    while len(timings) < repeat and time.perf_counter() < budget_end:
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), queries.count
+
+
+def _deflate_frames(frames, window_bits, context_takeover):
+    """Bytes on the wire for ``frames`` sent with permessage-deflate (RFC 7692) at zlib's default level"""
+    compressor = None
+    total = 0
+    for frame in frames:
+        if compressor is None or not context_takeover:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -window_bits, max(1, window_bits - 7))
+        # Each message ends with a sync flush whose trailing 00 00 ff ff is not sent
+        total += len(compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+    return total
+
+
+class Command(BaseCommand):
+    help = 'Time serializers, views and consumers on a throwaway test database and compare with a saved baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=['serializers', 'views', 'consumers', 'concurrency', 'compression', 'heartbeat'],
+                            help='Only run these groups')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per case; the median is reported')
+        parser.add_argument('--baseline', help='JSON file with earlier results to compare against')
+        parser.add_argument('--save', help='Write the results to this JSON file')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Fail when a case gets this much slower than the baseline (0.25 = 25%%)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.loads(Path(options['baseline']).read_text())['results']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f'Cannot read baseline {options["baseline"]}: {exc}')
+
+        groups = options['only'] or ['serializers', 'views', 'consumers', 'concurrency', 'compression', 'heartbeat']
+        setup_test_environment()
+        scratch = tempfile.TemporaryDirectory()
+        if connection.vendor == 'sqlite':
+            # Concurrent writers fail on SQLite's shared in-memory test database; on a file they wait their turn
+            connection.settings_dict['TEST']['NAME'] = str(Path(scratch.name) / 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.build_fixture(options['seed'])
+            results = {}
+            for group in groups:
+                self.stdout.write(self.style.MIGRATE_HEADING(group.capitalize()))
+                results.update(getattr(self, f'bench_{group}')(options['repeat']))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            scratch.cleanup()
+
+        if options['save']:
+            Path(options['save']).write_text(json.dumps({
+                'meta': {
+                    'created': timezone.now().isoformat(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                },
+                'results': results,
+            }, indent=2, sort_keys=True))
+            self.stdout.write(f'Saved {len(results)} results to {options["save"]}')
+
+        if baseline is not None:
+            self.compare(results, baseline, options['threshold'])
+
+    def build_fixture(self, seed):
+        call_command(
+            'populate_sample_data', trucks=20, days=7, fix_interval=300, route_requests=1000,
+            bids_per_request=3, seed=seed, stdout=io.StringIO(),
+        )
+        self.truck = Truck.objects.filter(truck_number__startswith='PERF').select_related('driver').first()
+        self.driver = self.truck.driver
+        self.admin = get_user_model().objects.get(username='admin')
+        self.route = DeliveryRoute.objects.filter(status='completed').first()
+        self.route_request = RouteRequest.objects.filter(status='open').first()
+        self.bid = RouteBid.objects.filter(driver=self.driver).first()
+        self.geofence = Geofence.objects.create(
+            name='Depot', kind='depot', center_latitude=self.truck.last_latitude,
+            center_longitude=self.truck.last_longitude, radius_m=500,
+        )
+        self.stdout.write(
+            f'Fixture: {Truck.objects.count()} trucks, {Location.objects.count()} locations, '
+            f'{RouteRequest.objects.count()} route requests, {RouteBid.objects.count()} bids'
+        )
+
+    def report(self, results, name, ms, queries):
+        results[name] = {'ms': round(ms, 3), 'queries': queries}
+        self.stdout.write(f'  {name:<58} {ms:10.2f} ms {"" if queries is None else f"{queries:6d} queries"}')
+
+    def bench_serializers(self, repeat):
+        """Serialization only: rows are fetched the way the views fetch them, then cycled up to each size"""
+        results = {}
+        cases = [
+            (LocationSerializer, Location.objects.select_related('truck__driver', 'driver')),
+            (RouteRequestSerializer, RouteRequestSerializer.with_bid_stats(RouteRequest.objects.all())),
+            (DeliveryRouteSerializer, DeliveryRoute.objects.select_related(
+                'truck__driver', 'driver', 'route_request__created_by', 'route_request__assigned_driver',
+                'route_request__assigned_truck__driver', 'accepted_bid__driver', 'accepted_bid__truck__driver',
+                'accepted_bid__route_request__created_by',
+            )),
+        ]
+        for serializer_class, queryset in cases:
+            rows = list(queryset[:max(SIZES)])
+            for size in SIZES:
+                instances = list(islice(cycle(rows), size))
+                ms, queries = _measure(lambda: serializer_class(instances, many=True).data, repeat)
+                self.report(results, f'serializer:{serializer_class.__name__}[{size}]', ms, queries)
+        return results
+
+    def view_cases(self):
+        """(url name, kwargs, method, query or body, user) for every view worth timing"""
+        z = 10
+        x, y = tile_for(self.truck.last_latitude, self.truck.last_longitude, z)
+        truck = {'truck_id': self.truck.id}
+        admin, driver = self.admin, self.driver
+        return [
+            ('truck_list_create', {}, 'get', {}, admin),
+            ('nearby_trucks', {}, 'get', {'lat': self.truck.last_latitude, 'lng': self.truck.last_longitude}, admin),
+            ('truck_detail', {'pk': self.truck.id}, 'get', {}, admin),
+            ('location_list_create', {}, 'get', {'truck_id': self.truck.id}, admin),
+            ('location_list_create', {}, 'post', {
+                'truck': self.truck.id, 'latitude': self.truck.last_latitude, 'longitude': self.truck.last_longitude,
+                'speed': 40, 'heading': 90, 'accuracy': 5,
+            }, driver),
+            ('truck_live_location', truck, 'get', {}, admin),
+            ('fleet_positions', {}, 'get', {}, admin),
+            ('truck_location_history', truck, 'get', {'limit': 100}, admin),
+            ('truck_location_export', truck, 'get', {}, admin),
+            ('truck_stops', truck, 'get', {}, admin),
+            ('route_list_create', {}, 'get', {}, admin),
+            ('route_detail', {'pk': self.route.id}, 'get', {}, admin),
+            ('route_summary', {'route_id': self.route.id}, 'get', {}, admin),
+            ('geofence_list_create', {}, 'get', {}, admin),
+            ('geofence_detail', {'pk': self.geofence.id}, 'get', {}, admin),
+            ('dashboard_data', {}, 'get', {}, admin),
+            ('fleet_kpis', {}, 'get', {}, admin),
+            ('truck_rollups', truck, 'get', {}, admin),
+            ('heatmap_tile', {'z': z, 'x': x, 'y': y, 'fmt': 'png'}, 'get', {}, admin),
+            ('vector_tile', {'z': z, 'x': x, 'y': y}, 'get', {}, admin),
+            ('route_request_list_create', {}, 'get', {}, admin),
+            ('route_request_detail', {'pk': self.route_request.id}, 'get', {}, admin),
+            ('route_bids', {'route_request_id': self.route_request.id}, 'get', {}, admin),
+            ('bid_list_create', {}, 'get', {}, driver),
+            ('bid_detail', {'pk': self.bid.id}, 'get', {}, driver),
+            ('available_routes', {}, 'get', {}, driver),
+        ]
+
+    def client_for(self, user):
+        clients = self.__dict__.setdefault('_clients', {})
+        if user.id not in clients:
+            # A real token: force_authenticate only reaches DRF views, not the async ones
+            clients[user.id] = APIClient()
+            clients[user.id].credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return clients[user.id]
+
+    def bench_views(self, repeat):
+        results = {}
+        cases = self.view_cases()
+        covered = {name for name, *_ in cases} | SKIPPED_VIEWS
+        missing = sorted(p.name for p in tracking_urls.urlpatterns if p.name not in covered)
+        if missing:
+            self.stdout.write(self.style.WARNING(f'  No benchmark case for: {", ".join(missing)}'))
+
+        for name, kwargs, method, data, user in cases:
+            client = self.client_for(user)
+            url = reverse(name, kwargs=kwargs)
+
+            def run():
+                if method == 'post':
+                    response = client.post(url, data, format='json')
+                else:
+                    response = client.get(url, data)
+                if response.status_code >= 400:
+                    raise CommandError(f'{name} returned {response.status_code}')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+
+            run()   # warm process-local caches the way live traffic would
+            ms, queries = _measure(run, repeat)
+            self.report(results, f'view:{method.upper()} {name}', ms, queries)
+        return results
+
+    def bench_consumers(self, repeat):
+        """Socket round trips through the real consumers; their queries run in worker threads and are not counted"""
+        payload = LocationSerializer(
+            Location.objects.select_related('truck__driver', 'driver').filter(truck=self.truck).first()
+        ).data
+        tokens = str(AccessToken.for_user(self.driver)), str(AccessToken.for_user(self.admin))
+        return asyncio.run(self._bench_consumers(max(repeat, 20), tokens, payload))
+
+    async def _bench_consumers(self, messages, tokens, payload):
+        results = {}
+        application = URLRouter(websocket_urlpatterns)
+        driver_token, admin_token = tokens
+        tracking_path = f'/ws/tracking/{self.truck.id}/?token={driver_token}'
+
+        timings = []
+        for _ in range(messages):
+            started = time.perf_counter()
+            communicator = WebsocketCommunicator(application, tracking_path)
+            connected, _ = await communicator.connect()
+            timings.append((time.perf_counter() - started) * 1000)
+            await communicator.disconnect()
+            if not connected:
+                raise CommandError('LocationTrackingConsumer refused the benchmark driver')
+        self.report(results, 'consumer:LocationTrackingConsumer connect', statistics.median(timings), None)
+
+        # A driver's fix: saved, broadcast on commit and echoed back on the truck socket
+        communicator = WebsocketCommunicator(application, tracking_path)
+        await communicator.connect()
+        timings = []
+        for i in range(messages):
+            started = time.perf_counter()
+            await communicator.send_json_to({
+                'type': 'location_update', 'latitude': 12.9 + i * 1e-4, 'longitude': 77.5, 'speed': 30,
+            })
+            while (await communicator.receive_json_from(timeout=5)).get('type') != 'location_update':
+                pass
+            timings.append((time.perf_counter() - started) * 1000)
+        await communicator.disconnect()
+        self.report(results, 'consumer:LocationTrackingConsumer location_update round trip',
+                    statistics.median(timings), None)
+
+        # Following every truck: a socket per truck, or one multiplexed socket
+        truck_ids = await sync_to_async(lambda: list(Truck.objects.values_list('id', flat=True)))()
+        timings = {'separate': [], 'multiplexed': []}
+        for _ in range(max(messages // 4, 3)):
+            started = time.perf_counter()
+            sockets = [WebsocketCommunicator(application, f'/ws/tracking/{truck_id}/?token={admin_token}')
+                       for truck_id in truck_ids]
+            for socket in sockets:
+                await socket.connect()
+            timings['separate'].append((time.perf_counter() - started) * 1000)
+            for socket in sockets:
+                await socket.disconnect()
+
+            started = time.perf_counter()
+            socket = WebsocketCommunicator(application, f'/ws/tracking/multi/?token={admin_token}')
+            await socket.connect()
+            await socket.send_json_to({'type': 'subscribe', 'trucks': truck_ids})
+            await socket.receive_json_from(timeout=5)
+            timings['multiplexed'].append((time.perf_counter() - started) * 1000)
+            await socket.disconnect()
+        for mode, mode_timings in timings.items():
+            self.report(results, f'consumer:follow {len(truck_ids)} trucks, {mode}', statistics.median(mode_timings), None)
+
+        # One admin update fanned out to many dashboards
+        channel_layer = get_channel_layer()
+        for sockets in (1, 50):
+            dashboards = [WebsocketCommunicator(application, f'/ws/admin/dashboard/?token={admin_token}')
+                          for _ in range(sockets)]
+            for dashboard in dashboards:
+                await dashboard.connect()
+            timings = []
+            for _ in range(messages):
+                started = time.perf_counter()
+                await channel_layer.group_send(ADMIN_GROUP, {'type': 'location_update_admin', 'data': payload})
+                for dashboard in dashboards:
+                    await dashboard.receive_from(timeout=5)
+                timings.append((time.perf_counter() - started) * 1000)
+            for dashboard in dashboards:
+                await dashboard.disconnect()
+            self.report(results, f'consumer:AdminDashboardConsumer fan-out to {sockets}', statistics.median(timings), None)
+        return results
+
+    def concurrency_cases(self):
+        """(name, DRF baseline, url name, kwargs, user) for the views served on the event loop"""
+        truck = {'truck_id': self.truck.id}
+        return [
+            ('live location', live_location_baseline, 'truck_live_location', truck, self.admin),
+            ('fleet positions', fleet_positions_baseline, 'fleet_positions', {}, self.admin),
+        ]
+
+    def bench_concurrency(self, repeat):
+        """The async views and their DRF baselines under the same concurrent load,
+        called the way Django's ASGI handler calls them.
+
+        Each request gets its own thread context, as under daphne: a DRF view
+        runs in a worker thread for its whole duration, an async view only
+        hands its queries to one. Middleware is left out of both.
+        """
+        cases = []
+        for name, sync_view, url_name, kwargs, user in self.concurrency_cases():
+            url = reverse(url_name, kwargs=kwargs)
+            cases.append((name, sync_view, resolve(url).func, url, kwargs, f'Bearer {AccessToken.for_user(user)}'))
+        return asyncio.run(self._bench_concurrency(cases))
+
+    async def _bench_concurrency(self, cases):
+        results = {}
+        factory = AsyncRequestFactory()
+        for name, sync_view, async_view, url, kwargs, authorization in cases:
+            headers = {'Authorization': authorization}
+
+            def make_request():
+                return factory.get(url, headers=headers)
+
+            def call_sync(request):
+                response = sync_view(request, **kwargs)
+                response.render()
+                return response
+
+            async def serve_sync():
+                return await sync_to_async(call_sync)(make_request())
+
+            async def serve_async():
+                return await async_view(make_request(), **kwargs)
+
+            for concurrency in CONCURRENCY_LEVELS:
+                throughput = {}
+                for mode, serve in (('drf', serve_sync), ('async', serve_async)):
+                    await self._load(serve, 1, 5)   # warm up
+                    latencies, errors, wall = await self._load(serve, concurrency, CONCURRENT_REQUESTS)
+                    p50 = statistics.median(latencies)
+                    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                    throughput[mode] = len(latencies) / wall
+                    key = f'concurrency:{name} {mode} x{concurrency}'
+                    results[key] = {'ms': round(p50, 3), 'p99_ms': round(p99, 3),
+                                    'rps': round(throughput[mode], 1), 'errors': errors, 'queries': None}
+                    self.stdout.write(
+                        f'  {key:<44} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms  {throughput[mode]:8.1f} req/s'
+                        + (self.style.ERROR(f'  {errors} errors') if errors else '')
+                    )
+                self.stdout.write(f'    async/drf throughput x{concurrency}: '
+                                  f'{throughput["async"] / throughput["drf"]:.2f}x')
+        return results
+
+    async def _load(self, serve, concurrency, requests):
+        """(sorted latencies in ms, error responses, wall seconds) for ``requests`` calls, ``concurrency`` at a time"""
+        semaphore = asyncio.Semaphore(concurrency)
+        errors = 0
+
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                async with ThreadSensitiveContext():
+                    started = time.perf_counter()
+                    response = await serve()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    # What the handler does at request_finished, in the request's own thread
+                    await sync_to_async(close_old_connections)()
+            if response.status_code >= 400:
+                errors += 1
+            return elapsed
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(one() for _ in range(requests)))
+        return sorted(latencies), errors, time.perf_counter() - started
+
+    def bench_compression(self, repeat):
+        """Bytes saved against compression CPU time, on the bodies the views return and on socket frames"""
+        results = {}
+        payloads = []
+        for name, kwargs, method, data, user in self.view_cases():
+            if method != 'get':
+                continue
+            response = self.client_for(user).get(reverse(name, kwargs=kwargs), data)
+            if response.get('Content-Type', '').startswith(compression.SKIP_CONTENT_TYPES):
+                continue
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            payloads.append((f'view:{name}', body))
+
+        threshold = getattr(settings, 'COMPRESSION_MIN_BYTES', 1024)
+        for name, body in sorted(payloads, key=lambda payload: len(payload[1])):
+            line = f'  {name:<34} {len(body):>9} B'
+            if len(body) < threshold:
+                self.stdout.write(line + '  (under COMPRESSION_MIN_BYTES, sent as is)')
+                continue
+            for encoding in compression.supported_encodings():
+                ms, _ = _measure(lambda: compression.compress(body, encoding), repeat)
+                size = len(compression.compress(body, encoding))
+                results[f'compression:{name} {encoding}'] = {
+                    'ms': round(ms, 3), 'bytes': size, 'raw_bytes': len(body), 'queries': None,
+                }
+                line += f'  {encoding:>4} {size:>8} B ({100 - size * 100 / len(body):4.1f}% saved, {ms:7.3f} ms)'
+            self.stdout.write(line)
+
+        # Location updates as the truck socket sends them, one frame per fix
+        locations = Location.objects.filter(truck=self.truck).select_related('truck__driver', 'driver')[:200]
+        frames = [
+            json.dumps({'type': 'location_update', 'location': LocationSerializer(location).data},
+                       cls=DjangoJSONEncoder).encode()
+            for location in locations
+        ]
+        raw = sum(len(frame) for frame in frames)
+        window_bits = getattr(settings, 'WEBSOCKET_COMPRESSION_WINDOW_BITS', 12)
+        for context_takeover in (True, False):
+            started = time.perf_counter()
+            size = _deflate_frames(frames, window_bits, context_takeover)
+            ms = (time.perf_counter() - started) * 1000 / len(frames)
+            name = f'websocket:permessage-deflate {"" if context_takeover else "no "}context takeover'
+            results[f'compression:{name}'] = {
+                'ms': round(ms, 4), 'bytes': size, 'raw_bytes': raw, 'queries': None,
+            }
+            self.stdout.write(
+                f'  {name:<52} {raw / len(frames):7.0f} -> {size / len(frames):5.0f} B per frame '
+                f'({100 - size * 100 / raw:4.1f}% saved, {ms:6.3f} ms per frame)'
+            )
+        return results
+
+    def bench_heartbeat(self, repeat):
+        """Timer wheel cost per fix (re-arm) and per tick, independent of how many trucks are watched"""
+        results = {}
+        offline_ticks = getattr(settings, 'HEARTBEAT_OFFLINE_SECONDS', 120)
+        for trucks in HEARTBEAT_TRUCKS:
+            wheel = TimerWheel()
+            for truck_id in range(trucks):
+                wheel.schedule(truck_id, offline_ticks + truck_id % 60)
+
+            def fixes():
+                # A round of fixes spread over the fleet, each pushing its truck's deadline out
+                for truck_id in range(0, trucks, max(1, trucks // 1000)):
+                    wheel.schedule(truck_id, wheel.now + offline_ticks)
+            ms, _ = _measure(fixes, repeat)
+            self.report(results, f'heartbeat:re-arm 1000 trucks of {trucks}', ms, None)
+
+            # Every truck goes silent: one tick at a time until all have fired
+            started = time.perf_counter()
+            fired = ticks = 0
+            while len(wheel):
+                ticks += 1
+                fired += len(wheel.advance(wheel.now + 1))
+            ms = (time.perf_counter() - started) * 1000
+            self.report(results, f'heartbeat:expire {fired} trucks over {ticks} ticks', ms, None)
+        return results
+
+    def compare(self, results, baseline, threshold):
+        regressions = []
+        for name, current in sorted(results.items()):
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            if previous.get('queries') is not None and current['queries'] is not None \
+                    and current['queries'] > previous['queries']:
+                regressions.append(f'{name}: {previous["queries"]} -> {current["queries"]} queries')
+            slower = current['ms'] - previous['ms']
+            if slower > NOISE_FLOOR_MS and current['ms'] > previous['ms'] * (1 + threshold):
+                regressions.append(f'{name}: {previous["ms"]:.2f} -> {current["ms"]:.2f} ms '
+                                   f'(+{slower / previous["ms"] * 100:.0f}%)')
+
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions beyond {threshold * 100:.0f}% against the baseline'))
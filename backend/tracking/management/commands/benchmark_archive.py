@@ -0,0 +1,93 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from tracking.archive import COLUMNS, compress, decode_columns, decompress, encode_columns, zstandard
+from tracking.models import Location, LocationArchiveBlock
+
+# Approximate on-disk cost of one Location row on PostgreSQL: heap tuple plus
+# its primary key, (truck, timestamp), truck and driver index entries
+ROW_BYTES_ESTIMATE = 180
+
+
+def synthetic_day(rng, interval):
+    """One truck-day of fixes every ``interval`` seconds: driving with stops, GPS noise"""
+    n = 86400 // interval
+    moving = np.repeat(rng.random(n // 120 + 1) < 0.6, 120)[:n]
+    speed = np.where(moving, rng.normal(55, 12, n).clip(5, 110), rng.random(n) * 2)
+    heading = np.cumsum(rng.normal(0, 4, n)) % 360
+    step = speed / 3.6 * interval / 111320
+    lat = 12.9 + np.cumsum(step * np.cos(np.radians(heading))) + rng.normal(0, 2e-5, n)
+    lng = 77.5 + np.cumsum(step * np.sin(np.radians(heading))) + rng.normal(0, 2e-5, n)
+    return {
+        'id': np.cumsum(rng.integers(1, 400, n)),   # ids interleave with other trucks
+        'driver_id': np.full(n, 7),
+        'timestamp_us': 1_700_000_000_000_000 + np.cumsum(rng.normal(interval, 0.3, n) * 1e6).astype(np.int64),
+        'latitude': np.round(lat * 1e7).astype(np.int64),
+        'longitude': np.round(lng * 1e7).astype(np.int64),
+        'speed': np.round(speed * 100).astype(np.int64),
+        'heading': np.round(heading * 100).astype(np.int64),
+        'accuracy': np.round(rng.uniform(3, 15, n) * 100).astype(np.int64),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measure compression ratio and decode speed of location archive blocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=20, help='Synthetic truck-days to encode')
+        parser.add_argument('--interval', type=int, default=5, help='Seconds between synthetic fixes')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        days = [synthetic_day(rng, options['interval']) for _ in range(options['days'])]
+        fixes = sum(len(day['id']) for day in days)
+        row_bytes = self.row_bytes()
+        self.stdout.write(f'{len(days)} synthetic truck-days, {fixes} fixes, ~{row_bytes} bytes per Location row')
+
+        codecs = ['zlib'] + (['zstd'] if zstandard is not None else [])
+        for codec in codecs:
+            started = time.perf_counter()
+            blocks = [compress(encode_columns(day), codec)[1] for day in days]
+            encode_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for block in blocks:
+                decoded = decode_columns(decompress(codec, block))
+            decode_s = time.perf_counter() - started
+
+            compressed = sum(len(block) for block in blocks)
+            assert all(np.array_equal(decoded[name], days[-1][name]) for name, _ in COLUMNS)
+            self.stdout.write(
+                f'{codec}: {compressed / fixes:.2f} bytes/fix, '
+                f'ratio {fixes * row_bytes / compressed:.0f}x vs rows, '
+                f'encode {fixes / encode_s / 1e6:.2f} M fixes/s, '
+                f'decode {fixes / decode_s / 1e6:.2f} M fixes/s ({decode_s / len(days) * 1000:.2f} ms/day)'
+            )
+
+        stored = LocationArchiveBlock.objects.count()
+        if stored:
+            sample = list(LocationArchiveBlock.objects.order_by('?')[:50])
+            started = time.perf_counter()
+            for block in sample:
+                decode_columns(decompress(block.codec, block.data))
+            decode_s = time.perf_counter() - started
+            points = sum(block.point_count for block in sample)
+            size = sum(len(block.data) for block in sample)
+            self.stdout.write(
+                f'Stored blocks: {stored}; sample of {len(sample)}: {size / points:.2f} bytes/fix, '
+                f'decode {points / decode_s / 1e6:.2f} M fixes/s'
+            )
+
+    def row_bytes(self):
+        """Measured bytes per Location row on PostgreSQL when there is data, else the estimate"""
+        if connection.vendor == 'postgresql':
+            count = Location.objects.count()
+            if count:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_total_relation_size('locations')")
+                    return cursor.fetchone()[0] // count
+        return ROW_BYTES_ESTIMATE
@@ -0,0 +1,70 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from tracking.geofence import CircleFence, GeofenceEngine, PolygonFence
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-fix cost of geofence evaluation with synthetic fences'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fences', type=int, default=5000)
+        parser.add_argument('--fixes', type=int, default=100000)
+        parser.add_argument('--trucks', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Roughly the size of a large metro area plus surroundings
+        min_lat, max_lat = 12.5, 13.5
+        min_lng, max_lng = 77.0, 78.0
+
+        fences = []
+        for i in range(options['fences']):
+            lat = rng.uniform(min_lat, max_lat)
+            lng = rng.uniform(min_lng, max_lng)
+            if i % 2:
+                fences.append(CircleFence(f'fence:{i}', f'Fence {i}', 'other', lat, lng, rng.uniform(50, 1000)))
+            else:
+                size = rng.uniform(0.001, 0.01)
+                vertices = [
+                    (lat + size * rng.uniform(0.5, 1) * dlat, lng + size * rng.uniform(0.5, 1) * dlng)
+                    for dlat, dlng in ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+                ]
+                fences.append(PolygonFence(f'fence:{i}', f'Fence {i}', 'other', vertices))
+
+        engine = GeofenceEngine()
+        started = time.perf_counter()
+        engine.load(fences)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        # Trucks drift in small steps so some fixes cross fence boundaries
+        positions = [[rng.uniform(min_lat, max_lat), rng.uniform(min_lng, max_lng)] for _ in range(options['trucks'])]
+        fixes = []
+        for _ in range(options['fixes']):
+            truck_id = rng.randrange(len(positions))
+            position = positions[truck_id]
+            position[0] += rng.uniform(-0.002, 0.002)
+            position[1] += rng.uniform(-0.002, 0.002)
+            fixes.append((truck_id, position[0], position[1]))
+
+        timings = []
+        transitions = 0
+        process_fix = engine.process_fix
+        clock = time.perf_counter_ns
+        for truck_id, lat, lng in fixes:
+            started = clock()
+            entered, exited = process_fix(truck_id, lat, lng)
+            timings.append(clock() - started)
+            transitions += len(entered) + len(exited)
+
+        timings.sort()
+        self.stdout.write(f'Fences: {len(fences)} (index built in {build_ms:.1f} ms, {len(engine._index.cells)} cells)')
+        self.stdout.write(f'Fixes: {len(fixes)}, transitions: {transitions}')
+        self.stdout.write(f'Mean: {statistics.fmean(timings) / 1000:.2f} µs/fix')
+        self.stdout.write(f'p50:  {timings[len(timings) // 2] / 1000:.2f} µs')
+        self.stdout.write(f'p99:  {timings[int(len(timings) * 0.99)] / 1000:.2f} µs')
+        self.stdout.write(f'Max:  {timings[-1] / 1000:.2f} µs')
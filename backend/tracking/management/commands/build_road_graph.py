@@ -0,0 +1,34 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.roadgraph import build_graph
+
+
+class Command(BaseCommand):
+    help = 'Build the routing graph from a GeoJSON road extract (LineString features)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('geojson', help='GeoJSON FeatureCollection of road LineStrings')
+        parser.add_argument('--output', default=None, help='Graph directory (defaults to ROAD_GRAPH_PATH)')
+        parser.add_argument('--landmarks', type=int, default=8, help='ALT landmarks to precompute')
+
+    def handle(self, *args, **options):
+        output = options['output'] or getattr(settings, 'ROAD_GRAPH_PATH', None)
+        if not output:
+            raise CommandError('No --output given and ROAD_GRAPH_PATH is not set')
+
+        try:
+            with open(options['geojson']) as f:
+                collection = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {options["geojson"]}: {e}')
+
+        started = time.perf_counter()
+        nodes, edges = build_graph(collection.get('features', []), output, options['landmarks'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {nodes} nodes and {edges} edges to {output} in {elapsed:.1f}s'
+        ))
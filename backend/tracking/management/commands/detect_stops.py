@@ -0,0 +1,46 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from tracking.models import Truck
+from tracking.stops import truck_stops
+from tracking.views import parse_time_param
+
+
+class Command(BaseCommand):
+    help = 'Detect stops and dwell times for every truck in the fleet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='Start date/datetime (ISO 8601)')
+        parser.add_argument('--to', dest='end', help='End date/datetime (ISO 8601, exclusive)')
+        parser.add_argument('--radius', type=float, default=100.0, help='Stop radius in metres')
+        parser.add_argument('--min-duration', type=float, default=300.0, help='Minimum stop duration in seconds')
+        parser.add_argument('--output', help='Write all stops as JSON to this file')
+
+    def handle(self, *args, **options):
+        try:
+            start = parse_time_param(options['start'])
+            end = parse_time_param(options['end'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        results = {}
+        total_stops = 0
+        started = time.perf_counter()
+        for truck_id, truck_number in Truck.objects.values_list('id', 'truck_number').order_by('id'):
+            stops = truck_stops(truck_id, start, end, options['radius'], options['min_duration'])
+            results[truck_number] = stops
+            total_stops += len(stops)
+            dwell_hours = sum(stop['dwell_seconds'] for stop in stops) / 3600
+            self.stdout.write(f'{truck_number}: {len(stops)} stops, {dwell_hours:.1f} h dwell')
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, cls=DjangoJSONEncoder, indent=2)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Found {total_stops} stops across {len(results)} trucks in {elapsed:.1f}s'
+        ))
@@ -1,17 +1,61 @@
-from django.core.management.base import BaseCommand
+import io
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
-from tracking.models import Truck, Location, DeliveryRoute
-from datetime import datetime, timedelta
-import random
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from tracking.geo import geohash_encode, haversine_km
+from tracking.models import Truck, Location, DeliveryRoute, RouteRequest, RouteBid
+from tracking.roadgraph import encode_polyline
+from tracking.spatial import GEOHASH_PRECISION
 
 User = get_user_model()
 
+# Depots the generated fleet is spread around (lat, lng)
+CITIES = [
+    ('Bengaluru, KA', 12.9716, 77.5946),
+    ('Chennai, TN', 13.0827, 80.2707),
+    ('Hyderabad, TS', 17.3850, 78.4867),
+    ('Mumbai, MH', 19.0760, 72.8777),
+    ('Pune, MH', 18.5204, 73.8567),
+    ('Delhi, DL', 28.7041, 77.1025),
+    ('Kolkata, WB', 22.5726, 88.3639),
+    ('Ahmedabad, GJ', 23.0225, 72.5714),
+    ('Jaipur, RJ', 26.9124, 75.7873),
+    ('Kochi, KL', 9.9312, 76.2673),
+]
+TRUCK_TYPES = ['mini', 'small', 'medium', 'large', 'heavy']
+LOCATION_COLUMNS = ('truck_id', 'driver_id', 'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'timestamp')
+
+
 class Command(BaseCommand):
     help = 'Populate the database with sample data for testing'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--trucks', type=int, default=0, help='Generate a synthetic fleet of this many trucks')
+        parser.add_argument('--drivers', type=int, help='Synthetic drivers (default: one per truck)')
+        parser.add_argument('--days', type=int, default=7, help='Days of location history per truck')
+        parser.add_argument('--fix-interval', type=int, default=30, help='Seconds between fixes while on shift')
+        parser.add_argument('--route-requests', type=int, default=0, help='Synthetic route requests')
+        parser.add_argument('--bids-per-request', type=int, default=5, help='Bids placed on each route request')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per bulk insert')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data')
+
     def handle(self, *args, **options):
         self.stdout.write('Creating sample data...')
+        admin_user = self.create_sample_data()
+
+        if options['trucks'] or options['route_requests']:
+            if options['fix_interval'] < 1 or options['batch_size'] < 1:
+                raise CommandError('--fix-interval and --batch-size must be positive')
+            self.generate(admin_user, options)
 
+    def create_sample_data(self):
         # Create sample users
         admin_user, created = User.objects.get_or_create(
             username='admin',
@@ -66,7 +110,7 @@ class Command(BaseCommand):
                 self.stdout.write(f'Created truck: {truck.truck_number}')
             trucks.append(truck)
 
-        # Create sample delivery routes
+        # Create sample delivery routes, each from an accepted bid on a route request
         route_data = [
             {
                 'start_location': 'New York, NY',
@@ -88,24 +132,54 @@ class Command(BaseCommand):
             },
         ]
 
+        now = timezone.now()
         for i, data in enumerate(route_data):
             if i < len(trucks) and i < len(drivers):
-                route, created = DeliveryRoute.objects.get_or_create(
+                if DeliveryRoute.objects.filter(
+                    truck=trucks[i], start_location=data['start_location'], end_location=data['end_location']
+                ).exists():
+                    continue
+                route_request = RouteRequest.objects.create(
+                    title=f"{data['start_location']} to {data['end_location']}",
+                    start_location=data['start_location'],
+                    end_location=data['end_location'],
+                    start_latitude=data['start_lat'],
+                    start_longitude=data['start_lng'],
+                    end_latitude=data['end_lat'],
+                    end_longitude=data['end_lng'],
+                    budget_min=20000,
+                    budget_max=40000,
+                    pickup_deadline=now + timedelta(days=1),
+                    delivery_deadline=now + timedelta(days=3),
+                    status='in_progress' if i == 0 else 'assigned',
+                    created_by=admin_user,
+                    assigned_driver=drivers[i],
+                    assigned_truck=trucks[i],
+                )
+                bid = RouteBid.objects.create(
+                    route_request=route_request,
+                    driver=drivers[i],
+                    truck=trucks[i],
+                    bid_amount=30000,
+                    estimated_pickup_time=now + timedelta(hours=12),
+                    estimated_delivery_time=now + timedelta(days=2),
+                    status='accepted',
+                )
+                route = DeliveryRoute.objects.create(
+                    route_request=route_request,
+                    accepted_bid=bid,
                     truck=trucks[i],
                     driver=drivers[i],
                     start_location=data['start_location'],
                     end_location=data['end_location'],
-                    defaults={
-                        'start_latitude': data['start_lat'],
-                        'start_longitude': data['start_lng'],
-                        'end_latitude': data['end_lat'],
-                        'end_longitude': data['end_lng'],
-                        'status': 'in_progress' if i == 0 else 'pending',
-                        'started_at': datetime.now() - timedelta(hours=2) if i == 0 else None,
-                    }
+                    start_latitude=data['start_lat'],
+                    start_longitude=data['start_lng'],
+                    end_latitude=data['end_lat'],
+                    end_longitude=data['end_lng'],
+                    status='in_progress' if i == 0 else 'pending',
+                    started_at=now - timedelta(hours=2) if i == 0 else None,
                 )
-                if created:
-                    self.stdout.write(f'Created route: {route.start_location} → {route.end_location}')
+                self.stdout.write(f'Created route: {route.start_location} → {route.end_location}')
 
         # Note: No static location data created - only live tracking
 
@@ -114,3 +188,248 @@ class Command(BaseCommand):
         self.stdout.write('Login credentials:')
         self.stdout.write('Admin: admin / admin123')
         self.stdout.write('Drivers: driver1 / driver123, driver2 / driver123, driver3 / driver123')
+        return admin_user
+
+    def generate(self, admin_user, options):
+        """Synthetic fleet, location history and bidding data for performance work"""
+        rng = np.random.default_rng(options['seed'])
+        started = time.perf_counter()
+        driver_count = options['drivers'] if options['drivers'] is not None else options['trucks']
+
+        drivers = self.generate_drivers(driver_count)
+        trucks = self.generate_trucks(options['trucks'], drivers, rng)
+        self.stdout.write(f'{len(drivers)} synthetic drivers (password driver123), {len(trucks)} trucks')
+
+        if trucks and options['days'] > 0:
+            fixes = self.generate_locations(trucks, options['days'], options['fix_interval'], options['batch_size'], rng)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{fixes} locations in {elapsed:.1f}s ({fixes / max(elapsed, 1e-9):.0f} rows/s)')
+
+        if options['route_requests']:
+            bidders = [truck for truck in trucks if truck.driver_id is not None]
+            if not bidders:
+                raise CommandError('Route requests need synthetic trucks with drivers to bid (--trucks)')
+            bids = self.generate_route_requests(
+                admin_user, bidders, options['route_requests'], options['bids_per_request'], options['days'], rng
+            )
+            self.stdout.write(f'{options["route_requests"]} route requests with {bids} bids')
+
+        self.stdout.write(self.style.SUCCESS(f'Synthetic data generated in {time.perf_counter() - started:.1f}s'))
+
+    def generate_drivers(self, count):
+        # Hashing once keeps thousands of users quick to create
+        password = make_password('driver123')
+        User.objects.bulk_create([
+            User(username=f'perfdriver{i}', email=f'perfdriver{i}@example.com', role='driver',
+                 phone_number=f'555-{i:06d}', password=password)
+            for i in range(count)
+        ], ignore_conflicts=True)
+        drivers = User.objects.filter(username__startswith='perfdriver', role='driver').in_bulk(field_name='username')
+        return [drivers[f'perfdriver{i}'] for i in range(count)]
+
+    def generate_trucks(self, count, drivers, rng):
+        Truck.objects.bulk_create([
+            Truck(
+                truck_number=f'PERF{i:05d}',
+                license_plate=f'PF-{i:06d}',
+                model='Synthetic',
+                truck_type=TRUCK_TYPES[i % len(TRUCK_TYPES)],
+                capacity_tons=Decimal(int(rng.integers(1, 40))),
+                driver=drivers[i] if i < len(drivers) else None,
+                status='active',
+            )
+            for i in range(count)
+        ], ignore_conflicts=True)
+        trucks = Truck.objects.filter(truck_number__startswith='PERF').in_bulk(field_name='truck_number')
+        return [trucks[f'PERF{i:05d}'] for i in range(count)]
+
+    def generate_locations(self, trucks, days, interval, batch_size, rng):
+        """Day shifts of driving and stops for every truck, ending yesterday"""
+        today = timezone.now().astimezone(dt_timezone.utc).date()
+        first_day = today - timedelta(days=days)
+        fallback_driver = trucks[0].driver_id or User.objects.filter(role='driver').values_list('id', flat=True).first()
+        use_copy = connection.vendor == 'postgresql'
+
+        total = 0
+        pending = []
+        last_fix = {}
+        for index, truck in enumerate(trucks):
+            _, home_lat, home_lng = CITIES[index % len(CITIES)]
+            lat, lng = home_lat + rng.normal(0, 0.05), home_lng + rng.normal(0, 0.05)
+            driver_id = truck.driver_id or fallback_driver
+            for offset in range(days):
+                day = first_day + timedelta(days=offset)
+                columns = self.shift(rng, day, interval, lat, lng, home_lat, home_lng)
+                lat, lng = columns['latitude'][-1], columns['longitude'][-1]
+                last_fix[truck.id] = (lat, lng, columns['timestamp'][-1])
+                pending.extend(zip(
+                    [truck.id] * len(columns['timestamp']),
+                    [driver_id] * len(columns['timestamp']),
+                    columns['latitude'].tolist(),
+                    columns['longitude'].tolist(),
+                    columns['speed'].tolist(),
+                    columns['heading'].tolist(),
+                    columns['accuracy'].tolist(),
+                    columns['timestamp'],
+                ))
+                if len(pending) >= batch_size:
+                    total += self.insert_locations(pending, batch_size, use_copy)
+                    pending = []
+            if (index + 1) % 100 == 0:
+                self.stdout.write(f'  {index + 1}/{len(trucks)} trucks, {total + len(pending)} fixes')
+        total += self.insert_locations(pending, batch_size, use_copy)
+
+        # Bulk inserts skip the post_save hooks, so set the denormalized positions here
+        for truck_id, (lat, lng, at) in last_fix.items():
+            Truck.objects.filter(pk=truck_id).update(
+                last_latitude=lat,
+                last_longitude=lng,
+                last_geohash=geohash_encode(lat, lng, GEOHASH_PRECISION),
+                last_location_at=at,
+            )
+        return total
+
+    def shift(self, rng, day, interval, lat, lng, home_lat, home_lng):
+        """Columns for one driving shift: blocks of moving and stopped, heading back towards the depot"""
+        start = datetime.combine(day, dt_time(hour=5), tzinfo=dt_timezone.utc) + timedelta(seconds=float(rng.uniform(0, 7200)))
+        n = max(int(rng.uniform(8, 12) * 3600) // interval, 2)
+        block = max(600 // interval, 1)   # ~10 minute stretches of driving or standing
+        moving = np.repeat(rng.random(n // block + 1) < 0.7, block)[:n]
+        speed = np.where(moving, rng.normal(50, 12, n).clip(5, 100), 0.0)
+
+        towards_home = np.degrees(np.arctan2(home_lng - lng, home_lat - lat))
+        heading = (towards_home + rng.normal(0, 90) + np.cumsum(rng.normal(0, 3, n))) % 360
+        step = speed / 3.6 * interval / 111320
+        lats = lat + np.cumsum(step * np.cos(np.radians(heading))) + rng.normal(0, 3e-5, n)
+        lngs = lng + np.cumsum(step * np.sin(np.radians(heading))) / np.cos(np.radians(lat)) + rng.normal(0, 3e-5, n)
+
+        seconds = np.arange(n) * interval + rng.uniform(-1, 1, n).clip(-interval / 3, interval / 3)
+        return {
+            'timestamp': [start + timedelta(seconds=float(s)) for s in seconds],
+            'latitude': np.round(lats, 7),
+            'longitude': np.round(lngs, 7),
+            'speed': np.round(speed, 2),
+            'heading': np.round(heading, 2),
+            'accuracy': np.round(rng.uniform(3, 15, n), 2),
+        }
+
+    def insert_locations(self, rows, batch_size, use_copy):
+        if not rows:
+            return 0
+        with transaction.atomic():
+            if use_copy:
+                self.copy_locations(rows)
+            else:
+                Location.objects.bulk_create(
+                    [Location(**dict(zip(LOCATION_COLUMNS, row))) for row in rows], batch_size=batch_size
+                )
+        return len(rows)
+
+    def copy_locations(self, rows):
+        """PostgreSQL COPY, several times faster than multi-row INSERTs"""
+        sql = f'COPY locations ({", ".join(LOCATION_COLUMNS)}) FROM STDIN'
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy'):   # psycopg 3
+                with raw.copy(sql) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:   # psycopg2
+                buffer = io.StringIO()
+                for row in rows:
+                    buffer.write('\t'.join(value.isoformat() if isinstance(value, datetime) else str(value)
+                                           for value in row) + '\n')
+                buffer.seek(0)
+                raw.copy_expert(sql, buffer)
+
+    def generate_route_requests(self, admin_user, trucks, count, bids_per_request, days, rng):
+        """Route requests spread over the history window; older ones are assigned and delivered"""
+        now = timezone.now()
+        requests = []
+        for i in range(count):
+            origin, destination = rng.choice(len(CITIES), size=2, replace=False)
+            start_name, start_lat, start_lng = CITIES[origin]
+            end_name, end_lat, end_lng = CITIES[destination]
+            waypoints = [
+                (start_lat + (end_lat - start_lat) * t + rng.normal(0, 0.05),
+                 start_lng + (end_lng - start_lng) * t + rng.normal(0, 0.05))
+                for t in np.linspace(0, 1, 12)
+            ]
+            distance = haversine_km(start_lat, start_lng, end_lat, end_lng) * 1.25
+            budget = Decimal(round(distance * rng.uniform(40, 60), -2))
+            posted = now - timedelta(days=float(rng.uniform(0, max(days, 1))))
+            requests.append(RouteRequest(
+                title=f'Load {i}: {start_name} to {end_name}',
+                start_location=start_name,
+                end_location=end_name,
+                start_latitude=round(start_lat, 7),
+                start_longitude=round(start_lng, 7),
+                end_latitude=round(end_lat, 7),
+                end_longitude=round(end_lng, 7),
+                material_type=RouteRequest.MATERIAL_TYPE_CHOICES[i % len(RouteRequest.MATERIAL_TYPE_CHOICES)][0],
+                estimated_weight_tons=Decimal(int(rng.integers(1, 30))),
+                distance_km=round(Decimal(distance), 2),
+                route_polyline=encode_polyline(waypoints),
+                budget_min=budget,
+                budget_max=budget * 2,
+                pickup_deadline=posted + timedelta(days=1),
+                delivery_deadline=posted + timedelta(days=3),
+                # Requests whose delivery deadline has passed have been awarded and delivered
+                status='completed' if posted + timedelta(days=3) < now else 'open',
+                created_by=admin_user,
+            ))
+        requests = RouteRequest.objects.bulk_create(requests, batch_size=1000)
+
+        bids = []
+        for request in requests:
+            chosen = rng.choice(len(trucks), size=min(bids_per_request, len(trucks)), replace=False)
+            for rank, truck_index in enumerate(chosen):
+                truck = trucks[truck_index]
+                if request.status == 'completed':
+                    status = 'accepted' if rank == 0 else 'rejected'
+                else:
+                    status = 'withdrawn' if rng.random() < 0.05 else 'pending'
+                bids.append(RouteBid(
+                    route_request=request,
+                    driver_id=truck.driver_id,
+                    truck=truck,
+                    bid_amount=(request.budget_min * Decimal(str(round(rng.uniform(1, 2), 2)))).quantize(Decimal('0.01')),
+                    estimated_pickup_time=request.pickup_deadline - timedelta(hours=float(rng.uniform(1, 12))),
+                    estimated_delivery_time=request.delivery_deadline - timedelta(hours=float(rng.uniform(1, 12))),
+                    status=status,
+                ))
+        bids = RouteBid.objects.bulk_create(bids, batch_size=1000)
+
+        routes = []
+        awarded = {}
+        for bid in bids:
+            if bid.status == 'accepted':
+                awarded[bid.route_request_id] = bid
+        for request in requests:
+            bid = awarded.get(request.id)
+            if bid is None:
+                continue
+            request.assigned_driver_id = bid.driver_id
+            request.assigned_truck_id = bid.truck_id
+            routes.append(DeliveryRoute(
+                route_request=request,
+                accepted_bid=bid,
+                truck_id=bid.truck_id,
+                driver_id=bid.driver_id,
+                start_location=request.start_location,
+                end_location=request.end_location,
+                start_latitude=request.start_latitude,
+                start_longitude=request.start_longitude,
+                end_latitude=request.end_latitude,
+                end_longitude=request.end_longitude,
+                status='completed',
+                started_at=bid.estimated_pickup_time,
+                completed_at=bid.estimated_delivery_time,
+                distance_km=float(request.distance_km),
+            ))
+        RouteRequest.objects.bulk_update(
+            [request for request in requests if request.id in awarded],
+            ['assigned_driver', 'assigned_truck'], batch_size=1000,
+        )
+        DeliveryRoute.objects.bulk_create(routes, batch_size=1000)
+        return len(bids)
@@ -0,0 +1,150 @@
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from tracking.models import Location, LocationArchiveBlock, RollupWatermark, RouteBid
+from tracking.rollups import WATERMARK_NAME
+
+# Days to keep per policy; None keeps everything. Override with the
+# DATA_RETENTION_DAYS setting, e.g. {'locations': 180}.
+DEFAULT_RETENTION_DAYS = {
+    'locations': 365,
+    'location_archive': None,
+    'route_bids': 90,
+    'jwt_tokens': 7,
+}
+# Approximate bytes per row (heap tuple plus index entries) where the
+# database cannot tell us
+ROW_BYTES_ESTIMATE = {
+    'locations': 180,
+    'location_archive': 4096,
+    'route_bids': 300,
+    'jwt_tokens': 600,
+}
+
+
+def _locations(cutoff):
+    """Live fixes older than the cutoff that the rollup job has already folded in"""
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).values_list('last_location_id', flat=True).first()
+    if not watermark:
+        return None
+    return Location.objects.filter(timestamp__lt=cutoff, id__lte=watermark)
+
+
+def _location_archive(cutoff):
+    return LocationArchiveBlock.objects.filter(day__lt=cutoff.date())
+
+
+def _route_bids(cutoff):
+    # An accepted bid is never pruned: deleting it would cascade to its delivery route.
+    # Nor is a bid on a route still open: it keeps the route off the driver's available list
+    return RouteBid.objects.filter(
+        status__in=['rejected', 'withdrawn'], updated_at__lt=cutoff, delivery_route__isnull=True
+    ).exclude(route_request__status='open')
+
+
+def _jwt_tokens(cutoff):
+    """Refresh tokens that expired before the cutoff; their blacklist entries cascade with them"""
+    if not apps.is_installed('rest_framework_simplejwt.token_blacklist'):
+        return None
+    from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+    return OutstandingToken.objects.filter(expires_at__lt=cutoff)
+
+
+POLICIES = {
+    'locations': _locations,
+    'location_archive': _location_archive,
+    'route_bids': _route_bids,
+    'jwt_tokens': _jwt_tokens,
+}
+
+
+class Command(BaseCommand):
+    help = 'Delete data past its retention period in small primary-key-range chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=sorted(POLICIES), help='Only run these policies')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Primary-key range deleted per statement')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between chunks')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        retention = {**DEFAULT_RETENTION_DAYS, **getattr(settings, 'DATA_RETENTION_DAYS', {})}
+        now = timezone.now()
+
+        total_rows = total_bytes = 0
+        for name in options['only'] or POLICIES:
+            days = retention.get(name)
+            if days is None:
+                self.stdout.write(f'{name}: kept forever')
+                continue
+            queryset = POLICIES[name](now - timedelta(days=days))
+            if queryset is None:
+                self.stdout.write(f'{name}: skipped ({self.skip_reason(name)})')
+                continue
+
+            row_bytes = self.row_bytes(name, queryset.model)
+            started = time.perf_counter()
+            if options['dry_run']:
+                rows = queryset.count()
+            else:
+                rows = self.delete_in_chunks(queryset, options['chunk_size'], options['sleep'])
+            total_rows += rows
+            total_bytes += rows * row_bytes
+            self.stdout.write(
+                f'{name}: {"would delete" if options["dry_run"] else "deleted"} {rows} rows older than {days} days '
+                f'(~{rows * row_bytes / 1024 ** 2:.1f} MiB) in {time.perf_counter() - started:.1f}s'
+            )
+
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total_rows} rows, ~{total_bytes / 1024 ** 2:.1f} MiB'))
+
+    def delete_in_chunks(self, queryset, chunk_size, pause):
+        """Delete ``queryset`` one primary-key range at a time.
+
+        Each range is its own short statement (and transaction), so locks are
+        held only briefly and replicas and vacuum can keep up between chunks.
+        The bounds are read once; rows added later are left for the next run.
+        """
+        bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return 0
+        deleted = 0
+        low = bounds['low']
+        while low <= bounds['high']:
+            _, per_model = queryset.filter(pk__gte=low, pk__lt=low + chunk_size).delete()
+            deleted += per_model.get(queryset.model._meta.label, 0)
+            low += chunk_size
+            if pause and low <= bounds['high']:
+                time.sleep(pause)
+        return deleted
+
+    def row_bytes(self, name, model):
+        """Bytes per row from PostgreSQL's planner statistics when it has them, else the estimate.
+
+        ``reltuples`` is the row count as of the last VACUUM/ANALYZE, read
+        without scanning the table the way ``count()`` would.
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_total_relation_size(oid), reltuples FROM pg_class WHERE oid = %s::regclass',
+                    [model._meta.db_table],
+                )
+                size, rows = cursor.fetchone()
+            if rows > 0:
+                return int(size // rows)
+        return ROW_BYTES_ESTIMATE[name]
+
+    def skip_reason(self, name):
+        if name == 'locations':
+            return 'no fixes have been rolled up yet; run rollup_locations first'
+        return 'rest_framework_simplejwt.token_blacklist is not installed'
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tracking.rollups import roll_up_batch
+
+
+class Command(BaseCommand):
+    help = 'Fold new location fixes into the hourly and daily rollup tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50000, help='Fixes folded per transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new fixes')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            total = 0
+            while True:
+                processed = roll_up_batch(options['batch_size'])
+                total += processed
+                if processed < options['batch_size']:
+                    break
+            if total or not options['loop']:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(self.style.SUCCESS(f'Rolled up {total} fixes in {elapsed:.1f}s'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
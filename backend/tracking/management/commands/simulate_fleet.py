@@ -0,0 +1,284 @@
+import asyncio
+import json
+import math
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import websockets
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from tracking.geo import haversine_km
+from tracking.models import RouteRequest, Truck
+from tracking.roadgraph import decode_polyline
+
+User = get_user_model()
+
+GPS_NOISE_DEG = 5 / 111320   # ~5 m
+
+
+def _key(truck_id, latitude, longitude):
+    """Identifies a fix in broadcasts: the serializer renders coordinates with 7 decimals"""
+    return truck_id, f'{float(latitude):.7f}', f'{float(longitude):.7f}'
+
+
+def _percentiles(values):
+    if not values:
+        return 'n/a'
+    p50, p99 = np.percentile(values, [50, 99])
+    return f'p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, max {max(values) * 1000:.1f} ms'
+
+
+class Trace:
+    """A truck driving along a polyline at a varying speed, with stops and GPS noise"""
+
+    def __init__(self, points, rng):
+        self.rng = rng
+        self.points = points
+        self.cumulative = [0.0]
+        for (lat1, lng1), (lat2, lng2) in zip(points, points[1:]):
+            self.cumulative.append(self.cumulative[-1] + haversine_km(lat1, lng1, lat2, lng2))
+        self.travelled = rng.uniform(0, self.cumulative[-1])
+        self.stopped_for = 0
+
+    def advance(self, seconds):
+        """(lat, lng, speed km/h, heading) after ``seconds`` more driving"""
+        if self.stopped_for > 0:
+            self.stopped_for -= seconds
+            speed = 0.0
+        else:
+            if self.rng.random() < 0.02:
+                self.stopped_for = self.rng.uniform(30, 300)
+            speed = float(np.clip(self.rng.normal(55, 12), 5, 100))
+        # Drive back and forth along the route
+        self.travelled = (self.travelled + speed * seconds / 3600) % (2 * self.cumulative[-1] or 1)
+        distance = self.travelled if self.travelled <= self.cumulative[-1] else 2 * self.cumulative[-1] - self.travelled
+
+        i = max(min(np.searchsorted(self.cumulative, distance) - 1, len(self.points) - 2), 0)
+        (lat1, lng1), (lat2, lng2) = self.points[i], self.points[i + 1]
+        segment = self.cumulative[i + 1] - self.cumulative[i]
+        t = (distance - self.cumulative[i]) / segment if segment else 0.0
+        lat = lat1 + (lat2 - lat1) * t + self.rng.normal(0, GPS_NOISE_DEG)
+        lng = lng1 + (lng2 - lng1) * t + self.rng.normal(0, GPS_NOISE_DEG)
+        heading = math.degrees(math.atan2(lng2 - lng1, lat2 - lat1)) % 360
+        return round(lat, 7), round(lng, 7), round(speed, 2), round(heading, 2)
+
+
+class Stats:
+    def __init__(self):
+        self.sent = {}                # fix key -> loop time it was sent
+        self.rest_ok = self.rest_errors = 0
+        self.ws_sent = self.ws_errors = 0
+        self.rest_latency = []
+        self.fanout = {'admin': [], 'truck': []}
+        self.received = {'admin': 0, 'truck': 0}
+        self.connect_errors = 0
+        self.disconnects = 0
+
+
+class Command(BaseCommand):
+    help = 'Drive virtual trucks against a running server and report ingest and broadcast performance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Server to load (e.g. a local daphne)')
+        parser.add_argument('--drivers', type=int, default=20, help='Virtual drivers, one truck each')
+        parser.add_argument('--admins', type=int, default=2, help='Dashboard sockets watching the fleet')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to keep reporting')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between fixes per truck')
+        parser.add_argument('--rest-ratio', type=float, default=0.5,
+                            help='Share of drivers reporting through POST locations/ instead of the socket')
+        parser.add_argument('--ramp', type=float, default=5, help='Seconds over which drivers connect')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['drivers'] < 1:
+            raise CommandError('--drivers must be at least 1')
+        rng = np.random.default_rng(options['seed'])
+        drivers = self.fleet(options['drivers'])
+        admin_token = str(self.admin().access_token) if options['admins'] else None
+        routes = self.routes(rng)
+        self.stdout.write(
+            f'{len(drivers)} drivers ({round(len(drivers) * options["rest_ratio"])} over REST), '
+            f'{options["admins"]} admin sockets, {len(routes)} route shapes, {options["base_url"]}'
+        )
+
+        stats = Stats()
+        started = time.perf_counter()
+        asyncio.run(self.run(options, drivers, admin_token, routes, rng, stats))
+        self.report(stats, time.perf_counter() - started, options)
+
+    def fleet(self, count):
+        """(truck id, access token) for ``count`` simulated drivers, creating them on first use"""
+        drivers = []
+        for i in range(count):
+            user, created = User.objects.get_or_create(
+                username=f'simdriver{i}', defaults={'role': 'driver', 'email': f'simdriver{i}@example.com'}
+            )
+            if created:
+                user.set_unusable_password()
+                user.save()
+            truck, _ = Truck.objects.get_or_create(
+                truck_number=f'SIM{i:04d}',
+                defaults={'license_plate': f'SIM-{i:04d}', 'model': 'Simulated', 'driver': user, 'status': 'active'},
+            )
+            # Tokens are minted directly: hashing passwords for a thousand logins would dominate the run
+            drivers.append((truck.id, str(RefreshToken.for_user(user).access_token)))
+        return drivers
+
+    def admin(self):
+        user, created = User.objects.get_or_create(
+            username='simadmin', defaults={'role': 'admin', 'email': 'simadmin@example.com'}
+        )
+        if created:
+            user.set_unusable_password()
+            user.save()
+        return RefreshToken.for_user(user)
+
+    def routes(self, rng):
+        """Route request shapes to drive along, or random legs when there are none"""
+        routes = []
+        for request in RouteRequest.objects.only(
+            'route_polyline', 'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude'
+        )[:200]:
+            points = decode_polyline(request.route_polyline) if request.route_polyline else []
+            if len(points) < 2:
+                points = [(float(request.start_latitude), float(request.start_longitude)),
+                          (float(request.end_latitude), float(request.end_longitude))]
+            if points[0] != points[-1]:
+                routes.append(points)
+        if not routes:
+            for _ in range(20):
+                lat, lng = 12.97 + rng.normal(0, 0.3), 77.59 + rng.normal(0, 0.3)
+                routes.append([(lat, lng), (lat + rng.normal(0, 0.2), lng + rng.normal(0, 0.2))])
+        return routes
+
+    async def run(self, options, drivers, admin_token, routes, rng, stats):
+        loop = asyncio.get_running_loop()
+        ws_base = options['base_url'].replace('http', 'ws', 1).rstrip('/')
+        deadline = loop.time() + options['ramp'] + options['duration']
+        executor = ThreadPoolExecutor(max_workers=min(64, len(drivers)))
+        rest_drivers = round(len(drivers) * options['rest_ratio'])
+
+        watchers = [
+            asyncio.create_task(self.watch(f'{ws_base}/ws/admin/dashboard/?token={admin_token}', stats))
+            for _ in range(options['admins'])
+        ]
+        await asyncio.sleep(0.5)   # dashboards are subscribed before the first fix
+
+        tasks = []
+        for i, (truck_id, token) in enumerate(drivers):
+            trace = Trace(routes[i % len(routes)], np.random.default_rng(rng.integers(2 ** 32)))
+            delay = options['ramp'] * i / len(drivers)
+            tasks.append(asyncio.create_task(self.drive(
+                options, ws_base, truck_id, token, trace, i < rest_drivers, delay, deadline, executor, stats
+            )))
+        await asyncio.gather(*tasks)
+
+        await asyncio.sleep(2)   # let in-flight broadcasts arrive
+        for watcher in watchers:
+            watcher.cancel()
+        await asyncio.gather(*watchers, return_exceptions=True)
+        executor.shutdown()
+
+    async def watch(self, url, stats):
+        """A dashboard socket, counting every fix it is sent"""
+        try:
+            async with websockets.connect(url, max_size=None) as socket:
+                await self.listen(socket, 'admin', stats)
+        except asyncio.CancelledError:
+            raise
+        except (OSError, websockets.InvalidHandshake):
+            stats.connect_errors += 1
+        except websockets.ConnectionClosed:
+            stats.disconnects += 1
+
+    async def listen(self, socket, kind, stats):
+        """Record the delay from sending a fix to seeing it broadcast on ``socket``"""
+        loop = asyncio.get_running_loop()
+        async for raw in socket:
+            message = json.loads(raw)
+            if message.get('type') == 'error':
+                # The tracking consumer rejected one of our fixes
+                stats.ws_errors += 1
+                continue
+            if message.get('type') != 'location_update':
+                continue
+            location = message.get('data') or message.get('location')
+            sent_at = stats.sent.get(_key(location['truck'], location['latitude'], location['longitude']))
+            if sent_at is not None:
+                stats.fanout[kind].append(loop.time() - sent_at)
+                stats.received[kind] += 1
+
+    async def drive(self, options, ws_base, truck_id, token, trace, over_rest, delay, deadline, executor, stats):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(delay)
+        url = f'{ws_base}/ws/tracking/{truck_id}/?token={token}'
+        try:
+            async with websockets.connect(url, max_size=None) as socket:
+                # The driver's own socket also receives its truck's broadcasts
+                listener = asyncio.create_task(self.listen(socket, 'truck', stats))
+                next_fix = loop.time()
+                while next_fix < deadline:
+                    lat, lng, speed, heading = trace.advance(options['interval'])
+                    fix = {'latitude': lat, 'longitude': lng, 'speed': speed, 'heading': heading,
+                           'accuracy': round(float(trace.rng.uniform(3, 15)), 2)}
+                    stats.sent[_key(truck_id, lat, lng)] = loop.time()
+                    if over_rest:
+                        await loop.run_in_executor(executor, self.post, options['base_url'], token, truck_id, fix, stats)
+                    else:
+                        await socket.send(json.dumps({'type': 'location_update', **fix}))
+                        stats.ws_sent += 1
+                    next_fix += options['interval']
+                    await asyncio.sleep(max(0, next_fix - loop.time()))
+                listener.cancel()
+                await asyncio.gather(listener, return_exceptions=True)
+        except (OSError, websockets.InvalidHandshake):
+            stats.connect_errors += 1
+        except websockets.ConnectionClosed:
+            stats.disconnects += 1
+
+    def post(self, base_url, token, truck_id, fix, stats):
+        request = urllib.request.Request(
+            f'{base_url.rstrip("/")}/api/tracking/locations/',
+            data=json.dumps({'truck': truck_id, **fix}).encode(),
+            headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
+            method='POST',
+        )
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                ok = response.status == 201
+        except (urllib.error.URLError, OSError):
+            ok = False
+        stats.rest_latency.append(time.perf_counter() - started)
+        if ok:
+            stats.rest_ok += 1
+        else:
+            stats.rest_errors += 1
+
+    def report(self, stats, elapsed, options):
+        ingested = stats.rest_ok + stats.ws_sent - stats.ws_errors
+        attempted = stats.rest_ok + stats.rest_errors + stats.ws_sent
+        self.stdout.write(
+            f'Ingest: {ingested} fixes in {elapsed:.1f}s ({ingested / elapsed:.1f} fixes/s); '
+            f'REST {stats.rest_ok} ok / {stats.rest_errors} failed, socket {stats.ws_sent} sent / {stats.ws_errors} rejected'
+        )
+        self.stdout.write(f'REST POST latency: {_percentiles(stats.rest_latency)}')
+        expected = {'admin': ingested * options['admins'], 'truck': ingested}
+        for kind in ('admin', 'truck'):
+            delivered = stats.received[kind] / expected[kind] * 100 if expected[kind] else 0
+            self.stdout.write(
+                f'Fan-out to {kind} sockets: {stats.received[kind]}/{expected[kind]} delivered ({delivered:.1f}%), '
+                f'{_percentiles(stats.fanout[kind])}'
+            )
+        errors = stats.rest_errors + stats.ws_errors + stats.connect_errors + stats.disconnects
+        style = self.style.SUCCESS if not errors else self.style.WARNING
+        self.stdout.write(style(
+            f'Errors: {errors} ({errors / max(attempted, 1) * 100:.2f}% of fixes); '
+            f'{stats.connect_errors} failed connections, {stats.disconnects} dropped sockets'
+        ))
@@ -0,0 +1,214 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric family; samples are keyed by a tuple of label values in ``labelnames`` order"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def samples(self):
+        """(sample name, label values, extra label, value) tuples"""
+        with self._lock:
+            return [(self.name, labels, '', value) for labels, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, labels, extra, value in self.samples():
+            lines.append(f'{name}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from ``collect()`` at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
+        return [(self.name, labels, '', value) for labels, value in sorted(self.collect().items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            states = sorted((labels, (list(state[0]), state[1], state[2])) for labels, state in self._values.items())
+        samples = []
+        for labels, (counts, total, count) in states:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', labels, f'le="{_format_value(float(bound))}"', cumulative))
+            samples.append((f'{self.name}_sum', labels, '', total))
+            samples.append((f'{self.name}_count', labels, '', count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _channel_queue_depth():
+    """Messages waiting per channel layer, when the layer keeps its queues in process"""
+    from channels.layers import get_channel_layer
+
+    layer = get_channel_layer()
+    channels = getattr(layer, 'channels', None)
+    if not isinstance(channels, dict):
+        return {}
+    depths = [queue.qsize() for queue in list(channels.values())]
+    return {('total',): sum(depths), ('max',): max(depths, default=0), ('channels',): len(depths)}
+
+
+request_latency = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by URL name', ['view', 'method', 'status'],
+)
+request_queries = Histogram(
+    'http_request_db_queries', 'SQL statements run while handling a request', ['view'], buckets=COUNT_BUCKETS,
+)
+request_db_time = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in SQL while handling a request', ['view'],
+)
+websocket_connections = Gauge('websocket_connections_open', 'Accepted WebSocket connections', ['consumer'])
+websocket_messages = Counter('websocket_messages_total', 'WebSocket frames received and sent', ['consumer', 'direction'])
+location_save_latency = Histogram('location_save_duration_seconds', 'Time to store a fix sent over a socket')
+group_fanout = Histogram(
+    'channel_group_send_fanout', 'Channels a group_send was delivered to', ['group'], buckets=COUNT_BUCKETS,
+)
+response_bytes = Counter(
+    'http_response_compression_bytes_total', 'Bytes of compressed responses before and after compression',
+    ['encoding', 'stage'],
+)
+channel_queue_depth = Gauge(
+    'channel_layer_queue_depth', 'Messages waiting in the channel layer', ['stat'], collect=_channel_queue_depth,
+)
+
+
+class QueryStats:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Set by MetricsMiddleware for the duration of a request; context variables
+# follow the request into sync_to_async worker threads
+current_query_stats = contextvars.ContextVar('current_query_stats', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = current_query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if getattr(settings, 'METRICS_ENABLED', True) and _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def group_size(group):
+    """Channels currently in a group, when the channel layer can tell cheaply"""
+    from channels.layers import get_channel_layer
+
+    groups = getattr(get_channel_layer(), 'groups', None)
+    if not isinstance(groups, dict):
+        return None
+    return len(groups.get(group, ()))
+
+
+def group_label(group):
+    """Per-truck groups collapse into one label to keep the series count bounded"""
+    return 'truck' if group.startswith('truck_') else group
@@ -0,0 +1,228 @@
+import random
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import cc_delim_re, patch_vary_headers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from truck_tracking import db_router
+
+from . import compression, metrics, profiling
+
+
+class MetricsMiddleware:
+    """Request latency, SQL count and SQL time per URL name.
+
+    Works on both the WSGI and ASGI paths: SQL is attributed to the request
+    through a context variable, so queries run from sync_to_async threads
+    are counted too. Streaming responses are timed up to the first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = metrics.QueryStats()
+        token = metrics.current_query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_query_stats.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = metrics.QueryStats()
+        token = metrics.current_query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_query_stats.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def record(self, request, response, elapsed, stats):
+        # Unmatched paths share one label so scanners cannot blow up the series count
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        metrics.request_latency.observe(elapsed, view, request.method, str(response.status_code))
+        metrics.request_queries.observe(stats.count, view)
+        metrics.request_db_time.observe(stats.seconds, view)
+
+
+class ProfilingMiddleware:
+    """cProfile and SQL capture for requests an admin asks for or that are sampled.
+
+    An admin opts a request in with an ``X-Profile: 1`` header; otherwise a
+    PROFILING_SAMPLE_RATE share of requests is picked at random (0 by
+    default). The slowest PROFILING_KEEP profiles are listed at
+    /api/tracking/profiles/. Under ASGI a profiled request is handed to a
+    worker thread that runs the rest of the handler, so the sync view code
+    (which Django runs in the calling thread) is in the profile.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = self.trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        return self.profile(request, self.get_response, trigger)
+
+    async def __acall__(self, request):
+        trigger = self.trigger(request)
+        if trigger is None:
+            return await self.get_response(request)
+        return await sync_to_async(self.profile)(request, async_to_sync(self.get_response), trigger)
+
+    def trigger(self, request):
+        if request.headers.get('X-Profile') == '1':
+            return 'header'
+        rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        if rate and random.random() < rate:
+            return 'sample'
+        return None
+
+    def profile(self, request, get_response, trigger):
+        if trigger == 'header':
+            # Only admins may ask for a profile; anyone else gets a normal response
+            try:
+                authenticated = JWTAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                authenticated = None
+            if authenticated is None or authenticated[0].role != 'admin':
+                return get_response(request)
+            request.profiling_user = authenticated[0]
+        return profiling.run_profiled(request, get_response, trigger)
+
+
+class ReplicaStickinessMiddleware:
+    """Pin a user's reads to the primary for a while after a request that wrote"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = {'wrote': False}
+        token = db_router.request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            db_router.request_state.reset(token)
+        self.after(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state = {'wrote': False}
+        token = db_router.request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            db_router.request_state.reset(token)
+        self.after(request, state)
+        return response
+
+    def after(self, request, state):
+        # DRF copies the authenticated (JWT) user onto the Django request
+        user = getattr(request, 'user', None)
+        if state['wrote'] and user is not None and user.is_authenticated:
+            db_router.record_write(user.id)
+
+
+class CompressionMiddleware:
+    """gzip or brotli, as the client's Accept-Encoding allows, for responses over COMPRESSION_MIN_BYTES.
+
+    Streaming responses are compressed as they are produced. Event streams
+    are flushed after every chunk, so each event still goes out at once
+    while sharing one compression context with the events before it.
+
+    Responses marked ``Cache-Control: no-transform`` are left alone. So are
+    responses to requests that carry the session or CSRF cookie, and
+    responses that set a cookie (BREACH): a browser sends cookies on
+    cross-site requests, so compressing a cookie-authenticated page that
+    reflects input next to a secret (a CSRF token in the admin) would leak
+    the secret through the compressed length. The API authenticates with a
+    bearer token, which the browser never adds on its own.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+            return response
+        directives = {directive.split('=')[0].strip().lower()
+                      for directive in cc_delim_re.split(response.get('Cache-Control', ''))}
+        if 'no-transform' in directives:
+            return response
+        if response.cookies or any(name in request.COOKIES for name in (settings.SESSION_COOKIE_NAME,
+                                                                         settings.CSRF_COOKIE_NAME)):
+            return response
+        content_type = response.get('Content-Type', '')
+        if content_type.startswith(compression.SKIP_CONTENT_TYPES):
+            return response
+        if not response.streaming and len(response.content) < getattr(settings, 'COMPRESSION_MIN_BYTES', 1024):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            flush = content_type.startswith('text/event-stream')
+            if response.is_async:
+                response.streaming_content = compression.acompress_stream(response.streaming_content, encoding, flush)
+            else:
+                response.streaming_content = compression.compress_stream(response.streaming_content, encoding, flush)
+            # The compressed size is not known up front
+            del response.headers['Content-Length']
+        else:
+            compressed = compression.compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            metrics.response_bytes.inc(encoding, 'uncompressed', amount=len(response.content))
+            metrics.response_bytes.inc(encoding, 'sent', amount=len(compressed))
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A strong ETag no longer matches the bytes sent (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0002_truck_capacity_tons_truck_truck_type_routerequest_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='truck',
+            name='last_geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='truck',
+            name='last_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='truck',
+            name='last_location_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='truck',
+            name='last_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
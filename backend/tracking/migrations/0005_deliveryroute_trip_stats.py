@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0004_geofence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryroute',
+            name='distance_km',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='deliveryroute',
+            name='idle_seconds',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='deliveryroute',
+            name='last_fix_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryroute',
+            name='last_fix_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryroute',
+            name='last_fix_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryroute',
+            name='max_speed_kmh',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='deliveryroute',
+            name='moving_seconds',
+            field=models.FloatField(default=0.0),
+        ),
+    ]
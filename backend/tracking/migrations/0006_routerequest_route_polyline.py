@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0005_deliveryroute_trip_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routerequest',
+            name='route_polyline',
+            field=models.TextField(blank=True, help_text='Encoded polyline of the road route'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0006_routerequest_route_polyline'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['truck', 'timestamp'], name='locations_truck_ts_idx'),
+        ),
+    ]
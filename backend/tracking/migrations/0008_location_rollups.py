@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0007_location_truck_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_location_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'rollup_watermarks',
+            },
+        ),
+        migrations.CreateModel(
+            name='LocationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=5)),
+                ('bucket_start', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('distance_km', models.FloatField(default=0.0)),
+                ('max_speed', models.FloatField(default=0.0)),
+                ('speed_sum', models.FloatField(default=0.0)),
+                ('sum_latitude', models.FloatField(default=0.0)),
+                ('sum_longitude', models.FloatField(default=0.0)),
+                ('min_latitude', models.FloatField()),
+                ('max_latitude', models.FloatField()),
+                ('min_longitude', models.FloatField()),
+                ('max_longitude', models.FloatField()),
+                ('first_fix_at', models.DateTimeField()),
+                ('first_latitude', models.FloatField()),
+                ('first_longitude', models.FloatField()),
+                ('last_fix_at', models.DateTimeField()),
+                ('last_latitude', models.FloatField()),
+                ('last_longitude', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('truck', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='tracking.truck')),
+            ],
+            options={
+                'db_table': 'location_rollups',
+                'ordering': ['truck', 'granularity', 'bucket_start'],
+                'indexes': [models.Index(fields=['granularity', 'bucket_start'], name='rollups_granularity_idx')],
+                'unique_together': {('truck', 'granularity', 'bucket_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0008_location_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationArchiveBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('first_fix_at', models.DateTimeField()),
+                ('last_fix_at', models.DateTimeField()),
+                ('codec', models.CharField(choices=[('zstd', 'Zstandard'), ('zlib', 'zlib')], max_length=10)),
+                ('raw_bytes', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('truck', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_blocks', to='tracking.truck')),
+            ],
+            options={
+                'db_table': 'location_archive_blocks',
+                'ordering': ['truck', 'day'],
+                'unique_together': {('truck', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0009_location_archive_blocks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='location',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+from tracking.geo import geohash_encode
+
+GEOHASH_PRECISION = 9
+
+
+def backfill_last_position(apps, schema_editor):
+    """Copy each truck's latest fix into Truck.last_*, which nearby search reads"""
+    Truck = apps.get_model('tracking', 'Truck')
+    Location = apps.get_model('tracking', 'Location')
+
+    latest = Location.objects.filter(truck=OuterRef('pk')).order_by('-timestamp')
+    trucks = Truck.objects.filter(last_latitude__isnull=True).annotate(
+        fix_latitude=Subquery(latest.values('latitude')[:1]),
+        fix_longitude=Subquery(latest.values('longitude')[:1]),
+        fix_at=Subquery(latest.values('timestamp')[:1]),
+    ).filter(fix_at__isnull=False)
+    for truck in trucks.iterator():
+        lat, lng = float(truck.fix_latitude), float(truck.fix_longitude)
+        Truck.objects.filter(pk=truck.pk).update(
+            last_latitude=lat,
+            last_longitude=lng,
+            last_geohash=geohash_encode(lat, lng, GEOHASH_PRECISION),
+            last_location_at=truck.fix_at,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0010_location_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_last_position, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0012_rollupwatermark_settled'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['latitude', 'longitude'], name='locations_lat_lng_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class Truck(models.Model):
     STATUS_CHOICES = [
@@ -29,6 +30,11 @@ class Truck(models.Model):
         limit_choices_to={'role': 'driver'}
     )
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='inactive')
+    # Denormalized latest fix, kept current by tracking.spatial for nearby queries
+    last_latitude = models.FloatField(null=True, blank=True)
+    last_longitude = models.FloatField(null=True, blank=True)
+    last_geohash = models.CharField(max_length=12, blank=True, db_index=True)
+    last_location_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -50,7 +56,8 @@ class Location(models.Model):
     speed = models.FloatField(default=0.0)  # km/h
     heading = models.FloatField(default=0.0)  # degrees
     accuracy = models.FloatField(default=0.0)  # meters
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # A default rather than auto_now_add so bulk loads can carry their own times
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f"{self.truck.truck_number} - {self.latitude}, {self.longitude} at {self.timestamp}"
@@ -58,6 +65,11 @@ class Location(models.Model):
     class Meta:
         db_table = 'locations'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['truck', 'timestamp'], name='locations_truck_ts_idx'),
+            # Raw-fix map tiles filter on a bounding box
+            models.Index(fields=['latitude', 'longitude'], name='locations_lat_lng_idx'),
+        ]
 
 class RouteRequest(models.Model):
     """Route requests posted by admin for bidding"""
@@ -104,6 +116,7 @@ class RouteRequest(models.Model):
     required_truck_type = models.CharField(max_length=15, choices=TRUCK_TYPE_CHOICES, default='any')
     estimated_weight_tons = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     distance_km = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    route_polyline = models.TextField(blank=True, help_text="Encoded polyline of the road route")
     
     budget_min = models.DecimalField(max_digits=10, decimal_places=2, help_text="Minimum budget in INR")
     budget_max = models.DecimalField(max_digits=10, decimal_places=2, help_text="Maximum budget in INR")
@@ -197,12 +210,167 @@ class DeliveryRoute(models.Model):
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='pending')
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Trip statistics, accumulated fix by fix in tracking.trip_stats
+    distance_km = models.FloatField(default=0.0)
+    moving_seconds = models.FloatField(default=0.0)
+    idle_seconds = models.FloatField(default=0.0)
+    max_speed_kmh = models.FloatField(default=0.0)
+    last_fix_latitude = models.FloatField(null=True, blank=True)
+    last_fix_longitude = models.FloatField(null=True, blank=True)
+    last_fix_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Route for {self.truck.truck_number}: {self.start_location} → {self.end_location}"
 
+    def start(self):
+        if self.status != 'pending':
+            return False
+        self.status = 'in_progress'
+        self.started_at = timezone.now()
+        self.save()
+        return True
+
+    def complete(self):
+        from .trip_stats import trip_stats
+
+        if self.status != 'in_progress':
+            return False
+        trip_stats.finalize(self)
+        self.status = 'completed'
+        self.completed_at = timezone.now()
+        self.save()
+        return True
+
+    @property
+    def avg_speed_kmh(self):
+        """Average speed while moving"""
+        if not self.moving_seconds:
+            return 0.0
+        return self.distance_km / (self.moving_seconds / 3600)
+
     class Meta:
         db_table = 'delivery_routes'
         ordering = ['-created_at']
+
+class Geofence(models.Model):
+    """Depots, customer sites and other areas checked against every incoming fix"""
+    KIND_CHOICES = [
+        ('depot', 'Depot'),
+        ('customer', 'Customer Site'),
+        ('other', 'Other'),
+    ]
+
+    SHAPE_CHOICES = [
+        ('circle', 'Circle'),
+        ('polygon', 'Polygon'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=15, choices=KIND_CHOICES, default='other')
+    shape = models.CharField(max_length=10, choices=SHAPE_CHOICES, default='circle')
+    center_latitude = models.FloatField(null=True, blank=True)
+    center_longitude = models.FloatField(null=True, blank=True)
+    radius_m = models.FloatField(null=True, blank=True)
+    polygon = models.JSONField(default=list, blank=True, help_text="List of [latitude, longitude] vertices")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.name}"
+
+    class Meta:
+        db_table = 'geofences'
+        ordering = ['name']
+
+class LocationRollup(models.Model):
+    """Per-truck hourly and daily aggregates of location fixes"""
+    GRANULARITY_CHOICES = [
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+    ]
+
+    truck = models.ForeignKey(Truck, on_delete=models.CASCADE, related_name='rollups')
+    granularity = models.CharField(max_length=5, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    point_count = models.PositiveIntegerField(default=0)
+    distance_km = models.FloatField(default=0.0)
+    max_speed = models.FloatField(default=0.0)  # km/h
+    speed_sum = models.FloatField(default=0.0)  # for the average
+    sum_latitude = models.FloatField(default=0.0)  # for the centroid
+    sum_longitude = models.FloatField(default=0.0)
+    min_latitude = models.FloatField()
+    max_latitude = models.FloatField()
+    min_longitude = models.FloatField()
+    max_longitude = models.FloatField()
+    first_fix_at = models.DateTimeField()
+    first_latitude = models.FloatField()
+    first_longitude = models.FloatField()
+    last_fix_at = models.DateTimeField()
+    last_latitude = models.FloatField()
+    last_longitude = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.truck.truck_number} {self.granularity} {self.bucket_start:%Y-%m-%d %H:%M}"
+
+    @property
+    def avg_speed(self):
+        return self.speed_sum / self.point_count if self.point_count else 0.0
+
+    class Meta:
+        db_table = 'location_rollups'
+        ordering = ['truck', 'granularity', 'bucket_start']
+        unique_together = ['truck', 'granularity', 'bucket_start']
+        indexes = [
+            models.Index(fields=['granularity', 'bucket_start'], name='rollups_granularity_idx'),
+        ]
+
+class RollupWatermark(models.Model):
+    """Highest Location id already folded into the rollups.
+
+    Ids are handed out before their transactions commit, so only ids below
+    ``settled_location_id`` are folded: the highest id that was already
+    visible (``observed_location_id`` at ``observed_at``) a safety lag ago.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_location_id = models.BigIntegerField(default=0)
+    settled_location_id = models.BigIntegerField(default=0)
+    observed_location_id = models.BigIntegerField(default=0)
+    observed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_location_id}"
+
+    class Meta:
+        db_table = 'rollup_watermarks'
+
+class LocationArchiveBlock(models.Model):
+    """One truck-day of location fixes moved out of ``locations`` into a compressed columnar block"""
+    CODEC_CHOICES = [
+        ('zstd', 'Zstandard'),
+        ('zlib', 'zlib'),
+    ]
+
+    truck = models.ForeignKey(Truck, on_delete=models.CASCADE, related_name='archive_blocks')
+    day = models.DateField()  # UTC
+    point_count = models.PositiveIntegerField()
+    first_fix_at = models.DateTimeField()
+    last_fix_at = models.DateTimeField()
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES)
+    raw_bytes = models.PositiveIntegerField()  # size of the encoded columns before compression
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.truck.truck_number} {self.day} ({self.point_count} fixes)"
+
+    class Meta:
+        db_table = 'location_archive_blocks'
+        ordering = ['truck', 'day']
+        unique_together = ['truck', 'day']
+
@@ -0,0 +1,309 @@
+import struct
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast
+
+from .columns import Epoch, fetch_array
+from .tiles import TileCache, is_closed_range, project, tile_bounds
+from .trip_stats import MAX_FIX_GAP_SECONDS
+
+EXTENT = 4096
+# Geometry this far outside the tile (in tile units) is kept so lines and
+# symbols that cross tile edges render without seams
+BUFFER = 64
+MOVE_TO, LINE_TO = 1, 2
+POINT, LINESTRING = 1, 2
+
+mvt_cache = TileCache(
+    'mvt',
+    max_entries=getattr(settings, 'MVT_CACHE_ENTRIES', 4096),
+    ttl=getattr(settings, 'MVT_CACHE_TTL', 10),
+    directory=getattr(settings, 'TILE_CACHE_DIR', None),
+)
+
+
+# Protobuf wire format (vector_tile.proto), just the parts a tile needs
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return (values << 1) ^ (values >> 63)
+
+
+def _field(number, payload):
+    """Length-delimited field"""
+    return _varint((number << 3) | 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _packed(number, values):
+    return _field(number, b''.join(_varint(int(v)) for v in values))
+
+
+def _value(value):
+    if isinstance(value, bool):
+        return _uint_field(7, int(value))
+    if isinstance(value, int):
+        return _uint_field(6, int(_zigzag([value])[0])) if value < 0 else _uint_field(5, value)
+    if isinstance(value, float):
+        return _varint((3 << 3) | 1) + struct.pack('<d', value)
+    return _field(1, str(value).encode())
+
+
+def _command(command, count):
+    return (command & 0x7) | (count << 3)
+
+
+def line_geometry(lines):
+    """Geometry commands for a multi-linestring of integer (n, 2) arrays"""
+    commands = []
+    cursor = np.zeros(2, dtype=np.int64)
+    for line in lines:
+        deltas = np.diff(line, axis=0, prepend=cursor[None, :])
+        cursor = line[-1]
+        params = _zigzag(deltas)
+        commands.append(_command(MOVE_TO, 1))
+        commands.extend(params[0].tolist())
+        commands.append(_command(LINE_TO, len(line) - 1))
+        commands.extend(params[1:].ravel().tolist())
+    return commands
+
+
+def point_geometry(x, y):
+    return [_command(MOVE_TO, 1)] + _zigzag([x, y]).tolist()
+
+
+class Layer:
+    """Collects features for one tile layer, interning property keys and values"""
+
+    def __init__(self, name):
+        self.name = name
+        self.features = []
+        self._keys = {}
+        self._values = {}
+
+    def _intern(self, table, item):
+        if item not in table:
+            table[item] = len(table)
+        return table[item]
+
+    def add(self, geom_type, geometry, properties, feature_id=None):
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(self._intern(self._keys, key))
+            tags.append(self._intern(self._values, (type(value).__name__, value)))
+        feature = b''
+        if feature_id is not None:
+            feature += _uint_field(1, feature_id)
+        feature += _packed(2, tags) + _uint_field(3, geom_type) + _packed(4, geometry)
+        self.features.append(feature)
+
+    def encode(self):
+        body = _uint_field(15, 2) + _field(1, self.name.encode())
+        body += b''.join(_field(2, feature) for feature in self.features)
+        body += b''.join(_field(3, key.encode()) for key in self._keys)
+        body += b''.join(_field(4, _value(value)) for _, value in self._values)
+        return _field(3, body + _uint_field(5, EXTENT))
+
+
+def simplify(xs, ys, tolerance):
+    """Douglas-Peucker keep-mask for a polyline; distances are computed per span with numpy"""
+    keep = np.zeros(len(xs), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(xs) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = xs[last] - xs[first], ys[last] - ys[first]
+        span_x, span_y = xs[first + 1:last] - xs[first], ys[first + 1:last] - ys[first]
+        length = np.hypot(dx, dy)
+        if length:
+            distances = np.abs(span_x * dy - span_y * dx) / length
+        else:
+            distances = np.hypot(span_x, span_y)
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def _buffered_bounds(z, x, y):
+    south, west, north, east = tile_bounds(z, x, y)
+    pad = BUFFER / EXTENT
+    lat_pad, lng_pad = (north - south) * pad, (east - west) * pad
+    return south - lat_pad, west - lng_pad, north + lat_pad, east + lng_pad
+
+
+def trucks_layer(z, x, y, trucks):
+    """Latest position of every truck inside the tile"""
+    south, west, north, east = _buffered_bounds(z, x, y)
+    rows = list(trucks.filter(
+        last_latitude__gte=south, last_latitude__lte=north,
+        last_longitude__gte=west, last_longitude__lte=east,
+    ).values_list('id', 'truck_number', 'truck_type', 'status', 'last_latitude', 'last_longitude', 'last_location_at'))
+
+    layer = Layer('trucks')
+    if rows:
+        px, py = project([row[4] for row in rows], [row[5] for row in rows], z, x, y, extent=EXTENT)
+        for row, tx, ty in zip(rows, np.round(px).astype(np.int64), np.round(py).astype(np.int64)):
+            truck_id, truck_number, truck_type, truck_status, _, _, last_location_at = row
+            layer.add(POINT, point_geometry(int(tx), int(ty)), {
+                'truck_id': truck_id,
+                'truck_number': truck_number,
+                'truck_type': truck_type,
+                'status': truck_status,
+                'last_location_at': last_location_at.isoformat() if last_location_at else None,
+            }, feature_id=truck_id)
+    return layer
+
+
+def _track_points(z, x, y, truck_ids, start, end):
+    """(truck, epoch, lat, lng) arrays for the buffered tile, ordered by truck and
+    time, plus a boolean array marking where the path breaks after each point.
+
+    Up to ``MVT_TRACK_ROLLUP_MAX_ZOOM`` tracks are drawn through hourly rollup
+    centroids instead of raw fixes; at those scales an hour of driving is a
+    few pixels at most. An hour missing between two buckets breaks the path
+    there, whether the truck left the tile or stopped reporting.
+    """
+    from .models import Location, LocationRollup
+
+    south, west, north, east = _buffered_bounds(z, x, y)
+    if z <= getattr(settings, 'MVT_TRACK_ROLLUP_MAX_ZOOM', 9):
+        queryset = LocationRollup.objects.filter(
+            granularity='hour', truck_id__in=truck_ids,
+            max_latitude__gte=south, min_latitude__lte=north,
+            max_longitude__gte=west, min_longitude__lte=east,
+        )
+        if start is not None:
+            queryset = queryset.filter(bucket_start__gte=start)
+        if end is not None:
+            queryset = queryset.filter(bucket_start__lt=end)
+        rows = fetch_array(queryset.order_by('truck_id', 'bucket_start').annotate(
+            epoch=Epoch('bucket_start'),
+        ).values_list('truck_id', 'epoch', 'sum_latitude', 'sum_longitude', 'point_count'))
+        counts = np.maximum(rows[:, 4], 1)
+        breaks = (np.diff(rows[:, 0]) != 0) | (np.diff(rows[:, 1]) > 3600 + 1)
+        return rows[:, 0], rows[:, 1], rows[:, 2] / counts, rows[:, 3] / counts, breaks
+
+    in_tile = Q(latitude__gte=south, latitude__lte=north, longitude__gte=west, longitude__lte=east)
+
+    queryset = Location.objects.filter(in_tile, truck_id__in=truck_ids)
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    rows = fetch_array(queryset.order_by('truck_id', 'timestamp').annotate(
+        epoch=Epoch('timestamp'),
+        lat=Cast('latitude', FloatField()),
+        lng=Cast('longitude', FloatField()),
+    ).values_list('truck_id', 'epoch', 'lat', 'lng'))
+    truck, epoch = rows[:, 0], rows[:, 1]
+    breaks = (np.diff(truck) != 0) | (np.diff(epoch) > MAX_FIX_GAP_SECONDS)
+    if not breaks.all():
+        # The trucks' fixes outside the tile over the same span: any of them
+        # between two fixes inside means the truck left the tile there
+        outside = fetch_array(Location.objects.filter(
+            truck_id__in=np.unique(truck).astype(np.int64).tolist(),
+            timestamp__gte=datetime.fromtimestamp(epoch.min(), dt_timezone.utc),
+            timestamp__lte=datetime.fromtimestamp(epoch.max(), dt_timezone.utc),
+        ).exclude(in_tile).order_by('truck_id', 'timestamp').annotate(
+            epoch=Epoch('timestamp'),
+        ).values_list('truck_id', 'epoch'))
+        breaks |= _left_tile(truck, epoch, outside[:, 0], outside[:, 1])
+    return truck, epoch, rows[:, 2], rows[:, 3], breaks
+
+
+def _left_tile(truck, epoch, outside_truck, outside_epoch):
+    """Whether an outside point of the same truck falls strictly between each
+    pair of consecutive points (both sets ordered by truck and time)
+    """
+    if not len(outside_truck):
+        return np.zeros(len(truck) - 1, dtype=bool)
+    # One sorted key per point: trucks by rank, spaced wider than any time span
+    trucks = np.unique(np.concatenate((truck, outside_truck)))
+    base = min(epoch.min(), outside_epoch.min())
+    span = max(epoch.max(), outside_epoch.max()) - base + 2
+    key = np.searchsorted(trucks, truck) * span + (epoch - base)
+    outside_key = np.searchsorted(trucks, outside_truck) * span + (outside_epoch - base)
+    return np.searchsorted(outside_key, key[1:], side='left') > np.searchsorted(outside_key, key[:-1], side='right')
+
+
+def tracks_layer(z, x, y, truck_ids, start, end):
+    """Each truck's path through the tile as a simplified, quantized multi-linestring.
+
+    ``truck_ids`` is a list or a subquery of the trucks to include.
+
+    Paths are split where the truck left the buffered tile (a fix outside it
+    came in between) or stopped reporting (a gap longer than the fix gap
+    limit), quantized to the tile grid with repeated vertices dropped, then
+    simplified to within one screen pixel.
+    """
+    layer = Layer('tracks')
+    truck, epoch, lat, lng, breaks = _track_points(z, x, y, truck_ids, start, end)
+    if not len(truck):
+        return layer
+
+    px, py = project(lat, lng, z, x, y, extent=EXTENT)
+    qx, qy = np.round(px).astype(np.int64), np.round(py).astype(np.int64)
+    breaks = np.flatnonzero(breaks) + 1
+    tolerance = EXTENT / 256
+
+    tracks = {}
+    for run in np.split(np.arange(len(truck)), breaks):
+        run = run[np.concatenate(([True], (np.diff(qx[run]) != 0) | (np.diff(qy[run]) != 0)))]
+        if len(run) < 2:
+            continue
+        run = run[simplify(qx[run], qy[run], tolerance)]
+        tracks.setdefault(int(truck[run[0]]), []).append(np.column_stack((qx[run], qy[run])))
+
+    for truck_id, lines in tracks.items():
+        layer.add(LINESTRING, line_geometry(lines), {
+            'truck_id': truck_id,
+            'points': sum(len(line) for line in lines),
+        }, feature_id=truck_id)
+    return layer
+
+
+def vector_tile(z, x, y, trucks, layers=('trucks', 'tracks'), start=None, end=None, scope=None):
+    """Encoded Mapbox Vector Tile for the given truck queryset, served from the tile cache.
+
+    ``scope`` identifies whose trucks are visible (it is part of the cache key).
+    The trucks layer is live, so tiles are only reused within the cache TTL
+    and until a new fix lands in them.
+    """
+    key = ('mvt', scope, z, x, y, tuple(layers),
+           start.timestamp() if start else None, end.timestamp() if end else None)
+    tile = (z, x, y)
+    closed = 'trucks' not in layers and is_closed_range(end)
+
+    data = mvt_cache.get(key, tile, closed=closed)
+    if data is None:
+        generation = mvt_cache.generation(tile)
+        data = b''
+        if 'trucks' in layers:
+            data += trucks_layer(z, x, y, trucks).encode()
+        if 'tracks' in layers:
+            data += tracks_layer(z, x, y, trucks.values('id'), start, end).encode()
+        mvt_cache.put(key, generation, data, closed=closed)
+    return data
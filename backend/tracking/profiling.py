@@ -0,0 +1,136 @@
+import contextvars
+import cProfile
+import heapq
+import io
+import itertools
+import pstats
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+
+# Statements kept per profiled request (all are counted)
+MAX_QUERIES = 500
+PROFILE_LINES = 40
+_PROJECT_DIR = str(Path(settings.BASE_DIR).resolve())
+_THIS_FILE = str(Path(__file__).resolve())
+
+
+class ProfileSession:
+    """What is collected while one sampled request runs"""
+
+    def __init__(self):
+        self.queries = []
+        self.query_count = 0
+        self.query_seconds = 0.0
+
+
+current_session = contextvars.ContextVar('current_profile_session', default=None)
+
+
+def _origin():
+    """Innermost project frame that issued a query, as 'path:line in function'"""
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        filename = str(Path(frame.filename).resolve())
+        if filename.startswith(_PROJECT_DIR) and filename != _THIS_FILE and 'site-packages' not in filename:
+            return f'{Path(filename).relative_to(_PROJECT_DIR)}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def _capture_query(execute, sql, params, many, context):
+    session = current_session.get()
+    if session is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        session.query_count += 1
+        session.query_seconds += elapsed
+        if len(session.queries) < MAX_QUERIES:
+            session.queries.append({'sql': sql, 'ms': round(elapsed * 1000, 3), 'origin': _origin()})
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if _capture_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_capture_query)
+
+
+class ProfileStore:
+    """The slowest N profiled requests of this process"""
+
+    def __init__(self, size):
+        self.size = size
+        self._heap = []     # (duration, id, record); the fastest kept record is evicted first
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            record['id'] = next(self._ids)
+            entry = (record['duration_ms'], record['id'], record)
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def list(self):
+        with self._lock:
+            records = [record for _, _, record in self._heap]
+        return sorted(records, key=lambda record: record['duration_ms'], reverse=True)
+
+    def get(self, record_id):
+        with self._lock:
+            for _, _, record in self._heap:
+                if record['id'] == record_id:
+                    return record
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+
+
+profile_store = ProfileStore(getattr(settings, 'PROFILING_KEEP', 50))
+
+
+def run_profiled(request, get_response, trigger):
+    """Call ``get_response`` under cProfile with SQL capture and keep the result"""
+    session = ProfileSession()
+    token = current_session.set(session)
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        response = get_response(request)
+    finally:
+        profiler.disable()
+        current_session.reset(token)
+    duration = time.perf_counter() - started
+
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).strip_dirs().sort_stats('cumulative').print_stats(PROFILE_LINES)
+    match = getattr(request, 'resolver_match', None)
+    user = getattr(request, 'profiling_user', None)
+    profile_store.add({
+        'at': timezone.now().isoformat(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match is not None else None,
+        'status': response.status_code,
+        'trigger': trigger,
+        'user': user.username if user is not None else None,
+        'duration_ms': round(duration * 1000, 3),
+        'sql_count': session.query_count,
+        'sql_ms': round(session.query_seconds * 1000, 3),
+        'queries': session.queries,
+        'profile': output.getvalue(),
+    })
+    return response
@@ -0,0 +1,358 @@
+import heapq
+import json
+import math
+import threading
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .geo import EARTH_RADIUS_KM, haversine_km_many
+
+RouteResult = namedtuple('RouteResult', ['distance_km', 'polyline'])
+
+# Snapping grid cell size in degrees (~1 km)
+SNAP_CELL_DEG = 0.01
+# Give up snapping when the nearest road node is further than this
+MAX_SNAP_KM = 5.0
+
+
+class RoadGraph:
+    """Directed road network in compressed sparse row form.
+
+    The graph directory (written by the ``build_road_graph`` command) holds
+    ``lat.npy``/``lng.npy`` per node and ``indptr.npy``/``indices.npy``/
+    ``weights.npy`` (metres) for the outgoing edges, all memory-mapped so
+    several worker processes share one copy through the page cache.
+
+    Shortest paths use A* with ALT lower bounds: ``landmarks_from.npy`` and
+    ``landmarks_to.npy`` hold exact distances from/to a handful of landmark
+    nodes, and the triangle inequality turns them into a heuristic far
+    tighter than the great-circle distance alone.
+    """
+
+    def __init__(self, path, cache_size=1024):
+        path = Path(path)
+        self.lat = _load(path / 'lat.npy')
+        self.lng = _load(path / 'lng.npy')
+        self.indptr = _load(path / 'indptr.npy')
+        self.indices = _load(path / 'indices.npy')
+        self.weights = _load(path / 'weights.npy')
+        self.landmarks_from = _load(path / 'landmarks_from.npy')
+        self.landmarks_to = _load(path / 'landmarks_to.npy')
+        self._build_snap_index()
+        self.route = lru_cache(maxsize=cache_size)(self._route)
+
+    @property
+    def node_count(self):
+        return len(self.lat)
+
+    def _cell_keys(self, lat, lng):
+        rows = np.floor(np.asarray(lat) / SNAP_CELL_DEG).astype(np.int64)
+        cols = np.floor(np.asarray(lng) / SNAP_CELL_DEG).astype(np.int64)
+        return rows * 100000 + cols
+
+    def _build_snap_index(self):
+        keys = self._cell_keys(self.lat, self.lng)
+        self._snap_order = np.argsort(keys, kind='stable')
+        self._snap_keys = keys[self._snap_order]
+
+    def nearest_node(self, lat, lng):
+        row = math.floor(lat / SNAP_CELL_DEG)
+        col = math.floor(lng / SNAP_CELL_DEG)
+        # Widen the search ring until something turns up
+        for ring in (1, 2, 5):
+            keys = [(row + dr) * 100000 + (col + dc)
+                    for dr in range(-ring, ring + 1) for dc in range(-ring, ring + 1)]
+            starts = np.searchsorted(self._snap_keys, keys, side='left')
+            ends = np.searchsorted(self._snap_keys, keys, side='right')
+            candidates = np.concatenate([self._snap_order[s:e] for s, e in zip(starts, ends)])
+            if len(candidates):
+                distances = haversine_km_many(lat, lng, self.lat[candidates], self.lng[candidates])
+                best = int(np.argmin(distances))
+                if distances[best] <= MAX_SNAP_KM:
+                    return int(candidates[best])
+        return None
+
+    def shortest_path(self, source, target):
+        """A* search; returns (metres, [node ids]) or None if unreachable"""
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        heuristic = _Heuristic(self, target)
+
+        best = {source: 0.0}
+        parents = {source: -1}
+        # Ties on f are broken towards the larger g, which keeps A* from
+        # fanning out across equal-cost alternatives on grid-like networks
+        queue = [(heuristic.bounds([source])[0], 0.0, source)]
+        closed = set()
+        while queue:
+            _, negative_cost, node = heapq.heappop(queue)
+            if node == target:
+                path = [node]
+                while parents[node] != -1:
+                    node = parents[node]
+                    path.append(node)
+                path.reverse()
+                return -negative_cost, path
+            if node in closed:
+                continue
+            closed.add(node)
+            cost = -negative_cost
+            start, end = int(indptr[node]), int(indptr[node + 1])
+            improved = []
+            for neighbour, weight in zip(indices[start:end].tolist(), weights[start:end].tolist()):
+                new_cost = cost + weight
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    parents[neighbour] = node
+                    improved.append((neighbour, new_cost))
+            if improved:
+                bounds = heuristic.bounds([neighbour for neighbour, _ in improved])
+                for (neighbour, new_cost), bound in zip(improved, bounds):
+                    heapq.heappush(queue, (new_cost + bound, -new_cost, neighbour))
+        return None
+
+    def _route(self, start_lat, start_lng, end_lat, end_lng):
+        source = self.nearest_node(start_lat, start_lng)
+        target = self.nearest_node(end_lat, end_lng)
+        if source is None or target is None:
+            return None
+        found = self.shortest_path(source, target)
+        if found is None:
+            return None
+        metres, path = found
+        points = list(zip(self.lat[path].tolist(), self.lng[path].tolist()))
+        return RouteResult(round(metres / 1000, 2), encode_polyline(points))
+
+
+class _Heuristic:
+    """Lower bounds on the distance to one target, for the nodes a search reaches.
+
+    Bounds are computed the first time a node is pushed (all neighbours of an
+    expanded node at once) and cached for the rest of the query, so a search
+    costs in proportion to the nodes it touches rather than the graph size.
+    """
+
+    def __init__(self, graph, target):
+        self.graph = graph
+        self.lat = float(graph.lat[target])
+        self.lng = float(graph.lng[target])
+        # Landmark distances from and to the target, one per landmark
+        self.from_target = np.asarray(graph.landmarks_from[:, target], dtype=np.float64)
+        self.to_target = np.asarray(graph.landmarks_to[:, target], dtype=np.float64)
+        self.cache = {}
+
+    def bounds(self, nodes):
+        cache = self.cache
+        missing = [node for node in nodes if node not in cache]
+        if missing:
+            graph = self.graph
+            bound = haversine_km_many(self.lat, self.lng, graph.lat[missing], graph.lng[missing]) * 1000
+            if len(self.from_target):
+                with np.errstate(invalid='ignore'):
+                    # d(v, t) >= d(L, t) - d(L, v)  and  d(v, t) >= d(v, L) - d(t, L)
+                    forward = self.from_target[:, None] - graph.landmarks_from[:, missing]
+                    backward = graph.landmarks_to[:, missing] - self.to_target[:, None]
+                    alt = np.fmax(forward, backward).max(axis=0)
+                bound = np.fmax(bound, np.where(np.isfinite(alt), alt, 0))
+            cache.update(zip(missing, bound.tolist()))
+        return [cache[node] for node in nodes]
+
+
+def encode_polyline(points, precision=5):
+    """Encoded polyline (the Google/OSRM format) for a list of (lat, lng)"""
+    factor = 10 ** precision
+    output = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        lat_i, lng_i = int(round(lat * factor)), int(round(lng * factor))
+        for delta in (lat_i - prev_lat, lng_i - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                output.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            output.append(chr(value + 63))
+        prev_lat, prev_lng = lat_i, lng_i
+    return ''.join(output)
+
+
+def decode_polyline(encoded, precision=5):
+    """List of (lat, lng) from an encoded polyline"""
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = value = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                value |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
+
+
+def build_graph(features, output, landmark_count=8):
+    """Write a CSR road graph from GeoJSON LineString features.
+
+    Coordinates shared between lines (to 7 decimals) become the same node.
+    Lines are two-way unless their ``oneway`` property is yes/true/1, or -1
+    for one-way against the drawing direction.
+    """
+    node_ids = {}
+    lats, lngs = [], []
+    sources, targets = [], []
+
+    def node(lng, lat):
+        key = (round(lat, 7), round(lng, 7))
+        node_id = node_ids.get(key)
+        if node_id is None:
+            node_id = node_ids[key] = len(lats)
+            lats.append(key[0])
+            lngs.append(key[1])
+        return node_id
+
+    for feature in features:
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'LineString':
+            lines = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiLineString':
+            lines = geometry['coordinates']
+        else:
+            continue
+        oneway = str((feature.get('properties') or {}).get('oneway', 'no')).lower()
+        for line in lines:
+            ids = [node(coord[0], coord[1]) for coord in line]
+            for a, b in zip(ids, ids[1:]):
+                if a == b:
+                    continue
+                if oneway != '-1':
+                    sources.append(a)
+                    targets.append(b)
+                if oneway not in ('yes', 'true', '1'):
+                    sources.append(b)
+                    targets.append(a)
+
+    lat = np.array(lats, dtype=np.float64)
+    lng = np.array(lngs, dtype=np.float64)
+    sources = np.array(sources, dtype=np.int64)
+    targets = np.array(targets, dtype=np.int64)
+    order = np.argsort(sources, kind='stable')
+    sources, targets = sources[order], targets[order]
+    weights = _edge_lengths_m(lat, lng, sources, targets)
+    indptr = np.zeros(len(lat) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(lat)), out=indptr[1:])
+
+    landmarks_from, landmarks_to = _select_landmarks(lat, lng, indptr, targets, weights, landmark_count)
+
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    np.save(output / 'lat.npy', lat)
+    np.save(output / 'lng.npy', lng)
+    np.save(output / 'indptr.npy', indptr)
+    np.save(output / 'indices.npy', targets.astype(np.int32))
+    np.save(output / 'weights.npy', weights.astype(np.float32))
+    np.save(output / 'landmarks_from.npy', landmarks_from)
+    np.save(output / 'landmarks_to.npy', landmarks_to)
+    (output / 'meta.json').write_text(json.dumps({
+        'nodes': len(lat), 'edges': len(targets), 'landmarks': len(landmarks_from),
+    }))
+    return len(lat), len(targets)
+
+
+def _select_landmarks(lat, lng, indptr, indices, weights, count):
+    """Farthest-point landmark selection with exact distances from and to each"""
+    node_count = len(lat)
+    if not node_count or not count:
+        empty = np.zeros((0, node_count), dtype=np.float32)
+        return empty, empty
+
+    # Reverse graph for distances *to* a landmark
+    sources = np.repeat(np.arange(node_count), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    reverse_indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=node_count), out=reverse_indptr[1:])
+    forward_graph = (indptr.tolist(), indices.tolist(), weights.tolist())
+    reverse_graph = (reverse_indptr.tolist(), sources[order].tolist(), weights[order].tolist())
+
+    # Start from the node farthest from the centroid, then keep adding the
+    # node farthest from all landmarks chosen so far
+    spread = haversine_km_many(lat.mean(), lng.mean(), lat, lng)
+    landmark = int(np.argmax(spread))
+    nearest = np.full(node_count, np.inf)
+    rows_from, rows_to = [], []
+    for _ in range(min(count, node_count)):
+        distances_from = _dijkstra(forward_graph, landmark, node_count)
+        rows_from.append(distances_from)
+        rows_to.append(_dijkstra(reverse_graph, landmark, node_count))
+        nearest = np.minimum(nearest, np.where(np.isfinite(distances_from), distances_from, -1))
+        landmark = int(np.argmax(nearest))
+        if nearest[landmark] <= 0:
+            break
+    return np.array(rows_from, dtype=np.float32), np.array(rows_to, dtype=np.float32)
+
+
+def _dijkstra(graph, source, node_count):
+    indptr, indices, weights = graph
+    distances = [math.inf] * node_count
+    distances[source] = 0.0
+    queue = [(0.0, source)]
+    while queue:
+        cost, node = heapq.heappop(queue)
+        if cost > distances[node]:
+            continue
+        for edge in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[edge]
+            new_cost = cost + weights[edge]
+            if new_cost < distances[neighbour]:
+                distances[neighbour] = new_cost
+                heapq.heappush(queue, (new_cost, neighbour))
+    return np.array(distances)
+
+
+def _load(path):
+    # Plain ndarray view of the memory map: same pages, no memmap indexing overhead
+    return np.load(path, mmap_mode='r').view(np.ndarray)
+
+
+def _edge_lengths_m(lat, lng, sources, targets):
+    lat1, lng1 = np.radians(lat[sources]), np.radians(lng[sources])
+    lat2, lng2 = np.radians(lat[targets]), np.radians(lng[targets])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * 1000 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_road_graph():
+    """The configured road graph, or None when ROAD_GRAPH_PATH isn't set up"""
+    global _graph
+    if _graph is None:
+        path = getattr(settings, 'ROAD_GRAPH_PATH', None)
+        if not path or not (Path(path) / 'indptr.npy').exists():
+            return None
+        with _graph_lock:
+            if _graph is None:
+                _graph = RoadGraph(path, getattr(settings, 'ROAD_GRAPH_CACHE_SIZE', 1024))
+    return _graph
+
+
+def route_between(start_lat, start_lng, end_lat, end_lng):
+    """Road distance and polyline between two points, or None if unavailable"""
+    graph = get_road_graph()
+    if graph is None:
+        return None
+    # Round so nearby repeat requests share a cache entry (~1 m)
+    return graph.route(round(float(start_lat), 5), round(float(start_lng), 5),
+                       round(float(end_lat), 5), round(float(end_lng), 5))
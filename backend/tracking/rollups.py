@@ -0,0 +1,210 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+from django.db.models import FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .columns import Epoch, fetch_array
+from .stops import _distance_m
+
+WATERMARK_NAME = 'locations'
+BUCKET_SECONDS = {'hour': 3600, 'day': 86400}
+# Ids are folded once they have been visible this long, so a transaction that
+# commits out of id order (but within the lag) is not skipped by the watermark
+SAFETY_LAG = timedelta(seconds=10)
+
+SUM_FIELDS = ('point_count', 'distance_km', 'speed_sum', 'sum_latitude', 'sum_longitude')
+MAX_FIELDS = ('max_speed', 'max_latitude', 'max_longitude')
+MIN_FIELDS = ('min_latitude', 'min_longitude')
+
+
+def _aware(epoch):
+    return datetime.fromtimestamp(float(epoch), tz=dt_timezone.utc)
+
+
+def _aggregate(truck, epoch, lat, lng, speed, segment, bucket_seconds):
+    """Group sorted fixes by (truck, bucket) and reduce each group with numpy"""
+    bucket = np.floor(epoch / bucket_seconds) * bucket_seconds
+    boundary = np.flatnonzero((np.diff(truck) != 0) | (np.diff(bucket) != 0)) + 1
+    starts = np.concatenate(([0], boundary))
+    ends = np.concatenate((boundary, [len(truck)])) - 1
+    return {
+        'truck_id': truck[starts].astype(np.int64),
+        'bucket_start': bucket[starts],
+        'point_count': np.diff(np.concatenate((starts, [len(truck)]))),
+        'distance_km': np.add.reduceat(segment, starts) / 1000,
+        'speed_sum': np.add.reduceat(speed, starts),
+        'max_speed': np.maximum.reduceat(speed, starts),
+        'sum_latitude': np.add.reduceat(lat, starts),
+        'sum_longitude': np.add.reduceat(lng, starts),
+        'min_latitude': np.minimum.reduceat(lat, starts),
+        'max_latitude': np.maximum.reduceat(lat, starts),
+        'min_longitude': np.minimum.reduceat(lng, starts),
+        'max_longitude': np.maximum.reduceat(lng, starts),
+        'first_fix_at': epoch[starts],
+        'first_latitude': lat[starts],
+        'first_longitude': lng[starts],
+        'last_fix_at': epoch[ends],
+        'last_latitude': lat[ends],
+        'last_longitude': lng[ends],
+    }
+
+
+def _merge(granularity, groups):
+    """Fold freshly aggregated groups into the stored rollup rows"""
+    from .models import LocationRollup
+
+    keys = list(zip(groups['truck_id'].tolist(), groups['bucket_start'].tolist()))
+    existing = {
+        (row.truck_id, row.bucket_start.timestamp()): row
+        for row in LocationRollup.objects.filter(
+            granularity=granularity,
+            truck_id__in={truck_id for truck_id, _ in keys},
+            bucket_start__in={_aware(bucket) for _, bucket in keys},
+        )
+    }
+
+    to_create, to_update = [], []
+    for i, (truck_id, bucket) in enumerate(keys):
+        values = {field: groups[field][i].item() for field in groups if field not in ('truck_id', 'bucket_start')}
+        for field in ('first_fix_at', 'last_fix_at'):
+            values[field] = _aware(values[field])
+        row = existing.get((truck_id, bucket))
+        if row is None:
+            to_create.append(LocationRollup(truck_id=truck_id, granularity=granularity,
+                                            bucket_start=_aware(bucket), **values))
+            continue
+        for field in SUM_FIELDS:
+            setattr(row, field, getattr(row, field) + values[field])
+        for field in MAX_FIELDS:
+            setattr(row, field, max(getattr(row, field), values[field]))
+        for field in MIN_FIELDS:
+            setattr(row, field, min(getattr(row, field), values[field]))
+        if values['first_fix_at'] < row.first_fix_at:
+            row.first_fix_at, row.first_latitude, row.first_longitude = (
+                values['first_fix_at'], values['first_latitude'], values['first_longitude'])
+        if values['last_fix_at'] >= row.last_fix_at:
+            row.last_fix_at, row.last_latitude, row.last_longitude = (
+                values['last_fix_at'], values['last_latitude'], values['last_longitude'])
+        to_update.append(row)
+
+    LocationRollup.objects.bulk_create(to_create, batch_size=1000)
+    LocationRollup.objects.bulk_update(
+        to_update,
+        SUM_FIELDS + MAX_FIELDS + MIN_FIELDS + (
+            'first_fix_at', 'first_latitude', 'first_longitude',
+            'last_fix_at', 'last_latitude', 'last_longitude',
+        ),
+        batch_size=1000,
+    )
+    return len(to_create), len(to_update)
+
+
+def _previous_fixes(truck_ids):
+    """truck id -> (epoch, lat, lng) of the latest fix already rolled up"""
+    from .models import LocationRollup
+
+    days = LocationRollup.objects.filter(granularity='day')
+    # Only each truck's latest day holds its latest fix (one index lookup per truck)
+    latest_day = days.filter(truck_id=OuterRef('truck_id')).order_by('-bucket_start').values('bucket_start')[:1]
+    rows = days.filter(truck_id__in=truck_ids, bucket_start=Subquery(latest_day)).values_list(
+        'truck_id', 'last_fix_at', 'last_latitude', 'last_longitude'
+    )
+    return {truck_id: (fix_at.timestamp(), lat, lng) for truck_id, fix_at, lat, lng in rows}
+
+
+def _settle(watermark):
+    """Move the settled id up to the highest id observed at least SAFETY_LAG ago"""
+    from .models import Location
+
+    now = timezone.now()
+    if watermark.observed_at is not None and now - watermark.observed_at < SAFETY_LAG:
+        return
+    watermark.settled_location_id = max(watermark.settled_location_id, watermark.observed_location_id)
+    latest = Location.objects.order_by('-id').values_list('id', flat=True).first()
+    watermark.observed_location_id = latest or watermark.observed_location_id
+    watermark.observed_at = now
+
+
+def roll_up_batch(batch_size=50000):
+    """Fold the next batch of fixes past the watermark into the rollups.
+
+    Fixes are selected by id alone, whatever their timestamp, so late and
+    offline-buffered fixes are folded in too; only ids that have settled (see
+    ``RollupWatermark``) are read. Distance is measured between consecutive
+    fixes of a truck within the batch and from the last fix already rolled up.
+
+    Returns the number of fixes processed (0 when caught up).
+    """
+    from .models import Location, RollupWatermark
+
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+        _settle(watermark)
+        rows = Location.objects.filter(
+            id__gt=watermark.last_location_id,
+            id__lte=watermark.settled_location_id,
+        ).order_by('id').annotate(
+            epoch=Epoch('timestamp'),
+            lat=Cast('latitude', FloatField()),
+            lng=Cast('longitude', FloatField()),
+        ).values_list('id', 'truck_id', 'epoch', 'lat', 'lng', 'speed')[:batch_size]
+        batch = fetch_array(rows)
+        if not len(batch):
+            watermark.save()
+            return 0
+
+        last_id = int(batch[:, 0].max())
+        batch = batch[np.lexsort((batch[:, 2], batch[:, 1]))]
+        truck, epoch, lat, lng, speed = batch[:, 1], batch[:, 2], batch[:, 3], batch[:, 4], batch[:, 5]
+
+        # Segment ending at each fix; the first fix of each truck connects to
+        # the last fix already rolled up, unless it arrived out of order
+        segment = np.zeros(len(batch))
+        same_truck = truck[1:] == truck[:-1]
+        segment[1:] = np.where(same_truck, _distance_m(lat[:-1], lng[:-1], lat[1:], lng[1:]), 0.0)
+        firsts = np.concatenate(([0], np.flatnonzero(~same_truck) + 1))
+        previous = _previous_fixes(truck[firsts].astype(np.int64).tolist())
+        for i in firsts:
+            prior = previous.get(int(truck[i]))
+            if prior is not None and prior[0] <= epoch[i]:
+                segment[i] = _distance_m(prior[1], prior[2], lat[i], lng[i])
+
+        for granularity, seconds in BUCKET_SECONDS.items():
+            _merge(granularity, _aggregate(truck, epoch, lat, lng, speed, segment, seconds))
+
+        watermark.last_location_id = last_id
+        watermark.save()
+        return len(batch)
+
+
+def fleet_kpis(day):
+    """Fleet-wide figures for one day, read from the daily rollups"""
+    from .models import LocationRollup
+
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()), dt_timezone.utc)
+    rows = list(LocationRollup.objects.filter(granularity='day', bucket_start=start).select_related('truck'))
+    points = sum(row.point_count for row in rows)
+    return {
+        'date': day.isoformat(),
+        'active_trucks': len(rows),
+        'total_distance_km': round(sum(row.distance_km for row in rows), 3),
+        'total_points': points,
+        'max_speed': max((row.max_speed for row in rows), default=0.0),
+        'avg_speed': round(sum(row.speed_sum for row in rows) / points, 2) if points else 0.0,
+        'trucks': [
+            {
+                'truck_id': row.truck_id,
+                'truck_number': row.truck.truck_number,
+                'distance_km': round(row.distance_km, 3),
+                'points': row.point_count,
+                'max_speed': row.max_speed,
+                'avg_speed': round(row.avg_speed, 2),
+                'first_fix_at': row.first_fix_at,
+                'last_fix_at': row.last_fix_at,
+            }
+            for row in rows
+        ],
+    }
@@ -0,0 +1,199 @@
+import base64
+import bisect
+import heapq
+import json
+import math
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from .geo import haversine_km
+
+RouteEntry = namedtuple('RouteEntry', ['id', 'created_ts', 'start_lat', 'start_lng'])
+
+
+def _sort_key(item):
+    return item[0]
+
+
+class AvailableRouteIndex:
+    """In-memory index of open route requests keyed by required truck type.
+
+    Each truck type keeps its open routes sorted newest first, and every driver
+    has a bitmap (a Python int) of the open routes they already bid on, so a
+    driver's available routes never touch the database. Bits are numbered by
+    a dense per-index slot given to each open route, not by its id, so the
+    bitmaps stay as small as the set of open routes.
+    The index is kept current by the signals in ``tracking.signals`` and fully
+    reloaded every ``AVAILABLE_ROUTES_INDEX_TTL`` seconds to pick up changes
+    made by other worker processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._routes = {}      # route id -> (truck type, RouteEntry)
+        self._by_type = {}     # truck type -> sorted list of ((-created_ts, -id), RouteEntry)
+        self._bids = {}        # driver id -> bitmap of route slots
+        self._slots = {}       # route id -> bit number in the bid bitmaps
+        self._loaded_at = None
+
+    def _ttl(self):
+        return getattr(settings, 'AVAILABLE_ROUTES_INDEX_TTL', 60)
+
+    def stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self._ttl()
+
+    def ensure_loaded(self):
+        if self.stale():
+            self.reload()
+
+    def reload(self):
+        from .models import RouteRequest, RouteBid
+
+        routes = RouteRequest.objects.filter(status='open').values_list(
+            'id', 'required_truck_type', 'created_at', 'start_latitude', 'start_longitude'
+        )
+        bids = RouteBid.objects.values_list('driver_id', 'route_request_id')
+
+        # Queries run before taking the lock, so readers are never held up by the database
+        by_type = {}
+        route_map = {}
+        slots = {}
+        for route_id, truck_type, created_at, lat, lng in routes.iterator():
+            entry = RouteEntry(route_id, created_at.timestamp(), float(lat), float(lng))
+            route_map[route_id] = (truck_type, entry)
+            slots[route_id] = len(slots)
+            by_type.setdefault(truck_type, []).append(((-entry.created_ts, -route_id), entry))
+        for entries in by_type.values():
+            entries.sort()
+
+        bid_map = {}
+        for driver_id, route_id in bids.filter(route_request__status='open').iterator():
+            slot = slots.get(route_id)
+            if slot is not None:
+                bid_map[driver_id] = bid_map.get(driver_id, 0) | (1 << slot)
+
+        with self._lock:
+            self._routes = route_map
+            self._by_type = by_type
+            self._bids = bid_map
+            self._slots = slots
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    # Maintenance hooks (called from signals)
+
+    def update_route(self, route):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._discard_route(route.id)
+            if route.status != 'open':
+                return
+            entry = RouteEntry(route.id, route.created_at.timestamp(),
+                               float(route.start_latitude), float(route.start_longitude))
+            self._routes[route.id] = (route.required_truck_type, entry)
+            # A route that reopens keeps its slot, and with it the bids already recorded
+            self._slots.setdefault(route.id, len(self._slots))
+            bisect.insort(self._by_type.setdefault(route.required_truck_type, []),
+                          ((-entry.created_ts, -route.id), entry), key=_sort_key)
+
+    def remove_route(self, route_id):
+        with self._lock:
+            self._discard_route(route_id)
+
+    def _discard_route(self, route_id):
+        existing = self._routes.pop(route_id, None)
+        if existing is None:
+            return
+        truck_type, entry = existing
+        entries = self._by_type.get(truck_type, [])
+        position = bisect.bisect_left(entries, (-entry.created_ts, -entry.id), key=_sort_key)
+        if position < len(entries) and entries[position][1].id == route_id:
+            del entries[position]
+
+    def add_bid(self, driver_id, route_id):
+        with self._lock:
+            slot = self._slots.get(route_id)
+            if slot is not None:
+                self._bids[driver_id] = self._bids.get(driver_id, 0) | (1 << slot)
+
+    def remove_bid(self, driver_id, route_id):
+        with self._lock:
+            slot = self._slots.get(route_id)
+            if slot is not None and driver_id in self._bids:
+                self._bids[driver_id] &= ~(1 << slot)
+
+    # Queries
+
+    def newest(self, truck_type, driver_id, limit, after=None):
+        """Open routes for a truck type the driver has not bid on, newest first.
+
+        ``after`` is the sort key of the last route on the previous page.
+        Returns a list of (sort key, RouteEntry) pairs. Queries only read
+        memory and never reload: call ``ensure_loaded`` first.
+        """
+        with self._lock:
+            bids = self._bids.get(driver_id, 0)
+            slots = self._slots
+            sources = []
+            for key in ('any', truck_type):
+                entries = self._by_type.get(key, [])
+                start = 0
+                if after is not None:
+                    start = bisect.bisect_right(entries, tuple(after), key=_sort_key)
+                sources.append(entries[start:] if start else entries)
+
+            page = []
+            for sort_key, entry in heapq.merge(*sources, key=_sort_key):
+                if (bids >> slots[entry.id]) & 1:
+                    continue
+                page.append((sort_key, entry))
+                if len(page) == limit:
+                    break
+            return page
+
+    def nearest(self, truck_type, driver_id, lat, lng, limit, after=None):
+        """Like ``newest`` but ordered by distance from (lat, lng) to the pickup point"""
+        with self._lock:
+            bids = self._bids.get(driver_id, 0)
+            candidates = [
+                entry
+                for key in ('any', truck_type)
+                for _, entry in self._by_type.get(key, [])
+                if not (bids >> self._slots[entry.id]) & 1
+            ]
+
+        ranked = sorted(
+            ((round(haversine_km(lat, lng, entry.start_lat, entry.start_lng), 3), entry.id), entry)
+            for entry in candidates
+        )
+        start = 0
+        if after is not None:
+            start = bisect.bisect_right(ranked, tuple(after), key=_sort_key)
+        return ranked[start:start + limit]
+
+
+def encode_cursor(sort_key):
+    return base64.urlsafe_b64encode(json.dumps(list(sort_key)).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    # Both sort keys are pairs of numbers; anything else would fail in bisect
+    if not isinstance(key, list) or len(key) != 2 or not all(
+        isinstance(part, (int, float)) and not isinstance(part, bool) and math.isfinite(part) for part in key
+    ):
+        raise ValueError('Invalid cursor')
+    return key
+
+
+available_route_index = AvailableRouteIndex()
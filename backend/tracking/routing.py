@@ -2,6 +2,9 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
+    # Before the single-truck route, which would also match "multi"
+    re_path(r'ws/tracking/multi/$', consumers.MultiTruckConsumer.as_asgi()),
     re_path(r'ws/tracking/(?P<truck_id>\w+)/$', consumers.LocationTrackingConsumer.as_asgi()),
     re_path(r'ws/admin/dashboard/$', consumers.AdminDashboardConsumer.as_asgi()),
+    re_path(r'ws/replay/(?P<route_id>\d+)/$', consumers.TripReplayConsumer.as_asgi()),
 ]
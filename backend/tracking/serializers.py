@@ -1,6 +1,10 @@
+import math
 from rest_framework import serializers
-from .models import Truck, Location, DeliveryRoute, RouteRequest, RouteBid
+from django.db.models import Count, Min, Q
+from .models import Truck, Location, DeliveryRoute, RouteRequest, RouteBid, Geofence, LocationRollup
 from authentication.serializers import UserSerializer
+from .eta import route_progress
+from .roadgraph import route_between
 
 class TruckSerializer(serializers.ModelSerializer):
     driver_details = UserSerializer(source='driver', read_only=True)
@@ -36,30 +40,65 @@ class RouteRequestSerializer(serializers.ModelSerializer):
     bid_count = serializers.SerializerMethodField()
     lowest_bid = serializers.SerializerMethodField()
 
+    ENDPOINT_FIELDS = ('start_latitude', 'start_longitude', 'end_latitude', 'end_longitude')
+
     class Meta:
         model = RouteRequest
         fields = (
             'id', 'title', 'description', 'start_location', 'end_location',
             'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude',
-            'material_type', 'required_truck_type', 'estimated_weight_tons', 'distance_km',
+            'material_type', 'required_truck_type', 'estimated_weight_tons', 'distance_km', 'route_polyline',
             'budget_min', 'budget_max', 'pickup_deadline', 'delivery_deadline',
             'status', 'created_by', 'created_by_details', 'assigned_driver', 'assigned_driver_details',
             'assigned_truck', 'assigned_truck_details', 'winning_bid_amount',
             'bid_count', 'lowest_bid', 'created_at', 'updated_at'
         )
-        read_only_fields = ('id', 'created_by', 'bid_count', 'lowest_bid', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'created_by', 'route_polyline', 'bid_count', 'lowest_bid', 'created_at', 'updated_at')
 
     def get_bid_count(self, obj):
+        # Use the annotation when the queryset provides it (see with_bid_stats)
+        if hasattr(obj, 'num_bids'):
+            return obj.num_bids
         return obj.bids.count()
 
     def get_lowest_bid(self, obj):
+        if hasattr(obj, 'min_pending_bid'):
+            return obj.min_pending_bid
         lowest_bid = obj.bids.filter(status='pending').order_by('bid_amount').first()
         return lowest_bid.bid_amount if lowest_bid else None
 
+    @staticmethod
+    def with_bid_stats(queryset):
+        """Prefetch everything the serializer needs in a single query"""
+        return queryset.select_related(
+            'created_by', 'assigned_driver', 'assigned_truck__driver'
+        ).annotate(
+            num_bids=Count('bids'),
+            min_pending_bid=Min('bids__bid_amount', filter=Q(bids__status='pending')),
+        )
+
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
+        self._fill_route(validated_data)
         return super().create(validated_data)
 
+    def update(self, instance, validated_data):
+        # Moved endpoints make the stored geometry (and a derived distance) stale
+        if any(field in validated_data and validated_data[field] != getattr(instance, field)
+               for field in self.ENDPOINT_FIELDS):
+            self._fill_route(validated_data, instance)
+        return super().update(instance, validated_data)
+
+    def _fill_route(self, validated_data, instance=None):
+        # Fill in road distance and geometry from the local road graph
+        start_lat, start_lng, end_lat, end_lng = (
+            validated_data.get(field, getattr(instance, field, None)) for field in self.ENDPOINT_FIELDS
+        )
+        route = route_between(start_lat, start_lng, end_lat, end_lng)
+        validated_data['route_polyline'] = route.polyline if route is not None else ''
+        if route is not None and validated_data.get('distance_km') is None:
+            validated_data['distance_km'] = route.distance_km
+
 class RouteBidSerializer(serializers.ModelSerializer):
     driver_details = UserSerializer(source='driver', read_only=True)
     truck_details = TruckSerializer(source='truck', read_only=True)
@@ -102,6 +141,8 @@ class DeliveryRouteSerializer(serializers.ModelSerializer):
     driver_details = UserSerializer(source='driver', read_only=True)
     route_request_details = RouteRequestSerializer(source='route_request', read_only=True)
     bid_details = RouteBidSerializer(source='accepted_bid', read_only=True)
+    avg_speed_kmh = serializers.FloatField(read_only=True)
+    live_progress = serializers.SerializerMethodField()
 
     class Meta:
         model = DeliveryRoute
@@ -110,10 +151,66 @@ class DeliveryRouteSerializer(serializers.ModelSerializer):
             'truck', 'truck_details', 'driver', 'driver_details',
             'start_location', 'end_location', 'start_latitude', 'start_longitude',
             'end_latitude', 'end_longitude', 'status', 'started_at', 'completed_at',
+            'distance_km', 'moving_seconds', 'idle_seconds', 'max_speed_kmh', 'avg_speed_kmh',
+            'live_progress', 'created_at', 'updated_at'
+        )
+        read_only_fields = (
+            'id', 'distance_km', 'moving_seconds', 'idle_seconds', 'max_speed_kmh',
             'created_at', 'updated_at'
         )
+
+    def get_live_progress(self, obj):
+        # Cached ETA/progress, refreshed by tracking.eta on each new fix
+        if obj.status != 'in_progress':
+            return None
+        return route_progress.get(obj.id)
+
+class GeofenceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Geofence
+        fields = (
+            'id', 'name', 'kind', 'shape', 'center_latitude', 'center_longitude',
+            'radius_m', 'polygon', 'is_active', 'created_at', 'updated_at'
+        )
         read_only_fields = ('id', 'created_at', 'updated_at')
 
+    @staticmethod
+    def _in_range(value, limit):
+        """A finite number (not a bool) within [-limit, limit]"""
+        return (isinstance(value, (int, float)) and not isinstance(value, bool)
+                and math.isfinite(value) and -limit <= value <= limit)
+
+    def validate(self, data):
+        shape = data.get('shape', getattr(self.instance, 'shape', 'circle'))
+        if shape == 'circle':
+            center_latitude = data.get('center_latitude', getattr(self.instance, 'center_latitude', None))
+            center_longitude = data.get('center_longitude', getattr(self.instance, 'center_longitude', None))
+            radius_m = data.get('radius_m', getattr(self.instance, 'radius_m', None))
+            if (not self._in_range(center_latitude, 90) or not self._in_range(center_longitude, 180)
+                    or radius_m is None or not math.isfinite(radius_m) or radius_m <= 0):
+                raise serializers.ValidationError("Circle geofences need a center and a positive radius.")
+        else:
+            polygon = data.get('polygon', getattr(self.instance, 'polygon', []))
+            if (not isinstance(polygon, (list, tuple)) or len(polygon) < 3 or not all(
+                isinstance(vertex, (list, tuple)) and len(vertex) == 2
+                and self._in_range(vertex[0], 90) and self._in_range(vertex[1], 180)
+                for vertex in polygon
+            )):
+                raise serializers.ValidationError("Polygon geofences need at least three [latitude, longitude] vertices.")
+        return data
+
+class LocationRollupSerializer(serializers.ModelSerializer):
+    avg_speed = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = LocationRollup
+        fields = (
+            'granularity', 'bucket_start', 'point_count', 'distance_km', 'max_speed', 'avg_speed',
+            'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude',
+            'first_fix_at', 'first_latitude', 'first_longitude',
+            'last_fix_at', 'last_latitude', 'last_longitude',
+        )
+
 class TruckLocationHistorySerializer(serializers.Serializer):
     truck_id = serializers.IntegerField()
     locations = LocationSerializer(many=True, read_only=True)
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .eta import route_progress
+from .geofence import geofence_engine
+from .heartbeat import heartbeat_monitor
+from .ingest import ingest_pipeline
+from .models import DeliveryRoute, Geofence, Location, RouteRequest, RouteBid
+from .route_index import available_route_index
+from .trip_stats import trip_stats
+
+
+@receiver(post_save, sender=RouteRequest)
+def route_request_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: available_route_index.update_route(instance))
+
+
+@receiver(post_delete, sender=RouteRequest)
+def route_request_deleted(sender, instance, **kwargs):
+    route_id = instance.id
+    transaction.on_commit(lambda: available_route_index.remove_route(route_id))
+
+
+@receiver(post_save, sender=RouteBid)
+def route_bid_saved(sender, instance, created, **kwargs):
+    if created:
+        driver_id, route_id = instance.driver_id, instance.route_request_id
+        transaction.on_commit(lambda: available_route_index.add_bid(driver_id, route_id))
+
+
+@receiver(post_delete, sender=RouteBid)
+def route_bid_deleted(sender, instance, **kwargs):
+    if instance.status in ('rejected', 'withdrawn'):
+        # The driver already passed on this route; removing the record doesn't offer it again
+        return
+    driver_id, route_id = instance.driver_id, instance.route_request_id
+    transaction.on_commit(lambda: available_route_index.remove_bid(driver_id, route_id))
+
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance, created, **kwargs):
+    # Every ingest path (REST create and the tracking socket) ends up here;
+    # the rest of the per-fix work runs off the request once the insert commits
+    if created:
+        transaction.on_commit(lambda: ingest_pipeline.submit(instance))
+
+
+@receiver(post_save, sender=Geofence)
+def geofence_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: geofence_engine.update_geofence(instance))
+
+
+@receiver(post_delete, sender=Geofence)
+def geofence_deleted(sender, instance, **kwargs):
+    geofence_id = instance.id
+    transaction.on_commit(lambda: geofence_engine.remove_geofence(geofence_id))
+
+
+@receiver(post_save, sender=DeliveryRoute)
+@receiver(post_delete, sender=DeliveryRoute)
+def delivery_route_changed(sender, instance, **kwargs):
+    transaction.on_commit(trip_stats.invalidate)
+    truck_id, route_id = instance.truck_id, instance.id
+    if kwargs.get('signal') is post_delete:
+        transaction.on_commit(lambda: geofence_engine.remove_route(route_id))
+    else:
+        transaction.on_commit(lambda: geofence_engine.update_route(instance))
+    if instance.status != 'in_progress' or kwargs.get('signal') is post_delete:
+        transaction.on_commit(lambda: route_progress.discard(route_id))
+        transaction.on_commit(lambda: heartbeat_monitor.forget(truck_id, route_id))
+    else:
+        # Time the truck from the start, in case it never reports at all
+        started_at = instance.started_at
+        transaction.on_commit(lambda: heartbeat_monitor.watch(truck_id, route_id, started_at))
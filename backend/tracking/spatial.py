@@ -0,0 +1,162 @@
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .geo import bounding_box, geohash_cover, geohash_encode, haversine_km_many
+
+GEOHASH_PRECISION = 9
+
+
+class TruckGrid:
+    """In-process uniform lat/lng grid over current truck positions.
+
+    Answers "which trucks are near this point" without touching the database.
+    Positions are pushed on every fix by ``record_truck_position`` and the grid
+    is rebuilt from the ``Truck.last_*`` columns every ``TRUCK_GRID_TTL`` seconds
+    so positions written by other processes show up too. Rebuilds run on a
+    background thread; until the first one finishes, ``nearby_trucks`` falls
+    back to the geohash index on the trucks table.
+    """
+
+    def __init__(self, cell_deg=0.1):
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()
+        self._cells = {}       # (row, col) -> set of truck ids
+        self._positions = {}   # truck id -> (lat, lng, cell)
+        self._loaded_at = None
+        self._refreshing = False
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def warm(self):
+        return self._loaded_at is not None
+
+    def stale(self):
+        ttl = getattr(settings, 'TRUCK_GRID_TTL', 60)
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > ttl
+
+    def refresh_in_background(self):
+        """Reload on a daemon thread, one at a time, so no request waits for the full scan"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name='truck-grid-reload', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.reload()
+        finally:
+            self._refreshing = False
+            connection.close()
+
+    def reload(self):
+        from .models import Truck
+
+        rows = Truck.objects.filter(last_latitude__isnull=False).values_list(
+            'id', 'last_latitude', 'last_longitude'
+        )
+        cells = {}
+        positions = {}
+        for truck_id, lat, lng in rows.iterator():
+            cell = self._cell(lat, lng)
+            cells.setdefault(cell, set()).add(truck_id)
+            positions[truck_id] = (lat, lng, cell)
+        with self._lock:
+            self._cells = cells
+            self._positions = positions
+            self._loaded_at = time.monotonic()
+
+    def update(self, truck_id, lat, lng):
+        cell = self._cell(lat, lng)
+        with self._lock:
+            previous = self._positions.get(truck_id)
+            if previous is not None and previous[2] != cell:
+                members = self._cells.get(previous[2])
+                if members is not None:
+                    members.discard(truck_id)
+                    if not members:
+                        del self._cells[previous[2]]
+            self._cells.setdefault(cell, set()).add(truck_id)
+            self._positions[truck_id] = (lat, lng, cell)
+
+    def candidates(self, lat, lng, radius_km):
+        """(truck ids, lats, lngs) of trucks in grid cells touching the circle"""
+        min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_km)
+        row_min, col_min = self._cell(min_lat, min_lng)
+        row_max, col_max = self._cell(max_lat, max_lng)
+        ids, lats, lngs = [], [], []
+        with self._lock:
+            for row in range(row_min, row_max + 1):
+                for col in range(col_min, col_max + 1):
+                    for truck_id in self._cells.get((row, col), ()):
+                        truck_lat, truck_lng, _ = self._positions[truck_id]
+                        ids.append(truck_id)
+                        lats.append(truck_lat)
+                        lngs.append(truck_lng)
+        return ids, lats, lngs
+
+
+truck_grid = TruckGrid()
+
+
+def record_truck_position(location):
+    """Update the denormalized current position of a truck from a new fix"""
+    from .models import Truck
+
+    lat, lng = float(location.latitude), float(location.longitude)
+    Truck.objects.filter(pk=location.truck_id).update(
+        last_latitude=lat,
+        last_longitude=lng,
+        last_geohash=geohash_encode(lat, lng, GEOHASH_PRECISION),
+        last_location_at=location.timestamp,
+    )
+    truck_grid.update(location.truck_id, lat, lng)
+
+
+def _candidates_from_db(lat, lng, radius_km):
+    """Like ``TruckGrid.candidates``, from the indexed geohash prefixes covering the circle"""
+    from .models import Truck
+
+    query = Q()
+    for prefix in geohash_cover(lat, lng, radius_km):
+        query |= Q(last_geohash__startswith=prefix)
+    rows = list(Truck.objects.filter(query).values_list('id', 'last_latitude', 'last_longitude'))
+    if not rows:
+        return [], [], []
+    ids, lats, lngs = zip(*rows)
+    return list(ids), list(lats), list(lngs)
+
+
+def nearby_trucks(lat, lng, radius_km, truck_type=None, use_grid=True):
+    """Active trucks within ``radius_km`` of a point, nearest first.
+
+    Returns a list of (Truck, distance in km).
+    """
+    from .models import Truck
+
+    if use_grid and truck_grid.stale():
+        truck_grid.refresh_in_background()
+    if use_grid and truck_grid.warm():
+        ids, lats, lngs = truck_grid.candidates(lat, lng, radius_km)
+    else:
+        ids, lats, lngs = _candidates_from_db(lat, lng, radius_km)
+    if not ids:
+        return []
+
+    distances = haversine_km_many(lat, lng, lats, lngs)
+    inside = np.flatnonzero(distances <= radius_km)
+    order = inside[np.argsort(distances[inside], kind='stable')]
+    ranked = [(ids[i], float(distances[i])) for i in order]
+
+    trucks = Truck.objects.filter(id__in=[truck_id for truck_id, _ in ranked], status='active')
+    if truck_type:
+        trucks = trucks.filter(truck_type=truck_type)
+    trucks_by_id = {truck.id: truck for truck in trucks.select_related('driver')}
+    return [(trucks_by_id[truck_id], distance) for truck_id, distance in ranked if truck_id in trucks_by_id]
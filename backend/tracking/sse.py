@@ -0,0 +1,195 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .broadcast import ADMIN_GROUP
+from .models import Location, Truck
+from .serializers import LocationSerializer
+
+# Channel layer message type -> SSE event name (the frames match the WebSocket consumers)
+ADMIN_EVENTS = {
+    'location_update_admin': 'location_update',
+    'truck_status_update': 'truck_status_update',
+    'route_progress_update': 'route_progress_update',
+    'geofence_event': 'geofence_event',
+    'heartbeat_event': 'heartbeat_event',
+}
+
+
+def _frame(event, payload, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(payload, cls=DjangoJSONEncoder)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _truck_frame(message):
+    """truck_<id> group message -> (event id, SSE frame), as LocationTrackingConsumer sends it"""
+    if message.get('type') != 'location_broadcast':
+        return None, None
+    location = message['location']
+    return location['id'], _frame('location_update', {'type': 'location_update', 'location': location}, location['id'])
+
+
+def _admin_frame(message):
+    """Admin group message -> (event id, SSE frame), as AdminDashboardConsumer sends it"""
+    event = ADMIN_EVENTS.get(message.get('type'))
+    if event is None:
+        return None, None
+    data = message['data']
+    event_id = data.get('id') if event == 'location_update' else None
+    return event_id, _frame(event, {'type': event, 'data': data}, event_id)
+
+
+@sync_to_async
+def _authenticate(request):
+    """User from a Bearer header or ?token= (EventSource cannot set headers)"""
+    authentication = JWTAuthentication()
+    raw_token = None
+    header = authentication.get_header(request)
+    if header is not None:
+        raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        raw_token = request.GET.get('token')
+    if not raw_token:
+        return None
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        # AuthenticationFailed: the token is fine but its user is gone or inactive
+        return None
+
+
+@sync_to_async
+def _can_view_truck(user, truck_id):
+    if user.role == 'admin':
+        return Truck.objects.filter(id=truck_id).exists()
+    return Truck.objects.filter(id=truck_id, driver=user).exists()
+
+
+@sync_to_async
+def _missed_locations(after_id, truck_id=None):
+    """Locations committed after ``after_id``, oldest first, and None; or None and
+    the newest location id when more than ``SSE_REPLAY_LIMIT`` were missed"""
+    limit = getattr(settings, 'SSE_REPLAY_LIMIT', 500)
+    locations = Location.objects.filter(id__gt=after_id).select_related('truck__driver', 'driver')
+    if truck_id is not None:
+        locations = locations.filter(truck_id=truck_id)
+    locations = list(locations.order_by('-id')[:limit + 1])
+    if len(locations) > limit:
+        return None, locations[0].id
+    return [LocationSerializer(location).data for location in reversed(locations)], None
+
+
+def _replay_frames(missed, to_frame):
+    """(event id, SSE frame) pairs for the missed locations.
+
+    When too much was missed to replay, a single ``resync`` event tells the
+    client to reload its state over REST instead. Its id is the newest
+    location's, so the stream (and a later reconnect) carries on from there.
+    """
+    locations, newest_id = missed
+    if locations is None:
+        return [(newest_id, _frame('resync', {'type': 'resync', 'last_event_id': newest_id}, newest_id))]
+    return [to_frame(location) for location in locations]
+
+
+def _last_event_id(request):
+    value = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    return int(value) if value and value.isdigit() else None
+
+
+async def _event_stream(groups, to_frame, replay):
+    """Subscribe a fresh channel to ``groups`` and yield SSE frames from it.
+
+    The subscription is made before missed events are replayed from the
+    database, and live events already covered by the replay are dropped, so
+    a resuming client sees every location exactly once (or one ``resync``
+    event if it missed too many, see ``_replay_frames``). Comment lines are
+    sent when idle to keep proxies from closing the connection. Django 4.2
+    does not notice a client going away mid-stream, so every stream ends
+    after ``SSE_MAX_SECONDS``; EventSource reconnects on its own and resumes
+    from its Last-Event-ID.
+    """
+    channel_layer = get_channel_layer()
+    channel = await channel_layer.new_channel()
+    for group in groups:
+        await channel_layer.group_add(group, channel)
+    heartbeat = getattr(settings, 'SSE_HEARTBEAT_SECONDS', 15)
+    deadline = asyncio.get_running_loop().time() + getattr(settings, 'SSE_MAX_SECONDS', 300)
+    try:
+        yield f'retry: {getattr(settings, "SSE_RETRY_MS", 3000)}\n\n'
+        replayed_up_to = 0
+        if replay is not None:
+            for frame_id, frame in await replay():
+                replayed_up_to = max(replayed_up_to, frame_id)
+                yield frame
+
+        while True:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return
+            try:
+                message = await asyncio.wait_for(channel_layer.receive(channel), timeout=min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield f': keepalive {timezone.now().isoformat()}\n\n'
+                continue
+            event_id, frame = to_frame(message)
+            if frame is None or (event_id is not None and event_id <= replayed_up_to):
+                continue
+            yield frame
+    finally:
+        for group in groups:
+            await channel_layer.group_discard(group, channel)
+
+
+def _stream_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'   # don't let nginx buffer the stream
+    return response
+
+
+async def truck_events(request, truck_id):
+    """Server-Sent Events stream of a truck's location updates"""
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not await _can_view_truck(user, truck_id):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    replay = None
+    last_event_id = _last_event_id(request)
+    if last_event_id is not None:
+        async def replay():
+            return _replay_frames(await _missed_locations(last_event_id, truck_id),
+                                  lambda location: _truck_frame({'type': 'location_broadcast', 'location': location}))
+
+    return _stream_response(_event_stream([f'truck_{truck_id}'], _truck_frame, replay))
+
+
+async def fleet_events(request):
+    """Server-Sent Events stream of the admin dashboard updates for the whole fleet"""
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if user.role != 'admin':
+        return JsonResponse({'error': 'Only admins can view fleet updates'}, status=403)
+
+    replay = None
+    last_event_id = _last_event_id(request)
+    if last_event_id is not None:
+        async def replay():
+            return _replay_frames(await _missed_locations(last_event_id),
+                                  lambda location: _admin_frame({'type': 'location_update_admin', 'data': location}))
+
+    return _stream_response(_event_stream([ADMIN_GROUP], _admin_frame, replay))
@@ -0,0 +1,169 @@
+import math
+from datetime import datetime, timezone
+
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from .archive import archived_track
+from .columns import Epoch, fetch_array
+from .geo import EARTH_RADIUS_KM
+
+METRES_PER_DEGREE = math.radians(1) * EARTH_RADIUS_KM * 1000
+
+
+def load_track(truck_id, start=None, end=None):
+    """(epoch seconds, lat, lng) arrays for a truck's fixes in time order,
+    including fixes already moved to archive blocks.
+
+    Reads plain columns with values_list, converting timestamps to epoch
+    seconds and the Decimal coordinates to floats in the database so no model
+    instances, datetimes or Decimals are built.
+    """
+    from .models import Location
+
+    queryset = Location.objects.filter(truck_id=truck_id)
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    rows = queryset.order_by('timestamp').annotate(
+        epoch=Epoch('timestamp'),
+        lat=Cast('latitude', FloatField()),
+        lng=Cast('longitude', FloatField()),
+    ).values_list('epoch', 'lat', 'lng')
+
+    track = fetch_array(rows)
+    timestamps, lats, lngs = archived_track(truck_id, start, end)
+    if not len(timestamps):
+        return track[:, 0].copy(), track[:, 1].copy(), track[:, 2].copy()
+    # Archived days come first; re-sort in case late fixes overlap them
+    timestamps = np.concatenate((timestamps, track[:, 0]))
+    order = np.argsort(timestamps, kind='stable')
+    return timestamps[order], np.concatenate((lats, track[:, 1]))[order], np.concatenate((lngs, track[:, 2]))[order]
+
+
+def _distance_m(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(a) for a in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * 1000 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def detect_stops(timestamps, lats, lngs, radius_m=100.0, min_duration_s=300.0):
+    """Find stops in a time-ordered track (stay-point clustering).
+
+    A stop is a run of consecutive fixes that all lie within ``radius_m`` of
+    their centroid and span at least ``min_duration_s``. A single fix far
+    from both neighbours while they are close together is a GPS jump and is
+    dropped first, so it does not split a stop.
+
+    Candidate runs are found with array operations: runs of steps shorter
+    than half the radius (GPS jitter rather than driving) that last long
+    enough and hold a fix still within twice the radius of where the truck is
+    ``min_duration_s`` later. Only their edges are refined in Python, one run
+    or part of a run at a time: the fixes within the radius of the run's
+    median point, then of those fixes' centroid, form the stop, so a slow
+    approach does not drag the centroid away from where the truck actually
+    waited; the rest of the run is searched the same way.
+
+    Returns a list of dicts with start/end (epoch seconds), centroid and dwell time.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    if len(timestamps) < 2:
+        return []
+
+    # Squared distances in degrees of latitude, compared against squared radii
+    radius_sq = (radius_m / METRES_PER_DEGREE) ** 2
+    scale = np.cos(np.radians(lats))
+    step = _local_distance_sq(lats, lngs, scale, slice(None, -1), slice(1, None))
+    # Jumps: both steps around a fix are long, the one over it is short
+    jumps = np.flatnonzero((step[:-1] > radius_sq) & (step[1:] > radius_sq)) + 1
+    jumps = jumps[_local_distance_sq(lats, lngs, scale, jumps - 1, jumps + 1) <= radius_sq / 4]
+    if len(jumps):
+        keep = np.ones(len(timestamps), dtype=bool)
+        keep[jumps] = False
+        timestamps, lats, lngs, scale = timestamps[keep], lats[keep], lngs[keep], scale[keep]
+        step = _local_distance_sq(lats, lngs, scale, slice(None, -1), slice(1, None))
+
+    # A stop starting at a fix holds the first fix min_duration_s later, so both are within 2 * radius
+    later = np.searchsorted(timestamps, timestamps + min_duration_s)
+    starts = np.flatnonzero(later < len(timestamps))
+    possible = np.zeros(len(timestamps) + 1, dtype=np.int64)
+    possible[1:][starts] = _local_distance_sq(lats, lngs, scale, starts, later[starts]) <= 4 * radius_sq
+    possible = np.cumsum(possible)    # possible[j] - possible[i]: possible starts in [i, j)
+
+    # Runs of short consecutive steps are stop candidates
+    still = np.concatenate(([False], step <= radius_sq / 4, [False]))
+    edges = np.flatnonzero(np.diff(still.astype(np.int8)))
+    run_starts, run_ends = edges[::2], edges[1::2]   # point index range [start, end]
+    keep = ((timestamps[run_ends] - timestamps[run_starts] >= min_duration_s)
+            & (possible[run_ends + 1] > possible[run_starts]))
+    pending = list(zip(run_starts[keep].tolist(), run_ends[keep].tolist()))
+
+    stops = []
+    while pending:
+        first, last = pending.pop()
+        if timestamps[last] - timestamps[first] < min_duration_s or possible[last + 1] == possible[first]:
+            continue
+        run_times = timestamps[first:last + 1]
+        run_lats, run_lngs = lats[first:last + 1], lngs[first:last + 1]
+        centroid_lat, centroid_lng = run_lats.mean(), run_lngs.mean()
+        start, end = _cluster(run_times, run_lats, run_lngs, centroid_lat, centroid_lng, radius_m)
+        if (start, end) != (0, last - first):
+            # Not one tight cluster: anchor on the median fix instead, then on the centroid of what is near it
+            start, end = _cluster(run_times, run_lats, run_lngs, np.median(run_lats), np.median(run_lngs), radius_m)
+            if start is None:
+                # No fix near the median (the run bends around it): search each half
+                middle = (first + last) // 2
+                pending += [(first, middle), (middle + 1, last)]
+                continue
+            refined = _cluster(run_times, run_lats, run_lngs,
+                               run_lats[start:end + 1].mean(), run_lngs[start:end + 1].mean(), radius_m)
+            if refined[0] is not None:
+                start, end = refined
+            centroid_lat = run_lats[start:end + 1].mean()
+            centroid_lng = run_lngs[start:end + 1].mean()
+            pending += [(a, b) for a, b in ((first, first + start - 1), (first + end + 1, last)) if a <= b]
+        if run_times[end] - run_times[start] >= min_duration_s:
+            stops.append({
+                'start': float(run_times[start]),
+                'end': float(run_times[end]),
+                'latitude': round(float(centroid_lat), 7),
+                'longitude': round(float(centroid_lng), 7),
+                'dwell_seconds': float(run_times[end] - run_times[start]),
+                'point_count': int(end - start + 1),
+            })
+    return sorted(stops, key=lambda stop: stop['start'])
+
+
+def _local_distance_sq(lats, lngs, scale, i, j):
+    """Squared equirectangular distances, in degrees of latitude, between fixes
+    i and j (index arrays or slices); ``scale`` is the cosine of each latitude.
+    Close to haversine at the few hundred metres compared here."""
+    dlat = lats[j] - lats[i]
+    dlng = (lngs[j] - lngs[i]) * scale[i]
+    return dlat * dlat + dlng * dlng
+
+
+def _cluster(timestamps, lats, lngs, lat, lng, radius_m):
+    """Index range [start, end] of the longest-lasting stretch of consecutive
+    fixes within ``radius_m`` of (lat, lng), or (None, None) if no fix is"""
+    distances = np.hypot(lats - lat, (lngs - lng) * math.cos(math.radians(lat))) * METRES_PER_DEGREE
+    near = np.concatenate(([False], distances <= radius_m, [False]))
+    edges = np.flatnonzero(np.diff(near.astype(np.int8)))
+    if not len(edges):
+        return None, None
+    starts, ends = edges[::2], edges[1::2] - 1
+    best = int(np.argmax(timestamps[ends] - timestamps[starts]))
+    return int(starts[best]), int(ends[best])
+
+
+def truck_stops(truck_id, start=None, end=None, radius_m=100.0, min_duration_s=300.0):
+    """Stops for a truck with timestamps as aware datetimes"""
+    stops = detect_stops(*load_track(truck_id, start, end), radius_m=radius_m, min_duration_s=min_duration_s)
+    for stop in stops:
+        stop['start'] = datetime.fromtimestamp(stop['start'], tz=timezone.utc)
+        stop['end'] = datetime.fromtimestamp(stop['end'], tz=timezone.utc)
+    return stops
@@ -1,3 +1,1535 @@
-from django.test import TestCase
+import gzip
+import json
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from truck_tracking import db_router
+import numpy as np
+
+from . import archive, compression, metrics, mvt, profiling, roadgraph, rollups, spatial
+from .geofence import GeofenceEngine, geofence_engine, load_fences
+from .heartbeat import HeartbeatMonitor, TimerWheel
+from .consumers import TripReplayConsumer
+from .eta import RouteProgressTracker
+from .ingest import process_fixes
+from .middleware import CompressionMiddleware
+from .tiles import TileCache, tile_bounds, tile_for
+from .trip_stats import TripStats, TripStatsTracker
+from .stops import detect_stops
+from .models import (
+    DeliveryRoute, Geofence, Location, LocationRollup, RollupWatermark, RouteBid, RouteRequest, Truck,
+)
+from .route_index import AvailableRouteIndex, available_route_index, encode_cursor
+from .routing import websocket_urlpatterns
+
+
+@skipUnless(db_router.replica_configured(), 'needs a replica alias (see truck_tracking.settings_test)')
+class ReplicaRoutingTests(TransactionTestCase):
+    """The replica mirrors the default database here, so reads are told apart by the connection they ran on"""
+    databases = '__all__'
+
+    def setUp(self):
+        db_router._recent_writers.clear()
+        User = get_user_model()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+        self.other_admin = User.objects.create_user('admin2', password='pass', role='admin')
+        self.truck = Truck.objects.create(truck_number='TRUCK1', license_plate='TR-0001', model='Tata Ace')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def replica_queries(self, path):
+        with CaptureQueriesContext(connections[db_router.REPLICA]) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def create_truck(self):
+        with CaptureQueriesContext(connections[db_router.REPLICA]) as queries:
+            response = self.client.post('/api/tracking/trucks/', {
+                'truck_number': 'PRIMARY1', 'license_plate': 'PR-0001', 'model': 'Eicher Pro',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(queries), 0)
+
+    def test_read_only_views_read_from_replica(self):
+        self.assertGreater(self.replica_queries('/api/tracking/trucks/'), 0)
+        self.assertGreater(self.replica_queries(f'/api/tracking/trucks/{self.truck.id}/location-history/'), 0)
+        self.assertGreater(self.replica_queries('/api/tracking/dashboard/'), 0)
+
+    def test_other_views_read_from_primary(self):
+        self.assertEqual(self.replica_queries(f'/api/tracking/trucks/{self.truck.id}/'), 0)
+
+    def test_writer_reads_own_writes(self):
+        self.create_truck()
+        self.assertEqual(self.replica_queries('/api/tracking/trucks/'), 0)
+
+        # Other users are still served from the replica
+        self.client.force_authenticate(self.other_admin)
+        self.assertGreater(self.replica_queries('/api/tracking/trucks/'), 0)
+
+    @override_settings(REPLICA_STICKY_SECONDS=0)
+    def test_stickiness_expires(self):
+        self.create_truck()
+        self.assertGreater(self.replica_queries('/api/tracking/trucks/'), 0)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def test_router_defaults(self):
+        router = db_router.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Truck))
+        token = db_router._replica_reads.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Truck), 'replica')
+            self.assertEqual(router.db_for_write(Truck), 'default')
+            # Reads after a write in the same block stay on the primary
+            self.assertIsNone(router.db_for_read(Truck))
+        finally:
+            db_router._replica_reads.reset(token)
+
+
+class ReplicaRouterTransactionTests(TestCase):
+    def test_transactions_read_from_primary(self):
+        # TestCase wraps every test in a transaction on the default database
+        token = db_router._replica_reads.set(True)
+        try:
+            self.assertIsNone(db_router.ReplicaRouter().db_for_read(Truck))
+        finally:
+            db_router._replica_reads.reset(token)
+
+
+class TimerWheelTests(TestCase):
+    def test_timers_fire_at_their_deadline(self):
+        wheel = TimerWheel(bits=2, levels=3)
+        deadlines = [1, 3, 4, 5, 16, 17, 63, 64, 65, 200]
+        for key, deadline in enumerate(deadlines):
+            wheel.schedule(key, deadline, deadline)
+        fired = []
+        for tick in range(1, 250):
+            for _, deadline in wheel.advance(tick):
+                self.assertEqual(deadline, tick)
+                fired.append(deadline)
+        self.assertEqual(fired, deadlines)
+        self.assertEqual(len(wheel), 0)
+
+    def test_reschedule_and_cancel(self):
+        wheel = TimerWheel()
+        wheel.schedule('a', 10)
+        wheel.schedule('b', 10)
+        wheel.schedule('a', 5000)
+        wheel.cancel('b')
+        self.assertEqual(wheel.advance(4999), [])
+        self.assertEqual(wheel.advance(5000), [('a', None)])
+
+
+class HeartbeatMonitorTests(TestCase):
+    def setUp(self):
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace')
+        self.monitor = HeartbeatMonitor()
+        self.started_at = timezone.now() - timedelta(minutes=5)
+
+    def expire_after(self, seconds):
+        # Move the monitor's clock instead of waiting
+        self.monitor._origin -= seconds
+        return [(event['event'], event['truck_id']) for event in self.monitor.expire()]
+
+    def test_route_saves_do_not_report_twice(self):
+        self.monitor.watch(self.truck.id, 7, self.started_at)
+        self.assertEqual(self.expire_after(60), [])
+        self.assertEqual(self.expire_after(100), [('offline', self.truck.id)])
+        # The route is saved again (say, its notes edited) while the truck is still silent
+        self.monitor.watch(self.truck.id, 7, self.started_at)
+        self.assertEqual(self.expire_after(200), [])
+        self.assertTrue(self.monitor.is_offline(self.truck.id))
+
+    def test_fixes_taken_in_by_other_processes(self):
+        self.monitor.watch(self.truck.id, 7, self.started_at)
+        last_fix = timezone.now() - timedelta(seconds=30)
+        Truck.objects.filter(id=self.truck.id).update(last_location_at=last_fix)
+        # Re-armed from that fix rather than reported
+        self.assertEqual(self.expire_after(130), [])
+        self.assertEqual(self.expire_after(100), [('offline', self.truck.id)])
+        self.assertEqual(self.monitor._offline[self.truck.id][1], last_fix)
+
+        Truck.objects.filter(id=self.truck.id).update(last_location_at=timezone.now())
+        self.assertEqual(self.expire_after(1), [('online', self.truck.id)])
+        self.assertFalse(self.monitor.is_offline(self.truck.id))
+        self.assertIn(self.truck.id, self.monitor._wheel)
+
+    def test_offline_trucks_are_checked_with_backoff(self):
+        self.monitor.watch(self.truck.id, 7, self.started_at)
+        self.assertEqual(self.expire_after(130), [('offline', self.truck.id)])
+        # Checked again after 1, 2, 4, ... seconds, and not in between
+        checks = 0
+        for _ in range(16):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.expire_after(1), [])
+            checks += len(queries)
+        self.assertEqual(checks, 4)
+        self.assertEqual(self.monitor._wheel.get(self.truck.id)[2], 16)
+
+        self.monitor.forget(self.truck.id, 7)
+        self.assertNotIn(self.truck.id, self.monitor._wheel)
+        self.assertFalse(self.monitor.is_offline(self.truck.id))
+
+    def test_backoff_is_capped(self):
+        with self.settings(HEARTBEAT_OFFLINE_SECONDS=10):
+            self.monitor.watch(self.truck.id, 7, self.started_at)
+            self.assertEqual(self.expire_after(20), [('offline', self.truck.id)])
+            for _ in range(10):
+                self.expire_after(10)
+            self.assertEqual(self.monitor._wheel.get(self.truck.id)[2], 10)
+            # A new route times the truck afresh
+            self.monitor.watch(self.truck.id, 8, timezone.now())
+            self.assertFalse(self.monitor.is_offline(self.truck.id))
+            self.assertIsNone(self.monitor._wheel.get(self.truck.id)[2])
+
+
+def make_route_request(admin, **fields):
+    now = timezone.now()
+    values = {
+        'title': 'Load', 'start_location': 'Depot', 'end_location': 'Site',
+        'start_latitude': 12.9, 'start_longitude': 77.6, 'end_latitude': 13.0, 'end_longitude': 77.7,
+        'budget_min': 1000, 'budget_max': 2000, 'distance_km': 15,
+        'pickup_deadline': now + timedelta(days=1), 'delivery_deadline': now + timedelta(days=2),
+        'created_by': admin,
+    }
+    values.update(fields)
+    return RouteRequest.objects.create(**values)
+
+
+def make_delivery_route(admin, driver, truck, **fields):
+    route_request = make_route_request(admin, status='assigned')
+    now = timezone.now()
+    bid = RouteBid.objects.create(route_request=route_request, driver=driver, truck=truck, bid_amount=1500,
+                                  estimated_pickup_time=now, estimated_delivery_time=now, status='accepted')
+    values = {
+        'start_location': route_request.start_location, 'end_location': route_request.end_location,
+        'start_latitude': route_request.start_latitude, 'start_longitude': route_request.start_longitude,
+        'end_latitude': route_request.end_latitude, 'end_longitude': route_request.end_longitude,
+    }
+    values.update(fields)
+    return DeliveryRoute.objects.create(route_request=route_request, accepted_bid=bid, truck=truck, driver=driver,
+                                        **values)
+
+
+class AvailableRoutesTests(TestCase):
+    def setUp(self):
+        available_route_index.invalidate()
+        User = get_user_model()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+        self.driver = User.objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace',
+                                          truck_type='small', driver=self.driver)
+        # Pickups 1 km apart going north, created oldest first
+        self.routes = [
+            make_route_request(self.admin, start_latitude=12.9 + i * 0.009, required_truck_type=truck_type)
+            for i, truck_type in enumerate(['any', 'small', 'any', 'small', 'any', 'small'])
+        ]
+        make_route_request(self.admin, required_truck_type='heavy')
+        make_route_request(self.admin, status='assigned')
+        now = timezone.now()
+        RouteBid.objects.create(route_request=self.routes[2], driver=self.driver, truck=self.truck, bid_amount=1500,
+                                estimated_pickup_time=now, estimated_delivery_time=now)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.driver)}')
+        self.expected = [route.id for route in reversed(self.routes) if route != self.routes[2]]
+
+    def pages(self, **params):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get('/api/tracking/available-routes/',
+                                       dict(params, **({'cursor': cursor} if cursor else {})))
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            ids += [route['id'] for route in body['results']]
+            cursor = body['next']
+            if cursor is None:
+                return ids
+
+    def test_newest_pages_cover_every_route_once(self):
+        self.assertEqual(self.pages(page_size=2), self.expected)
+        self.assertEqual(self.pages(page_size=100), self.expected)
+
+    def test_distance_ordering(self):
+        ids = self.pages(page_size=2, ordering='distance', lat=12.9, lng=77.6)
+        self.assertEqual(ids, list(reversed(self.expected)))
+
+    def test_invalid_page_size(self):
+        for page_size in ('0', '-1', 'x'):
+            response = self.client.get('/api/tracking/available-routes/', {'page_size': page_size})
+            self.assertEqual(response.status_code, 400, page_size)
+        for cursor in ('garbage', encode_cursor(['x', None]), encode_cursor([True, 1]), encode_cursor([1])):
+            response = self.client.get('/api/tracking/available-routes/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+    def test_distance_from_truck_position(self):
+        response = self.client.get('/api/tracking/available-routes/', {'ordering': 'distance'})
+        self.assertEqual(response.status_code, 400)
+        Truck.objects.filter(id=self.truck.id).update(last_latitude=12.9, last_longitude=77.6)
+        # The position comes from the truck row: no Location query
+        with CaptureQueriesContext(connection) as queries:
+            ids = self.pages(page_size=100, ordering='distance')
+        self.assertEqual(ids, list(reversed(self.expected)))
+        self.assertFalse(any('tracking_location' in query['sql'] for query in queries))
+
+    def test_bitmaps_use_dense_slots(self):
+        far = make_route_request(self.admin, id=10 ** 6)
+        now = timezone.now()
+        RouteBid.objects.create(route_request=far, driver=self.driver, truck=self.truck, bid_amount=1500,
+                                estimated_pickup_time=now, estimated_delivery_time=now)
+        available_route_index.reload()
+        self.assertLess(available_route_index._bids[self.driver.id].bit_length(), 64)
+        self.assertEqual(self.pages(), self.expected)
+
+        # Bids arriving through the signals
+        available_route_index.remove_bid(self.driver.id, far.id)
+        self.assertEqual(self.pages(), [far.id] + self.expected)
+        available_route_index.add_bid(self.driver.id, self.routes[0].id)
+        self.assertEqual(self.pages(), [far.id] + self.expected[:-1])
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+        self.driver = User.objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=self.driver)
+        self.client = APIClient(enforce_csrf_checks=True)
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def test_authentication(self):
+        response = self.client.get('/api/tracking/fleet/positions/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'detail': 'Authentication credentials were not provided.'})
+        self.assertTrue(response.has_header('WWW-Authenticate'))
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer garbage')
+        response = self.client.get('/api/tracking/fleet/positions/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+
+        self.authenticate(self.driver)
+        self.driver.is_active = False
+        self.driver.save()
+        self.assertEqual(self.client.get('/api/tracking/fleet/positions/').status_code, 401)
+
+    def test_methods(self):
+        self.authenticate(self.admin)
+        self.assertEqual(self.client.post('/api/tracking/fleet/positions/').status_code, 405)
+        self.assertEqual(self.client.get('/api/tracking/fleet/positions/').status_code, 200)
+
+    def test_locations(self):
+        self.authenticate(self.driver)
+        fix = {'truck': self.truck.id, 'latitude': '12.900000', 'longitude': '77.600000'}
+        with self.captureOnCommitCallbacks(execute=True):
+            # JWT only, so no CSRF token is needed
+            response = self.client.post('/api/tracking/locations/', fix, format='json')
+        self.assertEqual(response.status_code, 201)
+        location_id = Location.objects.get().id
+
+        response = self.client.get('/api/tracking/locations/')
+        self.assertEqual([location['id'] for location in response.json()], [location_id])
+        response = self.client.get(f'/api/tracking/trucks/{self.truck.id}/live-location/')
+        self.assertEqual(response.json()['id'], location_id)
+        self.assertEqual(self.client.get('/api/tracking/trucks/999/live-location/').status_code, 404)
+
+    def test_index_queries_never_reload(self):
+        index = AvailableRouteIndex()
+        make_route_request(self.admin, required_truck_type='any')
+        with self.assertNumQueries(0):
+            self.assertEqual(index.newest('small', self.driver.id, 10), [])
+        index.ensure_loaded()
+        self.assertEqual(len(index.newest('small', self.driver.id, 10)), 1)
+
+
+class LocationHistoryTests(TestCase):
+    def setUp(self):
+        driver = get_user_model().objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=driver)
+        with self.captureOnCommitCallbacks():
+            self.fixes = [Location.objects.create(truck=self.truck, driver=driver, latitude=12.9 + i / 1000,
+                                                  longitude=77.6) for i in range(5)]
+        self.url = f'/api/tracking/trucks/{self.truck.id}/location-history/'
+        self.client = APIClient()
+        self.client.force_authenticate(driver)
+
+    @override_settings(LOCATION_HISTORY_MAX_LIMIT=3)
+    def test_limit_is_bounded(self):
+        for limit in ('0', '-1', '4', 'x'):
+            response = self.client.get(self.url, {'limit': limit})
+            self.assertEqual(response.status_code, 400, limit)
+        response = self.client.get(self.url, {'limit': 3})
+        self.assertEqual([fix['id'] for fix in response.data['locations']], [fix.id for fix in self.fixes[:1:-1]])
+
+    def test_incremental(self):
+        response = self.client.get(self.url, {'after': self.fixes[1].id, 'limit': 2})
+        self.assertEqual([fix['id'] for fix in response.data['locations']], [self.fixes[3].id, self.fixes[2].id])
+        self.assertEqual((response.data['cursor'], response.data['more']), (self.fixes[3].id, True))
+
+
+class NearbyTrucksTests(TestCase):
+    def setUp(self):
+        spatial.truck_grid._loaded_at = None
+        driver = get_user_model().objects.create_user('driver', password='pass', role='driver')
+        self.near = Truck.objects.create(truck_number='NEAR', license_plate='N-1', model='Ace', status='active')
+        self.far = Truck.objects.create(truck_number='FAR', license_plate='F-1', model='Ace', status='active')
+        self.parked = Truck.objects.create(truck_number='PARKED', license_plate='P-1', model='Ace')
+        # bulk_create skips post_save, like fixes recorded before the last_* columns existed
+        Location.objects.bulk_create([
+            Location(truck=self.near, driver=driver, latitude='12.9000000', longitude='77.6000000',
+                     timestamp=timezone.now() - timedelta(minutes=5)),
+            Location(truck=self.near, driver=driver, latitude='12.9100000', longitude='77.6000000'),
+            Location(truck=self.far, driver=driver, latitude='13.3000000', longitude='77.6000000'),
+            Location(truck=self.parked, driver=driver, latitude='12.9000000', longitude='77.6000000'),
+        ])
+        backfill = import_module('tracking.migrations.0011_backfill_truck_last_position')
+        backfill.backfill_last_position(django_apps, None)
+
+    def test_backfill_copies_latest_fix(self):
+        self.near.refresh_from_db()
+        self.assertEqual((self.near.last_latitude, self.near.last_longitude), (12.91, 77.6))
+        self.assertTrue(self.near.last_geohash.startswith('tdr1'))
+        self.assertIsNotNone(self.near.last_location_at)
+
+    def nearby(self, radius_km):
+        return [(truck.truck_number, round(distance, 1))
+                for truck, distance in spatial.nearby_trucks(12.9, 77.6, radius_km)]
+
+    def test_cold_grid_falls_back_to_geohash_index(self):
+        with mock.patch.object(spatial.truck_grid, 'refresh_in_background') as refresh:
+            self.assertEqual(self.nearby(5), [('NEAR', 1.1)])
+            self.assertEqual(self.nearby(50), [('NEAR', 1.1), ('FAR', 44.5)])
+        refresh.assert_called()
+
+    def test_warm_grid(self):
+        spatial.truck_grid.reload()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.nearby(50), [('NEAR', 1.1), ('FAR', 44.5)])
+        # Only the trucks themselves are read
+        self.assertEqual(len(queries), 1)
+
+
+class GeofenceTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+        self.driver = User.objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=self.driver)
+        self.depot = Geofence.objects.create(name='Depot', kind='depot', center_latitude=12.9,
+                                             center_longitude=77.6, radius_m=500)
+        self.yard = Geofence.objects.create(name='Yard', shape='polygon',
+                                            polygon=[[12.95, 77.65], [12.95, 77.67], [12.97, 77.67], [12.97, 77.65]])
+        self.route = make_delivery_route(self.admin, self.driver, self.truck, start_latitude=13.2,
+                                         start_longitude=77.9)
+
+    def test_enter_and_exit(self):
+        engine = GeofenceEngine()
+        engine.load(load_fences())
+        truck_id = self.truck.id
+
+        def keys(fences):
+            return sorted(fence.key for fence in fences)
+
+        self.assertEqual(engine.process_fix(truck_id, 12.5, 77.0), ([], []))
+        entered, exited = engine.process_fix(truck_id, 12.902, 77.601)
+        self.assertEqual((keys(entered), exited), ([f'fence:{self.depot.id}'], []))
+        # Still inside: no new transition
+        self.assertEqual(engine.process_fix(truck_id, 12.901, 77.6), ([], []))
+        entered, exited = engine.process_fix(truck_id, 12.96, 77.66)
+        self.assertEqual((keys(entered), keys(exited)), ([f'fence:{self.yard.id}'], [f'fence:{self.depot.id}']))
+        # Route fences only apply to the route's own truck
+        self.assertEqual(engine.process_fix(truck_id + 1, 13.2, 77.9), ([], []))
+        entered, _ = engine.process_fix(truck_id, 13.2, 77.9)
+        self.assertEqual(keys(entered), [f'route:{self.route.id}:start'])
+
+    def test_changes_update_only_their_own_fences(self):
+        geofence_engine.load(load_fences())
+        start_key = f'route:{self.route.id}:start'
+        with mock.patch('tracking.geofence.load_fences') as load, self.captureOnCommitCallbacks(execute=True):
+            self.route.start()
+            self.assertIn(start_key, geofence_engine._fences)
+            self.route.complete()
+            self.depot.radius_m = 50
+            self.depot.save()
+            self.yard.delete()
+        load.assert_not_called()
+        self.assertNotIn(start_key, geofence_engine._fences)
+        self.assertEqual(geofence_engine._fences[f'fence:{self.depot.id}'].radius_m, 50)
+        self.assertEqual(sorted(geofence_engine._fences), [f'fence:{self.depot.id}'])
+        self.assertEqual(geofence_engine._index.size, 1)
+        self.assertEqual(geofence_engine._index.containing(13.2, 77.9, self.truck.id), set())
+
+    def test_validation(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        square = [[12.95, 77.65], [12.95, 77.67], [12.97, 77.67]]
+        invalid = [
+            {'shape': 'circle', 'center_latitude': 12.9, 'center_longitude': 77.6, 'radius_m': -5},
+            {'shape': 'circle', 'center_latitude': 12.9, 'center_longitude': 77.6, 'radius_m': 0},
+            {'shape': 'circle', 'center_latitude': 91, 'center_longitude': 77.6, 'radius_m': 100},
+            {'shape': 'polygon', 'polygon': [12.95, 77.65, 12.97]},
+            {'shape': 'polygon', 'polygon': square[:2] + [None]},
+            {'shape': 'polygon', 'polygon': square[:2] + [['12.97', 77.67]]},
+            {'shape': 'polygon', 'polygon': square[:2] + [[True, 77.67]]},
+            {'shape': 'polygon', 'polygon': square[:2] + [[12.97, 181]]},
+            {'shape': 'polygon', 'polygon': square[:2] + [[-90.5, 77.67]]},
+            {'shape': 'polygon', 'polygon': 'abc'},
+        ]
+        for fields in invalid:
+            response = client.post('/api/tracking/geofences/', dict(fields, name='Site'), format='json')
+            self.assertEqual(response.status_code, 400, fields)
+        response = client.post('/api/tracking/geofences/', {'name': 'Site', 'shape': 'polygon', 'polygon': square},
+                               format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        self.driver = get_user_model().objects.create_user('driver', password='pass', role='driver')
+        self.trucks = [Truck.objects.create(truck_number=f'T{i}', license_plate=f'KA-{i}', model='Ace')
+                       for i in range(2)]
+
+    def fix(self, truck, lat):
+        return Location.objects.create(truck=truck, driver=self.driver, latitude=lat, longitude=77.6)
+
+    def test_fixes_are_processed_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.fix(self.trucks[0], 12.9)
+            self.trucks[0].refresh_from_db()
+            self.assertIsNone(self.trucks[0].last_latitude)
+        for callback in callbacks:
+            callback()
+        self.trucks[0].refresh_from_db()
+        self.assertEqual(self.trucks[0].last_latitude, 12.9)
+
+    def test_batch_moves_each_truck_once(self):
+        with self.captureOnCommitCallbacks():
+            fixes = [self.fix(self.trucks[0], 12.9), self.fix(self.trucks[1], 13.0), self.fix(self.trucks[0], 12.95)]
+        with CaptureQueriesContext(connection) as queries:
+            process_fixes(fixes)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "trucks"')]
+        self.assertEqual(len(updates), 2)
+        # Serializing the broadcasts takes one query for the whole batch
+        self.assertEqual(sum('FROM "locations"' in query['sql'] for query in queries), 1)
+        self.trucks[0].refresh_from_db()
+        self.assertEqual(self.trucks[0].last_latitude, 12.95)
+
+
+class TripStatsTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+        self.driver = User.objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=self.driver)
+        self.start = timezone.now() - timedelta(hours=1)
+
+    def test_moving_and_idle_segments(self):
+        stats = TripStats()
+        stats.add_fix(12.9, 77.6, self.start, 0)
+        # About 1 km in a minute at a reported 60 km/h
+        stats.add_fix(12.909, 77.6, self.start + timedelta(minutes=1), 60)
+        # Parked for two minutes: GPS jitter only
+        stats.add_fix(12.90901, 77.6, self.start + timedelta(minutes=3), 0)
+        self.assertAlmostEqual(stats.distance_km, 1.0, delta=0.01)
+        self.assertEqual((stats.moving_seconds, stats.idle_seconds, stats.max_speed_kmh), (60, 120, 60))
+
+        # Out-of-order and duplicate fixes are ignored
+        stats.add_fix(12.95, 77.6, self.start + timedelta(minutes=2), 80)
+        stats.add_fix(12.95, 77.6, self.start + timedelta(minutes=3), 80)
+        self.assertEqual((stats.moving_seconds, stats.idle_seconds, stats.fixes_since_persist), (60, 120, 3))
+
+    def test_long_gaps_use_the_implied_speed(self):
+        stats = TripStats()
+        stats.add_fix(12.9, 77.6, self.start, 0)
+        # 1 km in 20 minutes (3 km/h): the reported 50 km/h is stale over such a gap
+        stats.add_fix(12.909, 77.6, self.start + timedelta(minutes=20), 50)
+        self.assertEqual((stats.distance_km, stats.moving_seconds, stats.idle_seconds), (0.0, 0, 1200))
+
+    def test_tracker_persists_and_finalizes(self):
+        route = make_delivery_route(self.admin, self.driver, self.truck)
+        with self.captureOnCommitCallbacks(execute=True):
+            route.start()
+        tracker = TripStatsTracker()
+
+        def record(minutes, lat):
+            tracker.record_fix(Location(truck=self.truck, latitude=lat, longitude=77.6, speed=60,
+                                        timestamp=self.start + timedelta(minutes=minutes)))
+
+        with self.settings(TRIP_STATS_PERSIST_FIXES=2, TRIP_STATS_PERSIST_SECONDS=3600):
+            record(0, 12.9)
+            record(1, 12.909)
+            route.refresh_from_db()
+            self.assertAlmostEqual(route.distance_km, 1.0, delta=0.01)
+            record(2, 12.918)
+            route.refresh_from_db()
+            self.assertEqual(route.moving_seconds, 60)
+            # The live summary includes the fix not persisted yet
+            self.assertEqual(tracker.summary(route)['moving_seconds'], 120)
+            self.assertEqual(tracker.summary(route)['avg_speed_kmh'], 60.0)
+
+            # A restarted tracker resumes from the persisted values
+            restarted = TripStatsTracker()
+            restarted.record_fix(Location(truck=self.truck, latitude=12.927, longitude=77.6, speed=60,
+                                          timestamp=self.start + timedelta(minutes=3)))
+            self.assertEqual(restarted.summary(route)['moving_seconds'], 180)
+
+        tracker.finalize(route)
+        self.assertEqual(route.moving_seconds, 120)
+        self.assertNotIn(route.id, tracker._stats)
+
+
+class RouteProgressTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+        self.driver = User.objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=self.driver)
+        # 12.9, 77.6 to 13.0, 77.7: about 15.4 km in a straight line, 15 km by road
+        self.route = make_delivery_route(self.admin, self.driver, self.truck)
+        self.tracker = RouteProgressTracker()
+        self.now = timezone.now()
+
+    def update(self, lat, lng, speed=0, minutes=0):
+        return self.tracker.update(self.route.id, Location(
+            truck=self.truck, latitude=lat, longitude=lng, speed=speed, timestamp=self.now + timedelta(minutes=minutes),
+        ))
+
+    def test_progress_follows_the_road_distance(self):
+        progress = self.update(12.9, 77.6)
+        self.assertEqual((progress['remaining_km'], progress['percent_complete']), (15.0, 0.0))
+        progress = self.update(12.95, 77.65)
+        self.assertAlmostEqual(progress['remaining_km'], 7.5, delta=0.05)
+        self.assertAlmostEqual(progress['percent_complete'], 50.0, delta=0.5)
+        self.assertEqual(self.update(13.0, 77.7)['percent_complete'], 100.0)
+        # Overshooting the drop-off never goes past 100% or below 0%
+        self.assertEqual(self.update(12.7, 77.4)['percent_complete'], 0.0)
+        self.assertEqual(self.tracker.get(self.route.id)['latitude'], 12.7)
+
+    def test_eta_from_recent_moving_speeds(self):
+        # No moving fix yet: the default speed
+        with self.settings(ETA_DEFAULT_SPEED_KMH=30.0):
+            progress = self.update(12.9, 77.6)
+        self.assertEqual(progress['expected_speed_kmh'], 30.0)
+        self.assertEqual(progress['eta'], (self.now + timedelta(minutes=30)).isoformat())
+
+        self.update(12.9, 77.6, speed=50)
+        # Fixes below the moving speed do not count
+        progress = self.update(12.9, 77.6, speed=2, minutes=1)
+        self.assertEqual(progress['expected_speed_kmh'], 50.0)
+        progress = self.update(12.9, 77.6, speed=70, minutes=2)
+        self.assertEqual(progress['expected_speed_kmh'], 60.0)
+        self.assertEqual(progress['eta'], (self.now + timedelta(minutes=17)).isoformat())
+        self.assertFalse(progress['at_risk'])
+
+        RouteRequest.objects.filter(id=self.route.route_request_id).update(
+            delivery_deadline=self.now + timedelta(minutes=10))
+        self.tracker.discard(self.route.id)
+        self.assertTrue(self.update(12.9, 77.6, speed=60)['at_risk'])
+
+
+def grid_features(size, spacing=0.01, origin=(12.9, 77.5)):
+    """GeoJSON lines for a size x size street grid, with one one-way street"""
+    lat0, lng0 = origin
+    features = []
+    for i in range(size):
+        row = [[lng0 + j * spacing, lat0 + i * spacing] for j in range(size)]
+        column = [[lng0 + i * spacing, lat0 + j * spacing] for j in range(size)]
+        features.append({'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': row},
+                         'properties': {'oneway': 'yes' if i == 1 else 'no'}})
+        features.append({'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': column},
+                         'properties': {}})
+    return features
+
+
+class RoadGraphTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = TemporaryDirectory()
+        roadgraph.build_graph(grid_features(12), cls.directory.name, landmark_count=4)
+        cls.graph = roadgraph.RoadGraph(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def test_a_star_matches_dijkstra(self):
+        graph = self.graph
+        forward = (graph.indptr.tolist(), graph.indices.tolist(), graph.weights.tolist())
+        for source in (0, 13, 70):
+            distances = roadgraph._dijkstra(forward, source, graph.node_count)
+            for target in range(0, graph.node_count, 7):
+                metres, path = graph.shortest_path(source, target)
+                self.assertAlmostEqual(metres, distances[target], delta=0.01)
+                self.assertEqual((path[0], path[-1]), (source, target))
+
+    def test_one_way_streets(self):
+        # Row 1 is one-way eastwards: west along it has to go round
+        east = self.graph.route(12.91, 77.5, 12.91, 77.53)
+        west = self.graph.route(12.91, 77.53, 12.91, 77.5)
+        self.assertLess(east.distance_km, west.distance_km)
+        points = roadgraph.decode_polyline(east.polyline)
+        self.assertEqual((points[0], points[-1]), ((12.91, 77.5), (12.91, 77.53)))
+
+    def test_heuristic_is_computed_for_reached_nodes_only(self):
+        graph = self.graph
+        target = graph.nearest_node(12.9, 77.52)
+        bounds = roadgraph._Heuristic(graph, target)
+        with mock.patch.object(roadgraph, '_Heuristic', return_value=bounds):
+            graph.shortest_path(graph.nearest_node(12.9, 77.5), target)
+        self.assertLess(len(bounds.cache), graph.node_count // 4)
+        self.assertEqual(bounds.bounds([target]), [0.0])
+
+    def test_unreachable_and_far_points(self):
+        self.assertIsNone(self.graph.route(40.0, -3.7, 12.9, 77.5))
+
+
+class RouteRequestGeometryTests(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        roadgraph.build_graph(grid_features(6), self.directory.name, landmark_count=2)
+        roadgraph._graph = None
+        self.addCleanup(setattr, roadgraph, '_graph', None)
+        self.addCleanup(self.directory.cleanup)
+        self.admin = get_user_model().objects.create_user('admin', password='pass', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_polyline_follows_moved_endpoints(self):
+        with self.settings(ROAD_GRAPH_PATH=self.directory.name):
+            route = make_route_request(self.admin)
+            response = self.client.patch(f'/api/tracking/route-requests/{route.id}/', {
+                'start_latitude': '12.9000000', 'start_longitude': '77.5000000',
+                'end_latitude': '12.9300000', 'end_longitude': '77.5000000',
+            })
+            self.assertEqual(response.status_code, 200, response.content)
+            route.refresh_from_db()
+            points = roadgraph.decode_polyline(route.route_polyline)
+            self.assertEqual((points[0], points[-1]), ((12.9, 77.5), (12.93, 77.5)))
+            # The distance given for the old endpoints is replaced by the road distance
+            self.assertAlmostEqual(float(route.distance_km), 3.34, delta=0.01)
+
+            # Off the road network: the old geometry goes
+            self.client.patch(f'/api/tracking/route-requests/{route.id}/', {'end_latitude': '40.0000000'})
+            route.refresh_from_db()
+            self.assertEqual(route.route_polyline, '')
+
+
+class StopDetectionTests(SimpleTestCase):
+    """Synthetic tracks with a fix every 10 s; 1e-5 degrees is about 1.1 m"""
+    DEG_PER_M = 1 / 111195.0
+
+    def setUp(self):
+        self.random = np.random.default_rng(7)
+        self.points = []
+
+    def drive(self, seconds, metres_per_second):
+        lat, lng = self.points[-1][1:] if self.points else (12.9, 77.6)
+        for _ in range(int(seconds // 10)):
+            lng += metres_per_second * 10 * self.DEG_PER_M
+            self.add(lat, lng)
+
+    def wait(self, seconds, jitter_m=15, at=None):
+        lat, lng = at or self.points[-1][1:]
+        for _ in range(int(seconds // 10)):
+            offset = self.random.uniform(-jitter_m, jitter_m, 2) * self.DEG_PER_M
+            self.add(lat + offset[0], lng + offset[1])
+        # Leave from the spot itself
+        self.add(lat, lng)
+
+    def add(self, lat, lng):
+        timestamp = self.points[-1][0] + 10 if self.points else 0.0
+        self.points.append((timestamp, lat, lng))
+
+    def stops(self, **kwargs):
+        timestamps, lats, lngs = (np.array(column) for column in zip(*self.points))
+        return detect_stops(timestamps, lats, lngs, **kwargs)
+
+    def test_stop_with_jitter(self):
+        self.drive(600, 10)
+        stop_at = self.points[-1]
+        self.wait(600)
+        self.drive(600, 10)
+        stops = self.stops()
+        self.assertEqual(len(stops), 1)
+        self.assertAlmostEqual(stops[0]['dwell_seconds'], 600, delta=30)
+        self.assertAlmostEqual(stops[0]['latitude'], stop_at[1], delta=20 * self.DEG_PER_M)
+        self.assertAlmostEqual(stops[0]['longitude'], stop_at[2], delta=20 * self.DEG_PER_M)
+
+    def test_slow_approach(self):
+        self.drive(600, 10)
+        # Creeping into the yard at walking pace before parking
+        self.drive(300, 1)
+        arrived = self.points[-1][0]
+        self.wait(600)
+        self.drive(600, 10)
+        stops = self.stops()
+        self.assertEqual(len(stops), 1)
+        # Only the last stretch of the crawl, within the radius of the spot, counts
+        self.assertLess(arrived - stops[0]['start'], 200)
+        self.assertGreaterEqual(stops[0]['dwell_seconds'], 600)
+
+    def test_gps_jump_does_not_split_a_stop(self):
+        self.drive(600, 10)
+        self.wait(400)
+        timestamp, lat, lng = self.points[-1]
+        self.points.append((timestamp + 10, lat + 800 * self.DEG_PER_M, lng))
+        self.wait(400, at=(lat, lng))
+        self.drive(600, 10)
+        stops = self.stops()
+        self.assertEqual(len(stops), 1)
+        self.assertAlmostEqual(stops[0]['dwell_seconds'], 820, delta=30)
+
+    def test_short_pauses_and_empty_tracks(self):
+        self.drive(600, 10)
+        self.wait(120)
+        self.drive(600, 10)
+        self.assertEqual(self.stops(), [])
+        self.assertEqual(detect_stops(np.array([]), np.array([]), np.array([])), [])
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.driver = get_user_model().objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace')
+        self.now = timezone.now().replace(minute=30, second=0, microsecond=0)
+
+    def fix(self, minutes_ago, lat=12.9, speed=30.0):
+        Location.objects.bulk_create([Location(truck=self.truck, driver=self.driver, latitude=lat, longitude=77.6,
+                                               speed=speed, timestamp=self.now - timedelta(minutes=minutes_ago))])
+
+    def roll_up(self, seconds_later=0):
+        with mock.patch.object(rollups.timezone, 'now', return_value=self.now + timedelta(seconds=seconds_later)):
+            return rollups.roll_up_batch()
+
+    def day(self):
+        return LocationRollup.objects.get(granularity='day', truck=self.truck)
+
+    def test_ids_are_folded_once_settled(self):
+        self.fix(5)
+        self.fix(1, lat=12.91)
+        # First sighting only: a lower id could still be about to commit
+        self.assertEqual(self.roll_up(), 0)
+        self.assertEqual(self.roll_up(5), 0)
+        self.assertEqual(self.roll_up(11), 2)
+        day = self.day()
+        self.assertEqual(day.point_count, 2)
+        self.assertAlmostEqual(day.distance_km, 1.11, delta=0.01)
+        self.assertEqual(self.roll_up(30), 0)
+
+    def test_late_fixes_are_not_skipped(self):
+        self.fix(0)
+        # Buffered while the truck was offline: an old timestamp on a newer id
+        self.fix(120, lat=12.95)
+        self.roll_up()
+        self.assertEqual(self.roll_up(11), 2)
+        self.assertEqual(self.day().point_count, 2)
+        hours = LocationRollup.objects.filter(granularity='hour', truck=self.truck).order_by('bucket_start')
+        self.assertEqual([row.point_count for row in hours], [1, 1])
+
+        # A straggler arriving after its hour was rolled up is merged into it
+        self.fix(121, lat=12.96)
+        self.roll_up(30)
+        self.assertEqual(self.roll_up(45), 1)
+        self.assertEqual([row.point_count for row in hours.all()], [2, 1])
+        self.assertEqual(hours.all()[0].first_latitude, 12.96)
+
+    def test_previous_fix_comes_from_the_latest_day(self):
+        self.fix(0, lat=12.91)
+        self.fix(60 * 24, lat=12.92)
+        self.fix(60 * 48, lat=12.93)
+        self.roll_up()
+        self.roll_up(11)
+        self.assertEqual(LocationRollup.objects.filter(granularity='day', truck=self.truck).count(), 3)
+        with self.assertNumQueries(1):
+            previous = rollups._previous_fixes([self.truck.id])
+        epoch, lat, lng = previous[self.truck.id]
+        self.assertAlmostEqual(epoch, self.now.timestamp(), places=3)
+        self.assertEqual((lat, lng), (12.91, 77.6))
+
+
+class TileCacheTests(SimpleTestCase):
+    def test_touch_invalidates_only_the_tiles_hit(self):
+        cache = TileCache('test', max_zoom=12)
+        here, elsewhere = (12, *tile_for(12.9, 77.6, 12)), (12, *tile_for(28.6, 77.2, 12))
+        for tile in (here, elsewhere):
+            cache.put(('key', tile), cache.generation(tile), b'tile')
+        cache.touch(12.9, 77.6)
+        self.assertIsNone(cache.get(('key', here), here))
+        self.assertEqual(cache.get(('key', elsewhere), elsewhere), b'tile')
+        # Every zoom level of the point is touched
+        self.assertEqual(len(cache._generations), 13)
+
+    def test_generations_are_bounded(self):
+        cache = TileCache('test', max_zoom=12, min_touch_zoom=10, max_generations=50)
+        first = (12, *tile_for(12.9, 77.6, 12))
+        cache.touch(12.9, 77.6)
+        cache.put(('key', first), cache.generation(first), b'tile')
+        untouched = (12, *tile_for(-33.9, 151.2, 12))
+        cache.put(('key', untouched), cache.generation(untouched), b'tile')
+        for i in range(100):
+            cache.touch(13 + i * 0.1, 78.0)
+        self.assertLessEqual(len(cache._generations), 50)
+        self.assertNotIn(first, cache._generations)
+        # Forgetting a tile's generation may cost a re-render but never serves a stale tile
+        self.assertIsNone(cache.get(('key', first), first))
+        self.assertIsNone(cache.get(('key', untouched), untouched))
+        cache.put(('key', first), cache.generation(first), b'new')
+        self.assertEqual(cache.get(('key', first), first), b'new')
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.driver = get_user_model().objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=self.driver)
+        self.day = timezone.now().date() - timedelta(days=3)
+        self.midnight = timezone.make_aware(datetime.combine(self.day, datetime.min.time()), dt_timezone.utc)
+
+    def fix(self, minutes, lat, lng, speed=0):
+        with self.captureOnCommitCallbacks():
+            location = Location.objects.create(truck=self.truck, driver=self.driver, latitude=lat, longitude=lng,
+                                               speed=speed, heading=90.25, accuracy=4.5)
+        timestamp = self.midnight + timedelta(minutes=minutes, microseconds=123)
+        Location.objects.filter(id=location.id).update(timestamp=timestamp)
+        return location.id
+
+    def test_columns_round_trip(self):
+        columns = {
+            'id': [5, 6, 9, 300, 70000],
+            'driver_id': [3] * 5,
+            # Deltas that need 4 and then 8 bytes
+            'timestamp_us': [10 ** 15 + delta for delta in (0, 10 ** 6, 2 * 10 ** 6, 10 ** 12, 10 ** 12)],
+            'latitude': [129000000, 128999990, 129000500, -337000000, 0],
+            'longitude': [776000000] * 5,
+            'speed': [0, 4050, 0, 12000, -1],
+            'heading': [0, 35999, 1, 0, 18000],
+            'accuracy': [500] * 5,
+        }
+        for n in (5, 1, 0):
+            part = {name: values[:n] for name, values in columns.items()}
+            decoded = archive.decode_columns(archive.encode_columns(part))
+            for name, values in part.items():
+                self.assertEqual(decoded[name].tolist(), values, (n, name))
+        # Constant and small-step columns shrink to a byte per delta
+        self.assertLess(len(archive.encode_columns(columns)), len(archive.COLUMNS) * 5 * 8)
+        with self.assertRaises(ValueError):
+            archive.decode_columns(b'JUNK' + archive.encode_columns(columns)[4:])
+
+    def test_compressed_round_trip(self):
+        raw = archive.encode_columns({name: np.arange(1000) * 7 for name, _ in archive.COLUMNS})
+        for codec in ('zlib',) + (('zstd',) if archive.zstandard is not None else ()):
+            used, data = archive.compress(raw, codec)
+            self.assertEqual(used, codec)
+            self.assertEqual(archive.decompress(codec, data), raw)
+
+    def test_truck_day_round_trip(self):
+        ids = [self.fix(0, '12.9000001', '77.6000000', speed=12.34),
+               self.fix(5, '12.9123456', '77.5999999', speed=0),
+               self.fix(10, '-12.9000009', '77.6000001', speed=80.5)]
+        expected = list(Location.objects.order_by('-timestamp').values_list(
+            'id', 'timestamp', 'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'driver_id'))
+
+        # A fix newer than the cutoff keeps the day live
+        self.assertEqual(archive.archive_truck_day(self.truck.id, self.day, ids[1]), (0, None))
+        count, block = archive.archive_truck_day(self.truck.id, self.day, ids[-1])
+        self.assertEqual((count, block.point_count), (3, 3))
+        self.assertFalse(Location.objects.exists())
+        archived = [(location.id, location.timestamp, location.latitude, location.longitude, location.speed,
+                     location.heading, location.accuracy, location.driver_id)
+                    for location in archive.archived_locations(self.truck)]
+        self.assertEqual(archived, expected)
+
+        # A late fix for the day is merged in time order
+        late = self.fix(7, '12.95', '77.65')
+        count, block = archive.archive_truck_day(self.truck.id, self.day, late)
+        self.assertEqual((count, block.point_count), (1, 4))
+        self.assertEqual([location.id for location in archive.archived_locations(self.truck)],
+                         [ids[2], late, ids[1], ids[0]])
+        self.assertEqual([location.id for location in archive.archived_locations(self.truck, limit=2)],
+                         [ids[2], late])
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def read_message(data):
+    """(field number, value) pairs of a protobuf message: ints for varints, bytes otherwise"""
+    fields, offset = [], 0
+    while offset < len(data):
+        key, offset = read_varint(data, offset)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, offset = read_varint(data, offset)
+        elif wire_type == 1:
+            value, offset = data[offset:offset + 8], offset + 8
+        else:
+            length, offset = read_varint(data, offset)
+            value, offset = data[offset:offset + length], offset + length
+        fields.append((number, value))
+    return fields
+
+
+def read_packed(data):
+    values, offset = [], 0
+    while offset < len(data):
+        value, offset = read_varint(data, offset)
+        values.append(value)
+    return values
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def read_tile(data):
+    """{layer name: (extent, [(id, type, properties, lines)])} of an encoded vector tile"""
+    layers = {}
+    for number, layer_data in read_message(data):
+        assert number == 3
+        layer = read_message(layer_data)
+        keys = [value.decode() for number, value in layer if number == 3]
+        values = []
+        for number, value_data in layer:
+            if number != 4:
+                continue
+            (kind, value), = read_message(value_data)
+            values.append({1: lambda v: v.decode(), 3: lambda v: struct.unpack('<d', v)[0], 5: int,
+                           6: unzigzag, 7: bool}[kind](value))
+        features = []
+        for number, feature_data in layer:
+            if number != 2:
+                continue
+            feature = dict(read_message(feature_data))
+            tags = read_packed(feature.get(2, b''))
+            commands = read_packed(feature[4])
+            lines, x, y, i = [], 0, 0, 0
+            while i < len(commands):
+                command, count = commands[i] & 7, commands[i] >> 3
+                i += 1
+                if command == 1:
+                    lines.append([])
+                for _ in range(count):
+                    x, y = x + unzigzag(commands[i]), y + unzigzag(commands[i + 1])
+                    i += 2
+                    lines[-1].append((x, y))
+            properties = {keys[tags[j]]: values[tags[j + 1]] for j in range(0, len(tags), 2)}
+            features.append((feature.get(1), feature[3], properties, lines))
+        fields = dict(layer)
+        assert fields[15] == 2
+        layers[fields[1].decode()] = (fields[5], features)
+    return layers
+
+
+class VectorTileTests(TestCase):
+    def test_layer_encoding(self):
+        layer = mvt.Layer('test')
+        layer.add(mvt.POINT, mvt.point_geometry(10, -5),
+                  {'name': 'a', 'delta': -3, 'count': 7, 'ratio': 1.5, 'ok': True, 'missing': None}, feature_id=9)
+        layer.add(mvt.LINESTRING, mvt.line_geometry([np.array([[0, 0], [10, 0], [10, 10]]),
+                                                      np.array([[20, 20], [25, 30]])]), {'name': 'a'})
+        extent, features = read_tile(layer.encode())['test']
+        self.assertEqual(extent, mvt.EXTENT)
+        self.assertEqual(features, [
+            (9, mvt.POINT, {'name': 'a', 'delta': -3, 'count': 7, 'ratio': 1.5, 'ok': True}, [[(10, -5)]]),
+            (None, mvt.LINESTRING, {'name': 'a'}, [[(0, 0), (10, 0), (10, 10)], [(20, 20), (25, 30)]]),
+        ])
+        # Keys and values are stored once per layer
+        self.assertEqual(len(layer._values), 5)
+
+    def test_simplify(self):
+        xs = np.arange(0, 101, 10, dtype=np.float64)
+        ys = np.where(np.arange(len(xs)) % 2, 0.5, 0.0)
+        ys[5] = 40
+        self.assertEqual(np.flatnonzero(mvt.simplify(xs, ys, 1.0)).tolist(), [0, 4, 5, 6, 10])
+
+    def test_vector_tile(self):
+        driver = get_user_model().objects.create_user('driver', password='pass', role='driver')
+        truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=driver)
+        z = 14
+        x, y = tile_for(12.9716, 77.5946, z)
+        south, west, north, east = tile_bounds(z, x, y)
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(4):
+                Location.objects.create(truck=truck, driver=driver, latitude=round((south + north) / 2, 7),
+                                        longitude=round(west + (east - west) * (i + 1) / 5, 7))
+        layers = read_tile(mvt.vector_tile(z, x, y, Truck.objects.all(), scope='tests'))
+
+        (truck_id, kind, properties, [[point]]), = layers['trucks'][1]
+        self.assertEqual((truck_id, kind, properties['truck_number']), (truck.id, mvt.POINT, 'T1'))
+        # The truck sits at its last fix, four fifths across the middle of the tile
+        self.assertAlmostEqual(point[0], mvt.EXTENT * 4 / 5, delta=1)
+        # A straight track simplifies to its two ends
+        (truck_id, kind, properties, [line]), = layers['tracks'][1]
+        self.assertEqual((truck_id, kind, properties['points']), (truck.id, mvt.LINESTRING, 2))
+        self.assertEqual(line[1], point)
+        self.assertAlmostEqual(line[0][0], mvt.EXTENT / 5, delta=1)
+
+    def test_tracks_break_where_the_truck_left_the_tile(self):
+        driver = get_user_model().objects.create_user('driver', password='pass', role='driver')
+        truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=driver)
+        z = 14
+        x, y = tile_for(12.9716, 77.5946, z)
+        south, west, north, east = tile_bounds(z, x, y)
+        middle = (south + north) / 2
+        start = timezone.now() - timedelta(minutes=10)
+        # Across the tile, out of it for a minute, then back and across again
+        points = [(middle, west + (east - west) * i / 5) for i in (1, 2)] + [(middle + 0.1, east)] + \
+                 [(middle, west + (east - west) * i / 5) for i in (3, 4)]
+        Location.objects.bulk_create([
+            Location(truck=truck, driver=driver, latitude=round(lat, 7), longitude=round(lng, 7),
+                     timestamp=start + timedelta(minutes=i))
+            for i, (lat, lng) in enumerate(points)
+        ])
+        layer = mvt.tracks_layer(z, x, y, [truck.id], None, None)
+        (truck_id, kind, properties, lines), = read_tile(layer.encode())['tracks'][1]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(properties['points'], 4)
+
+
+class HeatmapTileTests(TestCase):
+    def test_scale_must_be_positive(self):
+        admin = get_user_model().objects.create_user('admin', password='pass', role='admin')
+        client = APIClient()
+        client.force_authenticate(admin)
+        x, y = tile_for(12.9716, 77.5946, 12)
+        path = f'/api/tracking/heatmap/12/{x}/{y}.json'
+        for scale in ('nan', 'inf', '-inf', '0', '-5', 'x'):
+            self.assertEqual(client.get(path, {'scale': scale}).status_code, 400, scale)
+        self.assertEqual(client.get(path, {'scale': '25'}).status_code, 200)
+        self.assertEqual(client.get(path).status_code, 200)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+        self.driver = User.objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=self.driver)
+        with self.captureOnCommitCallbacks():
+            self.fixes = [Location.objects.create(truck=self.truck, driver=self.driver, latitude=12.9 + i / 1000,
+                                                  longitude=77.6) for i in range(5)]
+
+    def path(self, user, path='/api/tracking/fleet/events/'):
+        return f'{path}?token={AccessToken.for_user(user)}'
+
+    async def frames(self, path, count, last_event_id):
+        """The first ``count`` frames of a stream resumed after ``last_event_id``, past the retry hint"""
+        response = await AsyncClient().get(path, headers={'Last-Event-ID': str(last_event_id)})
+        self.assertEqual(response.status_code, 200)
+        stream = response.streaming_content
+        frames = []
+        try:
+            while len(frames) <= count:
+                frames.append((await anext(stream)).decode())
+        finally:
+            await stream.aclose()
+        return frames[1:]
+
+    @staticmethod
+    def parse(frame):
+        fields = dict(line.split(': ', 1) for line in frame.strip().splitlines())
+        return fields.get('id'), fields['event'], json.loads(fields['data'])
+
+    async def test_resume_replays_missed_fixes(self):
+        frames = await self.frames(self.path(self.admin), 3, self.fixes[1].id)
+        self.assertEqual([self.parse(frame)[0] for frame in frames], [str(fix.id) for fix in self.fixes[2:]])
+        event_id, event, payload = self.parse(frames[0])
+        self.assertEqual((event, payload['data']['truck']), ('location_update', self.truck.id))
+
+    @override_settings(SSE_REPLAY_LIMIT=2)
+    async def test_too_many_missed_fixes_resync(self):
+        path = self.path(self.driver, f'/api/tracking/trucks/{self.truck.id}/events/')
+        frames = await self.frames(path, 1, self.fixes[0].id)
+        self.assertEqual(self.parse(frames[0]),
+                         (str(self.fixes[-1].id), 'resync', {'type': 'resync', 'last_event_id': self.fixes[-1].id}))
+
+    async def test_rejected_clients(self):
+        self.driver.is_active = False
+        await self.driver.asave()
+        client = AsyncClient()
+        response = await client.get(self.path(self.driver, f'/api/tracking/trucks/{self.truck.id}/events/'))
+        self.assertEqual(response.status_code, 401)
+        response = await client.get('/api/tracking/fleet/events/?token=garbage')
+        self.assertEqual(response.status_code, 401)
+        response = await client.get(self.path(self.admin, '/api/tracking/trucks/999/events/'))
+        self.assertEqual(response.status_code, 403)
+
+
+class ConsumerAuthTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user('admin', password='pass', role='admin')
+        self.driver = get_user_model().objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=self.driver)
+        self.application = URLRouter(websocket_urlpatterns)
+
+    async def connect(self, path, token):
+        communicator = WebsocketCommunicator(self.application, f'{path}?token={token}')
+        connected, code = await communicator.connect()
+        await communicator.disconnect()
+        return connected, code
+
+    async def test_tokens(self):
+        for path in (f'/ws/tracking/{self.truck.id}/', '/ws/tracking/multi/'):
+            self.assertEqual(await self.connect(path, AccessToken.for_user(self.driver)), (True, None), path)
+            self.assertEqual(await self.connect(path, 'garbage'), (False, 4002), path)
+            # A refresh token is no access token
+            self.assertEqual(await self.connect(path, RefreshToken.for_user(self.driver)), (False, 4002), path)
+
+    async def test_every_consumer_checks_the_token(self):
+        paths = (f'/ws/tracking/{self.truck.id}/', '/ws/tracking/multi/', '/ws/admin/dashboard/', '/ws/replay/1/')
+        for path in paths:
+            communicator = WebsocketCommunicator(self.application, path)
+            self.assertEqual(await communicator.connect(), (False, 4001), path)
+            self.assertEqual(await self.connect(path, 'garbage'), (False, 4002), path)
+        # Only admins get the dashboard
+        self.assertEqual(await self.connect('/ws/admin/dashboard/', AccessToken.for_user(self.driver)), (False, 4002))
+        self.assertEqual(await self.connect('/ws/admin/dashboard/', AccessToken.for_user(self.admin)), (True, None))
+
+    async def test_inactive_user(self):
+        token = AccessToken.for_user(self.driver)
+        self.driver.is_active = False
+        await self.driver.asave()
+        self.assertEqual(await self.connect('/ws/tracking/multi/', token), (False, 4002))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        # Metrics register themselves; keep the test ones out of the process registry
+        self.registry = metrics.Registry()
+        patcher = mock.patch.object(metrics, 'registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_histogram_buckets(self):
+        histogram = metrics.Histogram('latency_seconds', 'Latency', ['view'], buckets=(0.25, 0.5))
+        # Bucket bounds are inclusive
+        for value in (0.25, 0.375, 1.0):
+            histogram.observe(value, 'a')
+        self.assertEqual(histogram.render(), [
+            '# HELP latency_seconds Latency',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{view="a",le="0.25"} 1',
+            'latency_seconds_bucket{view="a",le="0.5"} 2',
+            'latency_seconds_bucket{view="a",le="+Inf"} 3',
+            'latency_seconds_sum{view="a"} 1.625',
+            'latency_seconds_count{view="a"} 3',
+        ])
+
+    def test_exposition(self):
+        counter = metrics.Counter('frames_total', 'Frames', ['consumer'])
+        counter.inc('say "hi"\n')
+        counter.inc('say "hi"\n', amount=2)
+        gauge = metrics.Gauge('open', 'Open sockets', ['stat'], collect=lambda: {('total',): 4})
+        self.assertEqual(self.registry.metrics, [counter, gauge])
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP frames_total Frames',
+            '# TYPE frames_total counter',
+            'frames_total{consumer="say \\"hi\\"\\n"} 3',
+            '# HELP open Open sockets',
+            '# TYPE open gauge',
+            'open{stat="total"} 4',
+        ]) + '\n')
+
+    def test_endpoint_access(self):
+        with self.settings(METRICS_ALLOWED_IPS=['127.0.0.1'], METRICS_TOKEN=''):
+            response = self.client.get('/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+            # No token configured: an empty bearer token is no way in
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1',
+                                             HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        with self.settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    def test_requests_are_recorded_by_view_name(self):
+        self.client.get('/metrics')
+        self.client.get('/no/such/page/')
+        labels = {labels for _, labels, _, _ in metrics.request_latency.samples()}
+        self.assertIn(('metrics', 'GET', '200'), labels)
+        self.assertIn(('unmatched', 'GET', '404'), labels)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+        self.driver = User.objects.create_user('driver', password='pass', role='driver')
+        profiling.profile_store.clear()
+        self.client = APIClient()
+
+    def get_trucks(self, user, **headers):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}', **headers)
+        self.assertEqual(self.client.get('/api/tracking/trucks/').status_code, 200)
+
+    def test_store_keeps_the_slowest(self):
+        store = profiling.ProfileStore(3)
+        for duration in (5, 1, 9, 3, 7):
+            store.add({'duration_ms': duration})
+        self.assertEqual([record['duration_ms'] for record in store.list()], [9, 7, 5])
+        self.assertEqual(store.get(3)['duration_ms'], 9)
+        # Evicted
+        self.assertIsNone(store.get(2))
+        store.clear()
+        self.assertEqual(store.list(), [])
+
+    def test_sampling(self):
+        with self.settings(PROFILING_SAMPLE_RATE=0.5):
+            with mock.patch('tracking.middleware.random.random', return_value=0.7):
+                self.get_trucks(self.driver)
+            self.assertEqual(profiling.profile_store.list(), [])
+            with mock.patch('tracking.middleware.random.random', return_value=0.3):
+                self.get_trucks(self.driver)
+        record, = profiling.profile_store.list()
+        self.assertEqual((record['trigger'], record['view'], record['status']), ('sample', 'truck_list_create', 200))
+        self.assertEqual(record['sql_count'], len(record['queries']))
+        self.assertGreater(record['sql_count'], 0)
+        self.assertIn('function calls', record['profile'])
+
+    def test_header_is_for_admins_only(self):
+        self.get_trucks(self.driver, HTTP_X_PROFILE='1')
+        self.assertEqual(profiling.profile_store.list(), [])
+        self.get_trucks(self.admin, HTTP_X_PROFILE='1')
+        record, = profiling.profile_store.list()
+        self.assertEqual((record['trigger'], record['user']), ('header', 'admin'))
+
+        response = self.client.get('/api/tracking/profiles/')
+        summary, = response.json()['profiles']
+        self.assertNotIn('queries', summary)
+        detail = self.client.get(f'/api/tracking/profiles/{record["id"]}/').json()
+        self.assertEqual(len(detail['queries']), record['sql_count'])
+
+
+class CompressionTests(SimpleTestCase):
+    body = json.dumps([{'truck_id': i, 'status': 'active'} for i in range(200)]).encode()
+
+    def respond(self, response, **headers):
+        request = RequestFactory().get('/', **headers)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def json_response(self, body=None, **headers):
+        response = HttpResponse(self.body if body is None else body, content_type='application/json')
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    @skipUnless(compression.brotli, 'needs brotli')
+    def test_negotiation(self):
+        self.assertEqual(compression.negotiate('gzip, deflate, br'), 'br')
+        self.assertEqual(compression.negotiate('br;q=0.5, gzip;q=0.8'), 'gzip')
+        self.assertEqual(compression.negotiate('br;q=0, *'), 'gzip')
+        self.assertIsNone(compression.negotiate('identity'))
+        self.assertIsNone(compression.negotiate('gzip;q=0, br;q=0'))
+        self.assertIsNone(compression.negotiate(''))
+
+    @skipUnless(compression.brotli, 'needs brotli')
+    def test_encodings(self):
+        response = self.respond(self.json_response(ETag='"v1"'), HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), self.body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response = self.respond(self.json_response(), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+        response = self.respond(self.json_response(), HTTP_ACCEPT_ENCODING='identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.body)
+        # Still varies: another client would get it compressed
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_small_and_binary_responses(self):
+        with self.settings(COMPRESSION_MIN_BYTES=1024):
+            small = self.respond(self.json_response(self.body[:1023]), HTTP_ACCEPT_ENCODING='gzip')
+            self.assertFalse(small.has_header('Content-Encoding'))
+            self.assertFalse(small.has_header('Vary'))
+            self.assertEqual(self.respond(self.json_response(self.body[:1024]),
+                                          HTTP_ACCEPT_ENCODING='gzip')['Content-Encoding'], 'gzip')
+        image = HttpResponse(self.body, content_type='image/png')
+        self.assertFalse(self.respond(image, HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+
+    def test_streaming(self):
+        chunks = [self.body[i:i + 500] for i in range(0, len(self.body), 500)]
+        response = self.respond(StreamingHttpResponse(iter(chunks), content_type='text/csv'),
+                                HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.body)
+
+        # Event streams are flushed per event: each compressed chunk decodes on its own
+        events = [b'data: one\n\n', b'data: two\n\n']
+        response = self.respond(StreamingHttpResponse(iter(events), content_type='text/event-stream'),
+                                HTTP_ACCEPT_ENCODING='gzip')
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        stream = iter(response.streaming_content)
+        for event in events:
+            self.assertEqual(decoder.decompress(next(stream)), event)
+
+    def test_no_transform(self):
+        response = self.respond(self.json_response(**{'Cache-Control': 'private, no-transform'}),
+                                HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.body)
+
+    def test_cookie_requests_are_not_compressed(self):
+        response = self.respond(self.json_response(), HTTP_ACCEPT_ENCODING='gzip',
+                                HTTP_COOKIE=f'{settings.SESSION_COOKIE_NAME}=abc')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        setting_cookie = self.json_response()
+        setting_cookie.set_cookie(settings.CSRF_COOKIE_NAME, 'secret')
+        self.assertFalse(self.respond(setting_cookie, HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+        # Other cookies do not matter
+        response = self.respond(self.json_response(), HTTP_ACCEPT_ENCODING='gzip', HTTP_COOKIE='theme=dark')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class TripReplayTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+        self.driver = User.objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=self.driver)
+        self.started_at = timezone.now() - timedelta(hours=1)
+        self.route = make_delivery_route(self.admin, self.driver, self.truck, status='completed',
+                                         started_at=self.started_at,
+                                         completed_at=self.started_at + timedelta(minutes=30))
+        self.application = URLRouter(websocket_urlpatterns)
+
+    def add_fixes(self, seconds):
+        return Location.objects.bulk_create([
+            Location(truck=self.truck, driver=self.driver, latitude=12.9 + i * 0.001, longitude=77.6,
+                     timestamp=self.started_at + timedelta(seconds=offset))
+            for i, offset in enumerate(seconds)
+        ])
+
+    async def replay(self, speed):
+        communicator = WebsocketCommunicator(
+            self.application, f'/ws/replay/{self.route.id}/?token={AccessToken.for_user(self.driver)}&speed={speed}',
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_speed_change_applies_to_the_current_wait(self):
+        await database_sync_to_async(self.add_fixes)([0, 60])
+        communicator = await self.replay(1)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'location_update')
+        # The next fix is a minute away at 1x; at 100x it is due in 0.6 s
+        await communicator.send_json_to({'type': 'set_speed', 'speed': 100})
+        self.assertEqual((await communicator.receive_json_from(timeout=3))['type'], 'location_update')
+        self.assertEqual(await communicator.receive_json_from(), {
+            'type': 'replay_complete', 'route_id': self.route.id, 'count': 2,
+        })
+        await communicator.disconnect()
+
+    async def test_keyset_chunks_resume_after_the_boundary(self):
+        # Ties on the timestamp straddle both chunk boundaries; the last fix is after the route ended
+        fixes = await database_sync_to_async(self.add_fixes)([0, 1, 1, 1, 1, 2, 3600])
+        with mock.patch.object(TripReplayConsumer, 'CHUNK_SIZE', 2):
+            communicator = await self.replay(100)
+            frames = [await communicator.receive_json_from() for _ in range(7)]
+            await communicator.disconnect()
+        self.assertEqual([frame['type'] for frame in frames], ['location_update'] * 6 + ['replay_complete'])
+        self.assertEqual([frame['location']['id'] for frame in frames[:6]], [fix.id for fix in fixes[:6]])
+        self.assertEqual(frames[6]['count'], 6)
+
+    async def test_long_gaps_are_shortened(self):
+        await database_sync_to_async(self.add_fixes)([0, 1200])
+        communicator = await self.replay(100)
+        await communicator.receive_json_from()
+        # 20 minutes at 100x would be 12 s; the gap is cut to MAX_GAP_SECONDS (3 s at 100x)
+        self.assertEqual((await communicator.receive_json_from(timeout=5))['type'], 'location_update')
+        await communicator.disconnect()
+
+
+class PruneDataTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user('admin', password='pass', role='admin')
+        self.driver = User.objects.create_user('driver', password='pass', role='driver')
+        self.truck = Truck.objects.create(truck_number='T1', license_plate='KA-01', model='Ace', driver=self.driver)
+        self.long_ago = timezone.now() - timedelta(days=400)
+
+    def prune(self, *policies, dry_run=False):
+        out = StringIO()
+        call_command('prune_data', '--only', *policies, '--sleep', '0', *(['--dry-run'] if dry_run else []), stdout=out)
+        return out.getvalue()
+
+    def bid(self, route, status):
+        now = timezone.now()
+        bid = RouteBid.objects.create(route_request=route, driver=self.driver, truck=self.truck, bid_amount=1500,
+                                      estimated_pickup_time=now, estimated_delivery_time=now, status=status)
+        RouteBid.objects.filter(id=bid.id).update(updated_at=self.long_ago)
+        return bid
+
+    def test_route_bids(self):
+        open_route = make_route_request(self.admin)
+        closed_routes = [make_route_request(self.admin, status='cancelled') for _ in range(2)]
+        kept = self.bid(open_route, 'withdrawn')
+        pruned = self.bid(closed_routes[0], 'rejected')
+        pending = self.bid(closed_routes[1], 'pending')
+        available_route_index.reload()
+
+        self.assertIn('would delete 1 rows', self.prune('route_bids', dry_run=True))
+        self.assertEqual(RouteBid.objects.count(), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIn('deleted 1 rows', self.prune('route_bids'))
+        self.assertEqual(set(RouteBid.objects.values_list('id', flat=True)), {kept.id, pending.id})
+        self.assertFalse(RouteBid.objects.filter(id=pruned.id).exists())
+
+        # The open route the driver withdrew from stays off their list, before and after a reload
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.driver)}')
+        for reload in (False, True):
+            if reload:
+                available_route_index.invalidate()
+            response = client.get('/api/tracking/available-routes/')
+            self.assertEqual(response.json()['results'], [])
+
+    def test_locations_wait_for_the_rollups(self):
+        with self.captureOnCommitCallbacks():
+            old = Location.objects.create(truck=self.truck, driver=self.driver, latitude=12.9, longitude=77.6)
+            recent = Location.objects.create(truck=self.truck, driver=self.driver, latitude=12.9, longitude=77.6)
+        Location.objects.filter(id=old.id).update(timestamp=self.long_ago)
+        self.assertIn('skipped', self.prune('locations'))
+
+        RollupWatermark.objects.create(name=rollups.WATERMARK_NAME, last_location_id=recent.id)
+        self.prune('locations')
+        self.assertEqual(list(Location.objects.values_list('id', flat=True)), [recent.id])
@@ -0,0 +1,160 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+TILE_SIZE = 256
+MAX_ZOOM = 18
+# Web Mercator stops here; tiles cover latitudes within +/- this value
+MAX_LATITUDE = 85.0511287798
+
+
+def tile_bounds(z, x, y):
+    """(south, west, north, east) in degrees of an XYZ tile"""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+
+def tile_for(lat, lng, z):
+    """XYZ tile containing a point"""
+    n = 2 ** z
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def project(lats, lngs, z, x, y, extent=TILE_SIZE):
+    """Arrays of points -> pixel coordinates within tile (z, x, y), vectorized.
+
+    Points outside the tile get coordinates outside [0, extent).
+    """
+    n = 2 ** z
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    px = ((np.asarray(lngs, dtype=np.float64) + 180.0) / 360.0 * n - x) * extent
+    py = ((1 - np.arcsinh(np.tan(np.radians(lats))) / np.pi) / 2 * n - y) * extent
+    return px, py
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def is_closed_range(end):
+    """Whether a time range ended long enough ago (``TILE_CLOSED_AFTER``) that no more fixes will land in it"""
+    closed_after = timedelta(seconds=getattr(settings, 'TILE_CLOSED_AFTER', 86400))
+    return end is not None and end < timezone.now() - closed_after
+
+
+class TileCache:
+    """LRU cache of rendered tiles with per-tile invalidation.
+
+    Every tile has a generation counter that is bumped when a new fix lands
+    inside it (``touch``), and cached entries remember the generation they
+    were rendered at, so only tiles that actually received data are
+    re-rendered. Entries for time ranges that may still receive fixes also
+    expire after ``ttl`` seconds, which bounds staleness for fixes ingested by
+    other worker processes. Tiles whose time range is closed (ended before
+    fixes could still arrive) never change; they are kept regardless of
+    generation and additionally written to ``directory`` (when set) so they
+    survive restarts.
+
+    Generations come from one counter and only the ``max_generations`` most
+    recently touched tiles keep their own; any other tile reads as the
+    highest generation dropped so far, which can only make cached entries
+    look stale, never fresh. ``touch`` skips zooms below ``min_touch_zoom``,
+    for caches whose low zooms are drawn from rollups rather than raw fixes.
+    """
+
+    def __init__(self, name, max_entries=2048, ttl=60, directory=None, max_zoom=MAX_ZOOM, min_touch_zoom=0,
+                 max_generations=65536):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self.max_zoom = max_zoom
+        self.min_touch_zoom = min_touch_zoom
+        self.max_generations = max_generations
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()       # key -> (generation, stored_at, data)
+        self._generations = OrderedDict()   # (z, x, y) -> generation, least recently touched first
+        self._counter = 0                   # last generation handed out
+        self._floor = 0                     # generation of every tile not in _generations
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, self.name, digest[:2], digest)
+
+    def get(self, key, tile, closed=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                generation, stored_at, data = entry
+                fresh = generation == self.generation(tile) and time.monotonic() - stored_at < self.ttl
+                if closed or fresh:
+                    self._entries.move_to_end(key)
+                    return data
+                del self._entries[key]
+        if closed and self.directory:
+            try:
+                with open(self._disk_path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                return None
+            self._store(key, self.generation(tile), data)
+            return data
+        return None
+
+    def generation(self, tile):
+        """Current generation of a tile; read it before querying the data for a tile"""
+        return self._generations.get(tile, self._floor)
+
+    def put(self, key, generation, data, closed=False):
+        self._store(key, generation, data)
+        if closed and self.directory:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def _store(self, key, generation, data):
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic(), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def touch(self, lat, lng):
+        """A fix landed at (lat, lng): invalidate the tile containing it at every zoom"""
+        # Tiles nest, so each zoom's tile is the deepest one shifted down
+        x, y = tile_for(lat, lng, self.max_zoom)
+        with self._lock:
+            generations = self._generations
+            for z in range(self.min_touch_zoom, self.max_zoom + 1):
+                shift = self.max_zoom - z
+                tile = (z, x >> shift, y >> shift)
+                self._counter += 1
+                generations[tile] = self._counter
+                generations.move_to_end(tile)
+            while len(generations) > self.max_generations:
+                _, generation = generations.popitem(last=False)
+                self._floor = max(self._floor, generation)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._floor = self._counter
@@ -0,0 +1,152 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .geo import haversine_km
+
+# Below this speed a truck counts as idle (GPS jitter while parked)
+MOVING_SPEED_KMH = 5.0
+# Beyond this gap between fixes the reported speed no longer describes the segment
+MAX_FIX_GAP_SECONDS = 300
+
+STAT_FIELDS = (
+    'distance_km', 'moving_seconds', 'idle_seconds', 'max_speed_kmh',
+    'last_fix_latitude', 'last_fix_longitude', 'last_fix_at',
+)
+
+
+class TripStats:
+    __slots__ = STAT_FIELDS + ('fixes_since_persist', 'persisted_at')
+
+    def __init__(self, route=None):
+        for field in STAT_FIELDS:
+            setattr(self, field, getattr(route, field) if route is not None else None)
+        for field in ('distance_km', 'moving_seconds', 'idle_seconds', 'max_speed_kmh'):
+            setattr(self, field, getattr(self, field) or 0.0)
+        self.fixes_since_persist = 0
+        self.persisted_at = time.monotonic()
+
+    def add_fix(self, lat, lng, timestamp, reported_speed):
+        if self.last_fix_at is not None:
+            dt = (timestamp - self.last_fix_at).total_seconds()
+            if dt <= 0:
+                return
+            segment_km = haversine_km(self.last_fix_latitude, self.last_fix_longitude, lat, lng)
+            implied_speed = segment_km / dt * 3600
+            speed = reported_speed if reported_speed and dt <= MAX_FIX_GAP_SECONDS else implied_speed
+            if speed >= MOVING_SPEED_KMH:
+                self.distance_km += segment_km
+                self.moving_seconds += dt
+                self.max_speed_kmh = max(self.max_speed_kmh, speed)
+            else:
+                self.idle_seconds += dt
+        self.last_fix_latitude = lat
+        self.last_fix_longitude = lng
+        self.last_fix_at = timestamp
+        self.fixes_since_persist += 1
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in STAT_FIELDS}
+
+
+class TripStatsTracker:
+    """Running trip statistics for in-progress delivery routes.
+
+    Every fix for a truck with an in-progress route updates that route's
+    accumulator in memory; accumulators are written back to the route every
+    ``TRIP_STATS_PERSIST_SECONDS`` or ``TRIP_STATS_PERSIST_FIXES`` fixes and
+    once more when the route is completed. After a restart they resume from
+    the persisted values, so no Location rows are ever rescanned.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = None        # truck id -> in-progress route id
+        self._active_loaded_at = None
+        self._stats = {}           # route id -> TripStats
+
+    def invalidate(self):
+        self._active_loaded_at = None
+
+    def active_route_id(self, truck_id):
+        ttl = getattr(settings, 'ACTIVE_ROUTES_TTL', 60)
+        if self._active_loaded_at is None or time.monotonic() - self._active_loaded_at > ttl:
+            from .models import DeliveryRoute
+
+            active = dict(DeliveryRoute.objects.filter(status='in_progress').values_list('truck_id', 'id'))
+            with self._lock:
+                self._active = active
+                self._active_loaded_at = time.monotonic()
+                for route_id in set(self._stats) - set(active.values()):
+                    del self._stats[route_id]
+        return self._active.get(truck_id)
+
+    def _get(self, route_id):
+        stats = self._stats.get(route_id)
+        if stats is None:
+            from .models import DeliveryRoute
+
+            route = DeliveryRoute.objects.filter(id=route_id).only(*STAT_FIELDS).first()
+            stats = self._stats[route_id] = TripStats(route)
+        return stats
+
+    def record_fix(self, location):
+        route_id = self.active_route_id(location.truck_id)
+        if route_id is None:
+            return
+        with self._lock:
+            stats = self._get(route_id)
+            stats.add_fix(float(location.latitude), float(location.longitude),
+                          location.timestamp, float(location.speed or 0))
+            persist_every = getattr(settings, 'TRIP_STATS_PERSIST_SECONDS', 30)
+            persist_fixes = getattr(settings, 'TRIP_STATS_PERSIST_FIXES', 20)
+            due = (stats.fixes_since_persist >= persist_fixes
+                   or time.monotonic() - stats.persisted_at >= persist_every)
+            values = stats.as_dict() if due else None
+            if due:
+                stats.fixes_since_persist = 0
+                stats.persisted_at = time.monotonic()
+        if values is not None:
+            self._persist(route_id, values)
+
+    def _persist(self, route_id, values):
+        from .models import DeliveryRoute
+
+        # update() rather than save() so periodic flushes don't fire route signals
+        DeliveryRoute.objects.filter(id=route_id).update(**values)
+
+    def summary(self, route):
+        """Current trip statistics for a route, live if it is in progress"""
+        with self._lock:
+            stats = self._stats.get(route.id)
+            values = stats.as_dict() if stats is not None else {field: getattr(route, field) for field in STAT_FIELDS}
+        duration = None
+        if route.started_at:
+            end = route.completed_at or values['last_fix_at'] or route.started_at
+            duration = (end - route.started_at).total_seconds()
+        moving_hours = values['moving_seconds'] / 3600
+        return {
+            'route_id': route.id,
+            'status': route.status,
+            'started_at': route.started_at,
+            'completed_at': route.completed_at,
+            'duration_seconds': duration,
+            'distance_km': round(values['distance_km'], 3),
+            'moving_seconds': values['moving_seconds'],
+            'idle_seconds': values['idle_seconds'],
+            'max_speed_kmh': round(values['max_speed_kmh'], 1),
+            'avg_speed_kmh': round(values['distance_km'] / moving_hours, 1) if moving_hours else 0.0,
+            'last_fix_at': values['last_fix_at'],
+        }
+
+    def finalize(self, route):
+        """Copy the final accumulator values onto a route that is being completed"""
+        with self._lock:
+            stats = self._stats.pop(route.id, None)
+        if stats is not None:
+            for field, value in stats.as_dict().items():
+                setattr(route, field, value)
+
+
+trip_stats = TripStatsTracker()
@@ -1,25 +1,43 @@
 from django.urls import path
-from . import views
+from . import async_views, sse, views
 
 urlpatterns = [
     # Truck management
     path('trucks/', views.TruckListCreateView.as_view(), name='truck_list_create'),
+    path('trucks/nearby/', views.nearby_trucks, name='nearby_trucks'),
     path('trucks/<int:pk>/', views.TruckDetailView.as_view(), name='truck_detail'),
     path('trucks/<int:truck_id>/assign-driver/', views.assign_driver_to_truck, name='assign_driver'),
     
     # Location tracking
     path('locations/', views.LocationListCreateView.as_view(), name='location_list_create'),
-    path('trucks/<int:truck_id>/live-location/', views.truck_live_location, name='truck_live_location'),
+    # Served by async views (async_views.py)
+    path('trucks/<int:truck_id>/live-location/', async_views.TruckLiveLocationView.as_view(), name='truck_live_location'),
     path('trucks/<int:truck_id>/location-history/', views.truck_location_history, name='truck_location_history'),
+    path('trucks/<int:truck_id>/locations/export/', views.truck_location_export, name='truck_location_export'),
+    path('trucks/<int:truck_id>/stops/', views.truck_stops, name='truck_stops'),
+    path('trucks/<int:truck_id>/events/', sse.truck_events, name='truck_events'),
     
     # Delivery routes
     path('routes/', views.DeliveryRouteListCreateView.as_view(), name='route_list_create'),
     path('routes/<int:pk>/', views.DeliveryRouteDetailView.as_view(), name='route_detail'),
     path('routes/<int:route_id>/start/', views.start_route, name='start_route'),
     path('routes/<int:route_id>/complete/', views.complete_route, name='complete_route'),
+    path('routes/<int:route_id>/summary/', views.route_summary, name='route_summary'),
+    
+    # Geofences
+    path('geofences/', views.GeofenceListCreateView.as_view(), name='geofence_list_create'),
+    path('geofences/<int:pk>/', views.GeofenceDetailView.as_view(), name='geofence_detail'),
     
     # Dashboard
     path('dashboard/', views.dashboard_data, name='dashboard_data'),
+    path('fleet/events/', sse.fleet_events, name='fleet_events'),
+    path('fleet/positions/', async_views.FleetPositionsView.as_view(), name='fleet_positions'),
+    
+    # Analytics (served from location rollups)
+    path('analytics/fleet-kpis/', views.fleet_kpis, name='fleet_kpis'),
+    path('analytics/trucks/<int:truck_id>/rollups/', views.truck_rollups, name='truck_rollups'),
+    path('heatmap/<int:z>/<int:x>/<int:y>.<str:fmt>', views.heatmap_tile, name='heatmap_tile'),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', views.vector_tile, name='vector_tile'),
     
     # Route requests (bidding system)
     path('route-requests/', views.RouteRequestListCreateView.as_view(), name='route_request_list_create'),
@@ -35,4 +53,8 @@ urlpatterns = [
     
     # Driver specific routes
     path('available-routes/', views.available_routes, name='available_routes'),
+    
+    # Request profiling (admin only)
+    path('profiles/', views.request_profiles, name='request_profiles'),
+    path('profiles/<int:profile_id>/', views.request_profile_detail, name='request_profile_detail'),
 ]
@@ -1,23 +1,49 @@
+import csv
+import hmac
+import math
 from rest_framework import status, generics, permissions, serializers
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 from django.utils import timezone
-from .models import Truck, Location, DeliveryRoute, RouteRequest, RouteBid
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+from truck_tracking.db_router import ReplicaReadMixin, replica_iterator, use_replica
+from .models import Truck, Location, DeliveryRoute, RouteRequest, RouteBid, Geofence, LocationRollup
+from . import archive, heatmap, metrics, mvt, profiling, rollups, spatial, stops
+from .tiles import valid_tile
+from .trip_stats import trip_stats
+from .route_index import available_route_index, encode_cursor, decode_cursor
 from .serializers import (
     TruckSerializer, LocationSerializer, LocationCreateSerializer,
     DeliveryRouteSerializer, TruckLocationHistorySerializer,
-    RouteRequestSerializer, RouteBidSerializer
+    RouteRequestSerializer, RouteBidSerializer, GeofenceSerializer, LocationRollupSerializer
 )
 
+def parse_time_param(value):
+    """ISO datetime or date query parameter -> aware datetime (None if absent)"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
 class IsAdminOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.method in permissions.SAFE_METHODS:
             return request.user.is_authenticated
         return request.user.is_authenticated and request.user.role == 'admin'
 
-class TruckListCreateView(generics.ListCreateAPIView):
+class TruckListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     serializer_class = TruckSerializer
     permission_classes = [IsAdminOrReadOnly]
 
@@ -39,6 +65,48 @@ class TruckDetailView(generics.RetrieveUpdateDestroyAPIView):
             return Truck.objects.filter(driver=self.request.user)
         return Truck.objects.none()
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def nearby_trucks(request):
+    """Active trucks within radius_km of a point, nearest first"""
+    if request.user.role != 'admin':
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        lat = float(request.query_params['lat'])
+        lng = float(request.query_params['lng'])
+        radius_km = float(request.query_params.get('radius_km', 20))
+    except (KeyError, ValueError):
+        return Response({'error': 'lat and lng are required'}, status=status.HTTP_400_BAD_REQUEST)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not 0 < radius_km <= 1000:
+        return Response({'error': 'Invalid coordinates or radius'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = spatial.nearby_trucks(lat, lng, radius_km, request.query_params.get('truck_type'))
+    return Response([
+        {
+            'truck': TruckSerializer(truck).data,
+            'latitude': truck.last_latitude,
+            'longitude': truck.last_longitude,
+            'last_location_at': truck.last_location_at,
+            'distance_km': round(distance, 3),
+        }
+        for truck, distance in results
+    ])
+
+POSITION_FIELDS = ('id', 'truck_number', 'truck_type', 'status', 'last_latitude', 'last_longitude', 'last_location_at')
+
+def position_data(truck):
+    """A row of Truck.values(*POSITION_FIELDS) as returned by the fleet positions view"""
+    return {
+        'truck_id': truck['id'],
+        'truck_number': truck['truck_number'],
+        'truck_type': truck['truck_type'],
+        'status': truck['status'],
+        'latitude': truck['last_latitude'],
+        'longitude': truck['last_longitude'],
+        'last_location_at': truck['last_location_at'],
+    }
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def assign_driver_to_truck(request, truck_id):
@@ -59,7 +127,7 @@ def assign_driver_to_truck(request, truck_id):
         truck.save()
         return Response(TruckSerializer(truck).data)
 
-class LocationListCreateView(generics.ListCreateAPIView):
+class LocationListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_serializer_class(self):
@@ -78,38 +146,257 @@ class LocationListCreateView(generics.ListCreateAPIView):
             return Location.objects.filter(driver=self.request.user)
         return Location.objects.none()
 
+TRACK_FIELDS = ('id', 'timestamp', 'latitude', 'longitude', 'speed', 'heading')
+
+def track_columns(rows):
+    """(id, timestamp, latitude, longitude, speed, heading) rows as parallel arrays; ts in epoch ms"""
+    columns = {'ids': [], 'ts': [], 'lat': [], 'lng': [], 'speed': [], 'heading': []}
+    for location_id, timestamp, latitude, longitude, speed, heading in rows:
+        columns['ids'].append(location_id)
+        columns['ts'].append(int(timestamp.timestamp() * 1000))
+        columns['lat'].append(float(latitude))
+        columns['lng'].append(float(longitude))
+        columns['speed'].append(speed)
+        columns['heading'].append(heading)
+    return columns
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def truck_live_location(request, truck_id):
+@use_replica
+def truck_location_history(request, truck_id):
+    """Latest fixes of a truck, newest first.
+
+    ``limit`` (1 to ``LOCATION_HISTORY_MAX_LIMIT``) caps the fixes returned.
+    ``after`` (a location id, or an ISO timestamp) returns only the fixes
+    recorded since, oldest ones first up to ``limit``; ``cursor`` in the
+    response is the id to pass next time. ``layout=columnar`` sends parallel
+    arrays in chronological order instead of one serialized object per fix.
+    """
     truck = get_object_or_404(Truck, id=truck_id)
     
     # Check permissions
     if request.user.role == 'driver' and truck.driver != request.user:
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    latest_location = Location.objects.filter(truck=truck).first()
-    if latest_location:
-        return Response(LocationSerializer(latest_location).data)
-    return Response({'message': 'No location data available'}, status=status.HTTP_404_NOT_FOUND)
+    after = request.query_params.get('after')
+    columnar = request.query_params.get('layout') == 'columnar'
+    max_limit = getattr(settings, 'LOCATION_HISTORY_MAX_LIMIT', 1000)
+    try:
+        limit = int(request.query_params.get('limit', 20))
+        if not 1 <= limit <= max_limit:
+            raise ValueError(f'limit must be between 1 and {max_limit}')
+        after_time = None if not after or after.isdigit() else parse_time_param(after)
+    except ValueError:
+        return Response({'error': f'Invalid limit/after (limit must be between 1 and {max_limit})'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    locations = Location.objects.filter(truck=truck)
+    if after:
+        # Incremental: the next fixes past the cursor, so repeated calls never skip any
+        if after_time is None:
+            locations = locations.filter(id__gt=int(after)).order_by('id')
+        else:
+            locations = locations.filter(timestamp__gt=after_time).order_by('timestamp', 'id')
+    if columnar:
+        locations = locations.values_list(*TRACK_FIELDS)
+    rows = list(locations[:limit])
+    if not after and len(rows) < limit:
+        # Older fixes may have been moved into archive blocks
+        before = (rows[-1][1] if columnar else rows[-1].timestamp) if rows else None
+        archived = archive.archived_locations(truck, end=before, limit=limit - len(rows))
+        rows += [tuple(getattr(location, field) for field in TRACK_FIELDS) for location in archived] if columnar else archived
+    # Lists are newest first, columns chronological
+    if bool(after) != columnar:
+        rows.reverse()
+    
+    ids = [row[0] if columnar else row.id for row in rows]
+    data = {
+        'truck_id': truck_id,
+        'cursor': max(ids, default=int(after) if after and after_time is None else None),
+        'more': bool(after) and len(rows) == limit,
+    }
+    if columnar:
+        data.update(layout='columnar', **track_columns(rows))
+    else:
+        data['locations'] = LocationSerializer(rows, many=True).data
+    return Response(data)
+
+class _Echo:
+    """File-like object for csv.writer that hands each row back instead of buffering it"""
+    def write(self, value):
+        return value
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def truck_location_history(request, truck_id):
+@use_replica
+def truck_location_export(request, truck_id):
+    """Stream a truck's fixes (archived and live) as CSV, oldest first"""
     truck = get_object_or_404(Truck, id=truck_id)
     
     # Check permissions
     if request.user.role == 'driver' and truck.driver != request.user:
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    limit = int(request.query_params.get('limit', 20))
-    locations = Location.objects.filter(truck=truck)[:limit]
+    try:
+        start = parse_time_param(request.query_params.get('from'))
+        end = parse_time_param(request.query_params.get('to'))
+    except ValueError:
+        return Response({'error': 'Invalid from/to'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    writer = csv.writer(_Echo())
+    response = StreamingHttpResponse(
+        # The body is read after the view returns, so it carries its own routing
+        replica_iterator(
+            (writer.writerow(row) for row in archive.export_rows(truck.id, start, end)), request.user
+        ),
+        content_type='text/csv'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{truck.truck_number}-locations.csv"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@use_replica
+def truck_stops(request, truck_id):
+    """Stops (position held within radius_m for at least min_duration seconds)"""
+    truck = get_object_or_404(Truck, id=truck_id)
+    
+    # Check permissions
+    if request.user.role == 'driver' and truck.driver != request.user:
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        start = parse_time_param(request.query_params.get('from'))
+        end = parse_time_param(request.query_params.get('to'))
+        radius_m = float(request.query_params.get('radius_m', 100))
+        min_duration = float(request.query_params.get('min_duration', 300))
+    except ValueError:
+        return Response({'error': 'Invalid from/to/radius_m/min_duration'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'truck_id': truck_id,
+        'stops': stops.truck_stops(truck_id, start, end, radius_m, min_duration),
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@use_replica
+def truck_rollups(request, truck_id):
+    """Hourly or daily location aggregates for a truck"""
+    truck = get_object_or_404(Truck, id=truck_id)
+    
+    # Check permissions
+    if request.user.role == 'driver' and truck.driver != request.user:
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    granularity = request.query_params.get('granularity', 'hour')
+    if granularity not in rollups.BUCKET_SECONDS:
+        return Response({'error': 'granularity must be hour or day'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        start = parse_time_param(request.query_params.get('from'))
+        end = parse_time_param(request.query_params.get('to'))
+    except ValueError:
+        return Response({'error': 'Invalid from/to'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    queryset = LocationRollup.objects.filter(truck=truck, granularity=granularity)
+    if start is not None:
+        queryset = queryset.filter(bucket_start__gte=start)
+    if end is not None:
+        queryset = queryset.filter(bucket_start__lt=end)
+    if start is None and end is None:
+        # Default to the last week of hours or the last 90 days
+        window = timedelta(days=7) if granularity == 'hour' else timedelta(days=90)
+        queryset = queryset.filter(bucket_start__gte=timezone.now() - window)
     
     return Response({
         'truck_id': truck_id,
-        'locations': LocationSerializer(locations, many=True).data
+        'granularity': granularity,
+        'rollups': LocationRollupSerializer(queryset.order_by('bucket_start'), many=True).data,
     })
 
-class DeliveryRouteListCreateView(generics.ListCreateAPIView):
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@use_replica
+def fleet_kpis(request):
+    """Fleet KPIs for one (UTC) day, served from the daily rollups"""
+    if request.user.role != 'admin':
+        return Response({'error': 'Only admins can view fleet KPIs'}, status=status.HTTP_403_FORBIDDEN)
+    
+    day = timezone.now().date()
+    if request.query_params.get('date'):
+        day = parse_date(request.query_params['date'])
+        if day is None:
+            return Response({'error': 'Invalid date'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(rollups.fleet_kpis(day))
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def heatmap_tile(request, z, x, y, fmt):
+    """Fleet density heatmap as a 256px PNG tile or a JSON density grid"""
+    if request.user.role != 'admin':
+        return Response({'error': 'Only admins can view the fleet heatmap'}, status=status.HTTP_403_FORBIDDEN)
+    if fmt not in ('png', 'json') or not valid_tile(z, x, y):
+        return Response({'error': 'Invalid tile'}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        start = parse_time_param(request.query_params.get('from'))
+        end = parse_time_param(request.query_params.get('to'))
+        scale = request.query_params.get('scale')
+        if scale is not None:
+            # The saturation count: log1p(scale) divides the densities
+            scale = float(scale)
+            if not math.isfinite(scale) or scale <= 0:
+                raise ValueError('scale must be positive')
+    except ValueError:
+        return Response({'error': 'Invalid from/to/scale'}, status=status.HTTP_400_BAD_REQUEST)
+    if start is None and end is None:
+        # Default to the last 24 hours, on an hour boundary so tiles stay cacheable
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=24)
+    
+    data = heatmap.heatmap_tile(z, x, y, fmt, start, end, scale)
+    response = HttpResponse(data, content_type='image/png' if fmt == 'png' else 'application/json')
+    response['Cache-Control'] = 'private, max-age=60'
+    return response
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def vector_tile(request, z, x, y):
+    """Mapbox Vector Tile with live truck positions and simplified tracks"""
+    if not valid_tile(z, x, y):
+        return Response({'error': 'Invalid tile'}, status=status.HTTP_404_NOT_FOUND)
+    
+    # Same visibility as the truck list
+    if request.user.role == 'admin':
+        trucks, scope = Truck.objects.all(), 'admin'
+    elif request.user.role == 'driver':
+        trucks, scope = Truck.objects.filter(driver=request.user), f'driver:{request.user.id}'
+    else:
+        trucks, scope = Truck.objects.none(), None
+    truck_id = request.query_params.get('truck')
+    if truck_id:
+        if not truck_id.isdigit():
+            return Response({'error': 'Invalid truck'}, status=status.HTTP_400_BAD_REQUEST)
+        trucks, scope = trucks.filter(id=truck_id), f'{scope}:truck:{truck_id}'
+    
+    layers = tuple(request.query_params.get('layers', 'trucks,tracks').split(','))
+    if not layers or any(layer not in ('trucks', 'tracks') for layer in layers):
+        return Response({'error': 'layers must be trucks and/or tracks'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        start = parse_time_param(request.query_params.get('from'))
+        end = parse_time_param(request.query_params.get('to'))
+    except ValueError:
+        return Response({'error': 'Invalid from/to'}, status=status.HTTP_400_BAD_REQUEST)
+    if start is None and end is None:
+        # Default to the last 24 hours, on an hour boundary so tiles stay cacheable
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=24)
+    
+    data = mvt.vector_tile(z, x, y, trucks, layers, start, end, scope)
+    response = HttpResponse(data, content_type='application/vnd.mapbox-vector-tile')
+    response['Cache-Control'] = 'private, max-age=10'
+    return response
+
+class DeliveryRouteListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     serializer_class = DeliveryRouteSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -151,10 +438,7 @@ def start_route(request, route_id):
     if request.user.role == 'driver' and route.driver != request.user:
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    if route.status == 'pending':
-        route.status = 'in_progress'
-        route.started_at = timezone.now()
-        route.save()
+    if route.start():
         return Response(DeliveryRouteSerializer(route).data)
     
     return Response({'error': 'Route cannot be started'}, status=status.HTTP_400_BAD_REQUEST)
@@ -168,16 +452,36 @@ def complete_route(request, route_id):
     if request.user.role == 'driver' and route.driver != request.user:
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    if route.status == 'in_progress':
-        route.status = 'completed'
-        route.completed_at = timezone.now()
-        route.save()
+    if route.complete():
         return Response(DeliveryRouteSerializer(route).data)
     
     return Response({'error': 'Route cannot be completed'}, status=status.HTTP_400_BAD_REQUEST)
 
+class GeofenceListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
+    queryset = Geofence.objects.all()
+    serializer_class = GeofenceSerializer
+    permission_classes = [IsAdminOrReadOnly]
+
+class GeofenceDetailView(generics.RetrieveUpdateDestroyAPIView):
+    queryset = Geofence.objects.all()
+    serializer_class = GeofenceSerializer
+    permission_classes = [IsAdminOrReadOnly]
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def route_summary(request, route_id):
+    """Trip statistics for a delivery route, served from the running accumulators"""
+    route = get_object_or_404(DeliveryRoute, id=route_id)
+    
+    # Check permissions
+    if request.user.role == 'driver' and route.driver != request.user:
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    return Response(trip_stats.summary(route))
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@use_replica
 def dashboard_data(request):
     if request.user.role != 'admin':
         return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
@@ -196,7 +500,7 @@ def dashboard_data(request):
     return Response(dashboard_data)
 
 # Route Request Views (Bidding System)
-class RouteRequestListCreateView(generics.ListCreateAPIView):
+class RouteRequestListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     serializer_class = RouteRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -229,7 +533,7 @@ class RouteRequestDetailView(generics.RetrieveUpdateDestroyAPIView):
         return RouteRequest.objects.none()
 
 # Route Bid Views
-class RouteBidListCreateView(generics.ListCreateAPIView):
+class RouteBidListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     serializer_class = RouteBidSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -361,7 +665,12 @@ def route_bids(request, route_request_id):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def available_routes(request):
-    """Get available routes for drivers to bid on"""
+    """Get available routes for drivers to bid on.
+
+    Served from the in-memory route index with cursor pagination. Pass
+    ``ordering=distance`` to sort by distance from the truck's current position
+    (or from ``lat``/``lng`` if given).
+    """
     if request.user.role != 'driver':
         return Response({'error': 'Driver access required'}, status=status.HTTP_403_FORBIDDEN)
     
@@ -371,15 +680,87 @@ def available_routes(request):
     except Truck.DoesNotExist:
         return Response({'error': 'No truck assigned to this driver'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get open routes that match truck type or accept any type
-    routes = RouteRequest.objects.filter(
-        status='open'
-    ).filter(
-        Q(required_truck_type='any') | Q(required_truck_type=truck.truck_type)
+    try:
+        page_size = int(request.query_params.get('page_size', 20))
+        if page_size < 1:
+            raise ValueError('page_size must be positive')
+        page_size = min(page_size, 100)
+        cursor = request.query_params.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return Response({'error': 'Invalid page_size or cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    available_route_index.ensure_loaded()
+    ordering = request.query_params.get('ordering', 'newest')
+    if ordering == 'distance':
+        lat = request.query_params.get('lat')
+        lng = request.query_params.get('lng')
+        if lat is None or lng is None:
+            # The truck row already carries its last position
+            if truck.last_latitude is None or truck.last_longitude is None:
+                return Response({'error': 'Current truck position is unknown'}, status=status.HTTP_400_BAD_REQUEST)
+            lat, lng = truck.last_latitude, truck.last_longitude
+        try:
+            lat, lng = float(lat), float(lng)
+        except ValueError:
+            return Response({'error': 'Invalid lat/lng'}, status=status.HTTP_400_BAD_REQUEST)
+        page = available_route_index.nearest(truck.truck_type, request.user.id, lat, lng, page_size, after)
+    else:
+        page = available_route_index.newest(truck.truck_type, request.user.id, page_size, after)
+    
+    # Materialize only the current page, in index order
+    route_ids = [entry.id for _, entry in page]
+    routes = RouteRequestSerializer.with_bid_stats(
+        RouteRequest.objects.filter(id__in=route_ids, status='open')
     )
+    routes_by_id = {route.id: route for route in routes}
+    found = [(sort_key, routes_by_id[entry.id]) for sort_key, entry in page if entry.id in routes_by_id]
     
-    # Exclude routes where driver already placed a bid
-    existing_bid_routes = RouteBid.objects.filter(driver=request.user).values_list('route_request_id', flat=True)
-    routes = routes.exclude(id__in=existing_bid_routes)
+    # One serializer for the page; building one per route dominated the request
+    results = RouteRequestSerializer([route for _, route in found], many=True).data
+    if ordering == 'distance':
+        for data, (sort_key, _) in zip(results, found):
+            data['distance_from_truck_km'] = sort_key[0]
     
-    return Response(RouteRequestSerializer(routes, many=True).data)
+    return Response({
+        'next': encode_cursor(page[-1][0]) if len(page) == page_size else None,
+        'results': results,
+    })
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([permissions.IsAuthenticated])
+def request_profiles(request):
+    """Slowest profiled requests of this process (DELETE clears them)"""
+    if request.user.role != 'admin':
+        return Response({'error': 'Only admins can view request profiles'}, status=status.HTTP_403_FORBIDDEN)
+    
+    if request.method == 'DELETE':
+        profiling.profile_store.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    summaries = [
+        {key: value for key, value in record.items() if key not in ('queries', 'profile')}
+        for record in profiling.profile_store.list()
+    ]
+    return Response({'profiles': summaries})
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def request_profile_detail(request, profile_id):
+    """One profile with its SQL statements (slowest first) and cProfile output"""
+    if request.user.role != 'admin':
+        return Response({'error': 'Only admins can view request profiles'}, status=status.HTTP_403_FORBIDDEN)
+    
+    record = profiling.profile_store.get(profile_id)
+    if record is None:
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({**record, 'queries': sorted(record['queries'], key=lambda query: query['ms'], reverse=True)})
+
+def metrics_endpoint(request):
+    """Prometheus scrape target: allowed from METRICS_ALLOWED_IPS or with the METRICS_TOKEN bearer token"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if not (request.META.get('REMOTE_ADDR') in allowed_ips or (token and hmac.compare_digest(supplied, token))):
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
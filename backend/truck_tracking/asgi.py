@@ -17,13 +17,14 @@ django_asgi_app = get_asgi_application()
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
+from tracking.lifecycle import LifecycleMiddleware
 from tracking.routing import websocket_urlpatterns
 
-application = ProtocolTypeRouter({
+application = LifecycleMiddleware(ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
     ),
-})
+}))
@@ -0,0 +1,107 @@
+"""Send reads of read-only views to a replica, with read-your-writes stickiness.
+
+Only code running inside ``replica_reads()`` (or a view wrapped with
+``use_replica``) reads from the ``replica`` database; everything else,
+and every write, uses ``default``. A user who has just written is pinned
+to ``default`` for REPLICA_STICKY_SECONDS so they never see their own
+change go missing while the replica catches up. The pins are kept per
+process, so the window should comfortably exceed the replication lag.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+
+# Whether reads in the current context may go to the replica
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+# Per-request state shared with the router, set by ReplicaStickinessMiddleware
+request_state = contextvars.ContextVar('replica_request_state', default=None)
+
+_recent_writers = {}
+_lock = threading.Lock()
+
+
+def replica_configured():
+    return REPLICA in connections.settings
+
+
+def record_write(user_id):
+    with _lock:
+        now = time.monotonic()
+        _recent_writers[user_id] = now + getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+        if len(_recent_writers) > 10000:
+            for key in [key for key, until in _recent_writers.items() if until < now]:
+                del _recent_writers[key]
+
+
+def is_sticky(user_id):
+    with _lock:
+        until = _recent_writers.get(user_id)
+    return until is not None and until > time.monotonic()
+
+
+@contextmanager
+def replica_reads(user=None):
+    """Route reads in this block to the replica, unless ``user`` wrote recently"""
+    allowed = replica_configured() and not (user is not None and user.is_authenticated and is_sticky(user.id))
+    token = _replica_reads.set(allowed)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def use_replica(view):
+    """Decorator for read-only function views; put it below @api_view so request.user is set"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads(request.user):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def replica_iterator(iterable, user=None):
+    """Keep replica routing for a streaming body, which is consumed after the view returns"""
+    iterator = iter(iterable)
+    while True:
+        with replica_reads(user):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class ReplicaReadMixin:
+    """Serve GET on a generic view from the replica"""
+
+    def get(self, request, *args, **kwargs):
+        with replica_reads(request.user):
+            return super().get(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Inside a transaction the primary holds writes the replica cannot see yet
+        if _replica_reads.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        # A write while serving replica reads: read the rest from the primary
+        _replica_reads.set(False)
+        state = request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same data
+        return True
+
@@ -0,0 +1,50 @@
+"""daphne with permessage-deflate on the WebSockets.
+
+daphne never negotiates WebSocket compression. This launcher takes the
+same arguments and accepts a client's permessage-deflate offer when
+WEBSOCKET_COMPRESSION is on:
+
+    python -m truck_tracking.server -b 0.0.0.0 -p 8000 truck_tracking.asgi:application
+"""
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from daphne import cli, server
+from twisted.internet import reactor
+
+
+def accept_deflate(offers):
+    """Accept the first permessage-deflate offer, compressing with a small window to bound memory per socket"""
+    from django.conf import settings
+
+    window_bits = getattr(settings, 'WEBSOCKET_COMPRESSION_WINDOW_BITS', 12)
+    for offer in offers:
+        if isinstance(offer, PerMessageDeflateOffer):
+            return PerMessageDeflateOfferAccept(
+                offer,
+                # Our side: a smaller window than zlib's default 15 bits
+                window_bits=window_bits,
+                mem_level=max(1, window_bits - 7),
+                # Ask the client to keep its window small too, if it lets us
+                request_max_window_bits=window_bits if offer.accept_max_window_bits else 0,
+            )
+    return None
+
+
+class Server(server.Server):
+    def run(self):
+        # The WebSocket factory is built inside run(); configure it once the reactor starts
+        reactor.callWhenRunning(self.configure_compression)
+        super().run()
+
+    def configure_compression(self):
+        from django.conf import settings
+
+        if getattr(settings, 'WEBSOCKET_COMPRESSION', True):
+            self.ws_factory.setProtocolOptions(perMessageCompressionAccept=accept_deflate)
+
+
+class CommandLineInterface(cli.CommandLineInterface):
+    server_class = Server
+
+
+if __name__ == '__main__':
+    CommandLineInterface.entrypoint()
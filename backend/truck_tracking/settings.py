@@ -54,6 +54,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tracking.middleware.MetricsMiddleware',
+    'tracking.middleware.ProfilingMiddleware',
+    'tracking.middleware.ReplicaStickinessMiddleware',
+    'tracking.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -95,6 +99,19 @@ DATABASES = {
     )
 }   
 
+# Read-only views (history, exports, rollups, dashboards, list endpoints) are
+# served from this replica when set. Under test it mirrors the default
+# database, as a real replica would once caught up.
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.parse(os.environ['REPLICA_DATABASE_URL'])
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['truck_tracking.db_router.ReplicaRouter']
+
+# Users who wrote are read from the primary for this long (seconds); keep it
+# above the replica's usual lag
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', '5'))
+
 
 
 # Password validation
@@ -175,3 +192,38 @@ CHANNEL_LAYERS = {
 
 # Custom User Model
 AUTH_USER_MODEL = 'authentication.CustomUser'
+
+# Offline road graph used to fill in route distances (see build_road_graph)
+ROAD_GRAPH_PATH = os.environ.get('ROAD_GRAPH_PATH', str(BASE_DIR / 'data' / 'road_graph'))
+
+# Rendered map tiles for closed time ranges are kept here across restarts
+TILE_CACHE_DIR = os.environ.get('TILE_CACHE_DIR', str(BASE_DIR / 'data' / 'tile_cache'))
+
+# /metrics is open to these addresses, or to anyone sending this bearer token
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Share of requests profiled at random (admins can also send X-Profile: 1),
+# and how many of the slowest profiles are kept
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_KEEP = 50
+
+# Responses smaller than this (bytes) are sent uncompressed: below about one
+# packet there is nothing to save on the wire
+COMPRESSION_MIN_BYTES = 1024
+
+# Negotiate permessage-deflate on WebSockets (python -m truck_tracking.server);
+# the window size bounds the zlib memory kept per open socket
+WEBSOCKET_COMPRESSION = os.environ.get('WEBSOCKET_COMPRESSION', 'true').lower() == 'true'
+WEBSOCKET_COMPRESSION_WINDOW_BITS = 12
+
+# A truck on an in-progress route that sends no fix for this long (seconds)
+# is reported offline to the admin dashboard; checked once per tick
+HEARTBEAT_OFFLINE_SECONDS = int(os.environ.get('HEARTBEAT_OFFLINE_SECONDS', '120'))
+HEARTBEAT_TICK_SECONDS = 1
+
+# Fixes the ingest worker handles together (see tracking.ingest)
+INGEST_BATCH_SIZE = 200
+
+# Most fixes one location-history request may ask for (``limit``)
+LOCATION_HISTORY_MAX_LIMIT = 1000
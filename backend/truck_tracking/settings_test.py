@@ -0,0 +1,10 @@
+"""Settings for running the test suite: python manage.py test --settings=truck_tracking.settings_test
+
+Adds a replica alias that mirrors the default database, so the replica
+routing is exercised without a second server.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DATABASES.setdefault('replica', dict(DATABASES['default']))
+DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
@@ -16,9 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from tracking.views import metrics_endpoint
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('authentication.urls')),
     path('api/tracking/', include('tracking.urls')),
+    path('metrics', metrics_endpoint, name='metrics'),
 ]
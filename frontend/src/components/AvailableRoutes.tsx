@@ -2,8 +2,13 @@ import React, { useState, useEffect } from 'react';
 import { RouteRequest, RouteBid, Truck } from '../types';
 import { routeRequestAPI, routeBidAPI, truckAPI } from '../services/api';
 
+// Routes fetched per page; further pages follow the `next` cursor
+const ROUTES_PAGE_SIZE = 50;
+
 const AvailableRoutes: React.FC = () => {
   const [availableRoutes, setAvailableRoutes] = useState<RouteRequest[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [myBids, setMyBids] = useState<RouteBid[]>([]);
   const [driverTruck, setDriverTruck] = useState<Truck | null>(null);
   const [selectedRoute, setSelectedRoute] = useState<RouteRequest | null>(null);
@@ -21,8 +26,9 @@ const AvailableRoutes: React.FC = () => {
   const loadAvailableRoutes = async () => {
     try {
       setLoading(true);
-      const response = await routeRequestAPI.getAvailableRoutes();
-      setAvailableRoutes(response.data);
+      const response = await routeRequestAPI.getAvailableRoutes({ page_size: ROUTES_PAGE_SIZE });
+      setAvailableRoutes(response.data.results);
+      setNextCursor(response.data.next);
     } catch (error) {
       console.error('Failed to load available routes:', error);
       setError('Failed to load available routes');
@@ -31,6 +37,22 @@ const AvailableRoutes: React.FC = () => {
     }
   };
 
+  // Load the next page of available routes
+  const loadMoreRoutes = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const response = await routeRequestAPI.getAvailableRoutes({ page_size: ROUTES_PAGE_SIZE, cursor: nextCursor });
+      setAvailableRoutes(previous => [...previous, ...response.data.results]);
+      setNextCursor(response.data.next);
+    } catch (error) {
+      console.error('Failed to load more routes:', error);
+      setError('Failed to load more routes');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Load driver's bids
   const loadMyBids = async () => {
     try {
@@ -273,6 +295,18 @@ const AvailableRoutes: React.FC = () => {
                   )}
                 </div>
               ))}
+
+              {nextCursor && (
+                <div className="text-center">
+                  <button
+                    onClick={loadMoreRoutes}
+                    disabled={loadingMore}
+                    className="bg-white hover:bg-gray-50 border border-gray-300 text-gray-700 px-4 py-2 rounded-lg font-semibold disabled:opacity-50"
+                  >
+                    {loadingMore ? 'Loading...' : 'Load more routes'}
+                  </button>
+                </div>
+              )}
             </div>
           )}
         </div>
@@ -1,6 +1,8 @@
 import React, { useEffect, useRef } from 'react';
 import L from 'leaflet';
+import 'leaflet.vectorgrid';
 import { Location, Truck } from '../types';
+import { API_BASE_URL } from '../services/api';
 
 // Fix for default markers in react-leaflet
 delete (L.Icon.Default.prototype as any)._getIconUrl;
@@ -20,8 +22,13 @@ interface MapProps {
   routePoints?: {start: [number, number], end: [number, number]}[];
   onLocationClick?: (location: Location) => void;
   className?: string;
+  // Draw fleet positions / tracks from server-side vector tiles instead of JSON
+  vectorTiles?: { layers?: string; truckId?: number };
 }
 
+// How often live truck positions in the vector tile layer are refreshed
+const VECTOR_TILE_REFRESH_MS = 15000;
+
 const Map: React.FC<MapProps> = ({
   locations,
   trucks = [],
@@ -32,11 +39,14 @@ const Map: React.FC<MapProps> = ({
   routePoints = [],
   onLocationClick,
   className = 'h-96',
+  vectorTiles,
 }) => {
   const mapRef = useRef<HTMLDivElement>(null);
   const mapInstanceRef = useRef<L.Map | null>(null);
   const markersRef = useRef<L.Marker[]>([]);
   const routeLineRef = useRef<L.Polyline | null>(null);
+  const vectorLayers = vectorTiles?.layers || 'trucks,tracks';
+  const vectorTruckId = vectorTiles?.truckId;
 
   useEffect(() => {
     if (!mapRef.current) return;
@@ -241,6 +251,47 @@ const Map: React.FC<MapProps> = ({
     }, 100);
   }, [locations, showRoute, onLocationClick, center, zoom]);
 
+  // Server-rendered vector tiles: only the visible tiles are fetched, at the detail of the current zoom
+  useEffect(() => {
+    const map = mapInstanceRef.current;
+    if (!map || !vectorTiles) return;
+
+    const params = new URLSearchParams({ layers: vectorLayers });
+    if (vectorTruckId) params.set('truck', String(vectorTruckId));
+    const layer = (L as any).vectorGrid.protobuf(`${API_BASE_URL}/tracking/tiles/{z}/{x}/{y}.mvt?${params}`, {
+      fetchOptions: {
+        headers: { Authorization: `Bearer ${localStorage.getItem('access_token')}` },
+      },
+      vectorTileLayerStyles: {
+        trucks: { radius: 6, fill: true, fillColor: '#1e40af', fillOpacity: 0.9, color: 'white', weight: 2 },
+        tracks: { color: '#3b82f6', weight: 3, opacity: 0.7 },
+      },
+      interactive: true,
+      getFeatureId: (feature: any) => feature.properties.truck_id,
+    }).addTo(map);
+
+    layer.on('click', (e: any) => {
+      const properties = e.layer.properties;
+      if (!properties.truck_number) return;
+      L.popup()
+        .setLatLng(e.latlng)
+        .setContent(`
+          <div style="font-size: 12px;">
+            <strong>${properties.truck_number}</strong><br/>
+            <strong>Status:</strong> ${properties.status}<br/>
+            <strong>Last seen:</strong> ${properties.last_location_at ? new Date(properties.last_location_at).toLocaleString() : 'Unknown'}
+          </div>
+        `)
+        .openOn(map);
+    });
+
+    const refresh = setInterval(() => layer.redraw(), VECTOR_TILE_REFRESH_MS);
+    return () => {
+      clearInterval(refresh);
+      layer.remove();
+    };
+  }, [center, zoom, vectorLayers, vectorTruckId]);
+
   // Add resize effect when component mounts
   useEffect(() => {
     const resizeMap = () => {
@@ -262,7 +313,7 @@ const Map: React.FC<MapProps> = ({
         className={className}
         style={{ minHeight: '400px', width: '100%' }}
       />
-      {locations.length === 0 && (
+      {locations.length === 0 && !vectorTiles && (
         <div className="absolute inset-0 flex items-center justify-center bg-gray-50 rounded-lg">
           <div className="text-center text-gray-600">
             <div className="text-4xl mb-2">🗺️</div>
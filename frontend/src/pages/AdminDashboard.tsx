@@ -3,8 +3,11 @@ import { useAuth } from '../contexts/AuthContext';
 import Map from '../components/Map';
 import RouteManagement from '../components/RouteManagement';
 import { Truck, Location,  User, DashboardData } from '../types';
-import { truckAPI, locationAPI,  authAPI, dashboardAPI } from '../services/api';
-import { AdminDashboardService } from '../services/websocket';
+import { truckAPI, locationAPI,  authAPI, dashboardAPI, decodeLocationColumns } from '../services/api';
+import { AdminDashboardService, FleetEventStream } from '../services/websocket';
+
+// Fixes kept for the selected truck's track
+const TRACK_LENGTH = 20;
 
 const AdminDashboard: React.FC = () => {
   const { logout } = useAuth();
@@ -14,7 +17,7 @@ const AdminDashboard: React.FC = () => {
   const [drivers, setDrivers] = useState<User[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
-  const [wsService, setWsService] = useState<AdminDashboardService | null>(null);
+  const [wsService, setWsService] = useState<AdminDashboardService | FleetEventStream | null>(null);
   const [activeTab, setActiveTab] = useState<'dashboard' | 'routes'>('dashboard');
   const [showCreateTruckModal, setShowCreateTruckModal] = useState(false);
   const [newTruck, setNewTruck] = useState({
@@ -31,6 +34,8 @@ const AdminDashboard: React.FC = () => {
   const loadDashboardDataRef = useRef<() => Promise<void>>();
   const loadTruckLocationsRef = useRef<(truck: Truck) => Promise<void>>();
   const selectedTruckRef = useRef<Truck | null>(null);
+  // Newest location id held for the selected truck, so reloads fetch only what is new
+  const locationCursorRef = useRef<{ truckId: number; cursor: number | null } | null>(null);
 
   // Load dashboard data
   const loadDashboardData = useCallback(async () => {
@@ -56,8 +61,22 @@ const AdminDashboard: React.FC = () => {
   // Load truck locations
   const loadTruckLocations = useCallback(async (truck: Truck) => {
     try {
-      const response = await locationAPI.getTruckLocationHistory(truck.id, 20);
-      setSelectedTruckLocations(response.data.locations);
+      const held = locationCursorRef.current;
+      const after = held && held.truckId === truck.id ? held.cursor : null;
+      let response = await locationAPI.getTruckLocationColumns(truck.id, after, TRACK_LENGTH);
+      if (after && response.data.more) {
+        // Too far behind to catch up incrementally; start again from the latest fixes
+        response = await locationAPI.getTruckLocationColumns(truck.id, null, TRACK_LENGTH);
+      }
+      const incremental = Boolean(after) && !response.data.more;
+      const latest = decodeLocationColumns(response.data, truck);
+      locationCursorRef.current = { truckId: truck.id, cursor: response.data.cursor };
+      setSelectedTruckLocations(previous => {
+        if (!incremental) return latest;
+        // Overlapping reloads (poll and WebSocket) can deliver the same fixes twice
+        const oldest = latest.length ? latest[latest.length - 1].id : Infinity;
+        return [...latest, ...previous.filter(location => location.id < oldest)].slice(0, TRACK_LENGTH);
+      });
       setSelectedTruck(truck);
     } catch (error) {
       console.error('Failed to load truck locations:', error);
@@ -112,30 +131,40 @@ const AdminDashboard: React.FC = () => {
 
   // Initialize WebSocket connection (optional)
   useEffect(() => {
-    let localService: AdminDashboardService | null = null;
+    let localService: AdminDashboardService | FleetEventStream | null = null;
+
+    const handleMessage = (data: any) => {
+      // resync: the event stream missed too much to replay, so reload everything
+      if (data.type === 'location_update' || data.type === 'resync') {
+        // Update real-time location data without capturing stale variables
+        loadDashboardDataRef.current?.();
+        const currentTruck = selectedTruckRef.current;
+        if (currentTruck) {
+          loadTruckLocationsRef.current?.(currentTruck);
+        }
+      }
+    };
 
     const initWebSocket = async () => {
       try {
         const service = new AdminDashboardService();
         await service.connect();
         localService = service;
-
-        service.onMessage((data) => {
-          if (data.type === 'location_update') {
-            // Update real-time location data without capturing stale variables
-            loadDashboardDataRef.current?.();
-            const currentTruck = selectedTruckRef.current;
-            if (currentTruck) {
-              loadTruckLocationsRef.current?.(currentTruck);
-            }
-          }
-        });
-
+        service.onMessage(handleMessage);
         setWsService(service);
         console.log('WebSocket connected for real-time admin updates');
       } catch (error) {
-        console.warn('WebSocket connection failed, using REST API only:', error);
-        // Continue without WebSocket - admin dashboard will work with REST API polling
+        console.warn('WebSocket connection failed, falling back to Server-Sent Events:', error);
+        try {
+          const stream = new FleetEventStream();
+          await stream.connect();
+          localService = stream;
+          stream.onMessage(handleMessage);
+          setWsService(stream);
+        } catch (streamError) {
+          console.warn('Event stream failed, using REST API only:', streamError);
+          // Continue without live updates - admin dashboard will work with REST API polling
+        }
       }
     };
 
@@ -428,9 +457,9 @@ const AdminDashboard: React.FC = () => {
               </div>
               <div className="h-96 bg-gray-100 rounded-lg border">
                 <Map
-                  locations={selectedTruckLocations}
-                  showRoute={true}
+                  locations={selectedTruckLocations.slice(0, 1)}
                   showTruckIcons={true}
+                  vectorTiles={{ truckId: selectedTruck?.id }}
                   className="h-full w-full rounded-lg"
                 />
               </div>
@@ -4,7 +4,7 @@ import Map from '../components/Map';
 import AvailableRoutes from '../components/AvailableRoutes';
 import { Truck, Location, DeliveryRoute } from '../types';
 import { truckAPI, locationAPI, routeAPI } from '../services/api';
-import { LocationTrackingService } from '../services/websocket';
+import { LocationTrackingService, TruckEventStream } from '../services/websocket';
 
 const DriverDashboard: React.FC = () => {
   const { user, logout } = useAuth();
@@ -16,6 +16,7 @@ const DriverDashboard: React.FC = () => {
   const [error, setError] = useState('');
   const [locationService, setLocationService] = useState<LocationTrackingService | null>(null);
   const [activeTab, setActiveTab] = useState<'dashboard' | 'routes'>('dashboard');
+  const [eventStream, setEventStream] = useState<TruckEventStream | null>(null);
 
   // Get user's current position
   const getCurrentPosition = useCallback((): Promise<GeolocationPosition> => {
@@ -91,8 +92,25 @@ const DriverDashboard: React.FC = () => {
         setLocationService(service);
         console.log('WebSocket connected for real-time updates');
       } catch (wsError) {
-        console.warn('WebSocket connection failed, using REST API only:', wsError);
-        // Continue without WebSocket - use REST API only
+        console.warn('WebSocket connection failed, falling back to Server-Sent Events:', wsError);
+        // Fixes are still sent over REST; the event stream keeps the map live
+        try {
+          const stream = new TruckEventStream(truck.id);
+          await stream.connect();
+          stream.onMessage((data) => {
+            if (data.type === 'location_update') {
+              setLocations(prev => [data.location, ...prev.filter(l => l.id !== data.location.id)].slice(0, 20));
+            } else if (data.type === 'resync') {
+              // Too many fixes missed to replay: reload the recent ones
+              locationAPI.getLocations(truck.id)
+                .then(response => setLocations(response.data.slice(0, 20)))
+                .catch(error => console.warn('Failed to reload locations:', error));
+            }
+          });
+          setEventStream(stream);
+        } catch (streamError) {
+          console.warn('Event stream failed, using REST API only:', streamError);
+        }
       }
 
       // Set up periodic location updates (every 5 seconds)
@@ -129,6 +147,11 @@ const DriverDashboard: React.FC = () => {
       setLocationService(null);
     }
     
+    if (eventStream) {
+      eventStream.disconnect();
+      setEventStream(null);
+    }
+    
     // Also clear interval if stored globally
     if ((window as any).trackingIntervalId) {
       clearInterval((window as any).trackingIntervalId);
@@ -136,7 +159,7 @@ const DriverDashboard: React.FC = () => {
     }
     
     setIsTracking(false);
-  }, [locationService]);
+  }, [locationService, eventStream]);
 
   // Start route
   // const startRoute = async (routeId: number) => {
@@ -3,6 +3,7 @@ import {
   User, 
   Truck, 
   Location, 
+  LocationColumns,
   DeliveryRoute, 
   RouteRequest,
   RouteBid,
@@ -12,7 +13,7 @@ import {
   DashboardData 
 } from '../types';
 
-const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000/api';
+export const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000/api';
 
 const api = axios.create({
   baseURL: API_BASE_URL,
@@ -134,6 +135,33 @@ export const locationAPI = {
     api.get(`/tracking/trucks/${truckId}/location-history/`, { 
       params: limit ? { limit } : {} 
     }),
+  
+  // Only the fixes recorded after location id `after` (the latest ones when omitted), as parallel arrays
+  getTruckLocationColumns: (truckId: number, after?: number | null, limit?: number): Promise<AxiosResponse<LocationColumns>> =>
+    api.get(`/tracking/trucks/${truckId}/location-history/`, {
+      params: { layout: 'columnar', ...(after ? { after } : {}), ...(limit ? { limit } : {}) }
+    }),
+};
+
+// Expand columnar history into Location objects, newest first like the list layout;
+// the columns leave out the driver, which is taken from the truck
+export const decodeLocationColumns = (columns: LocationColumns, truck?: Truck): Location[] => {
+  const locations: Location[] = [];
+  for (let i = columns.ids.length - 1; i >= 0; i--) {
+    locations.push({
+      id: columns.ids[i],
+      truck: columns.truck_id,
+      driver: truck?.driver ?? 0,
+      driver_details: truck?.driver_details,
+      latitude: String(columns.lat[i]),
+      longitude: String(columns.lng[i]),
+      speed: columns.speed[i],
+      heading: columns.heading[i],
+      accuracy: 0,
+      timestamp: new Date(columns.ts[i]).toISOString(),
+    });
+  }
+  return locations;
 };
 
 // Route API
@@ -183,8 +211,15 @@ export const routeRequestAPI = {
   deleteRouteRequest: (id: number): Promise<AxiosResponse<void>> =>
     api.delete(`/tracking/route-requests/${id}/`),
   
-  getAvailableRoutes: (): Promise<AxiosResponse<RouteRequest[]>> =>
-    api.get('/tracking/available-routes/'),
+  getAvailableRoutes: (params?: {
+    cursor?: string;
+    page_size?: number;
+    ordering?: 'newest' | 'distance';
+  }): Promise<AxiosResponse<{
+    next: string | null;
+    results: RouteRequest[];
+  }>> =>
+    api.get('/tracking/available-routes/', { params: params || {} }),
     
   getRouteBids: (routeRequestId: number): Promise<AxiosResponse<RouteBid[]>> =>
     api.get(`/tracking/route-requests/${routeRequestId}/bids/`),
@@ -1,3 +1,5 @@
+import { API_BASE_URL } from './api';
+
 export class WebSocketService {
   private ws: WebSocket | null = null;
   private reconnectAttempts = 0;
@@ -111,3 +113,72 @@ export class AdminDashboardService extends WebSocketService {
     super(wsUrl);
   }
 }
+
+// Server-Sent Events fallback for networks where WebSockets are blocked. One
+// long-lived HTTP response per client; EventSource reconnects by itself and
+// sends Last-Event-ID so the server replays anything missed in between, or
+// sends a 'resync' event when too much was missed and state must be reloaded.
+export class EventStreamService {
+  private source: EventSource | null = null;
+
+  constructor(private url: string, private eventTypes: string[]) {}
+
+  connect(): Promise<void> {
+    return new Promise((resolve, reject) => {
+      this.source = new EventSource(this.url);
+
+      this.source.onopen = () => {
+        console.log('Event stream connected');
+        resolve();
+      };
+
+      this.source.onerror = (error) => {
+        // CLOSED means the server refused the stream; otherwise EventSource is retrying
+        if (this.source?.readyState === EventSource.CLOSED) {
+          console.error('Event stream error:', error);
+          reject(error);
+        }
+      };
+    });
+  }
+
+  disconnect(): void {
+    if (this.source) {
+      this.source.close();
+      this.source = null;
+    }
+  }
+
+  onMessage(callback: (data: any) => void): void {
+    this.eventTypes.forEach((eventType) => {
+      this.source?.addEventListener(eventType, (event) => {
+        try {
+          callback(JSON.parse((event as MessageEvent).data));
+        } catch (error) {
+          console.error('Error parsing event stream message:', error);
+        }
+      });
+    });
+  }
+}
+
+export class TruckEventStream extends EventStreamService {
+  constructor(truckId: number) {
+    const token = localStorage.getItem('access_token');
+    super(`${API_BASE_URL}/tracking/trucks/${truckId}/events/?token=${token}`, ['location_update', 'resync']);
+  }
+}
+
+export class FleetEventStream extends EventStreamService {
+  constructor() {
+    const token = localStorage.getItem('access_token');
+    super(`${API_BASE_URL}/tracking/fleet/events/?token=${token}`, [
+      'location_update',
+      'truck_status_update',
+      'route_progress_update',
+      'geofence_event',
+      'heartbeat_event',
+      'resync',
+    ]);
+  }
+}
@@ -36,6 +36,20 @@ export interface Location {
   timestamp: string;
 }
 
+// Location history with layout=columnar: one array per field, oldest fix first
+export interface LocationColumns {
+  truck_id: number;
+  cursor: number | null;
+  more: boolean;
+  layout: 'columnar';
+  ids: number[];
+  ts: number[];  // epoch milliseconds
+  lat: number[];
+  lng: number[];
+  speed: number[];
+  heading: number[];
+}
+
 export interface DeliveryRoute {
   id: number;
   truck: number;
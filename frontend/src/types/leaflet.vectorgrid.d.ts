@@ -0,0 +1,2 @@
+// leaflet.vectorgrid ships without type definitions; it adds L.vectorGrid
+declare module 'leaflet.vectorgrid';